@@ -0,0 +1,226 @@
+import argparse
+import errno
+import json
+import os
+import shutil
+import threading
+import time
+
+# hashlib and tarfile are imported where a file is digested or an archive opened, so the
+# command line and the GUI can read BACKUP_MODES without loading them
+
+# 'folder' mirrors every original into the backup folder as a loose file, 'store' keeps one
+# blob per distinct content across all runs, 'archive' streams each run into one .tar.gz
+BACKUP_MODES = ['folder', 'store', 'archive']
+DEFAULT_BACKUP_MODE = 'folder'
+
+OBJECTS_FOLDER = "objects"
+RUNS_FOLDER = "runs"
+INDEX_VERSION = 1
+
+
+def move_file(src, dst):
+    try:
+        # Same filesystem: a single atomic rename, no data is copied
+        os.replace(src, dst)
+        return
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    # Across devices: copy beside the destination, rename it into place, then drop the original
+    temp_path = f"{dst}.tmp"
+    shutil.copy2(src, temp_path)
+    os.replace(temp_path, dst)
+    os.remove(src)
+
+
+def file_digest(path):
+    import hashlib
+    with open(path, "rb") as file:
+        return hashlib.file_digest(file, "sha256").hexdigest()
+
+
+def new_run_name():
+    """Name of a new run, in the order the runs started. The microseconds and the process id keep
+    two runs started in the same second from writing to the same archive and index."""
+    now = time.time()
+    return f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}-{int(now % 1 * 1000000):06d}-{os.getpid()}"
+
+
+def run_index_path(backup_folder, run_name):
+    return os.path.join(backup_folder, RUNS_FOLDER, f"{run_name}.json")
+
+
+class ContentStore:
+    """Content-addressed backup: each distinct file is stored once as objects/<sha256>, whichever
+    run or directory it came from, and every run writes an index of original path -> digest."""
+
+    def __init__(self, backup_folder, run_name=None):
+        self.backup_folder = backup_folder
+        self.run_name = run_name or new_run_name()
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def blob_path(self, digest):
+        return os.path.join(self.backup_folder, OBJECTS_FOLDER, digest[:2], digest)
+
+    def add(self, path, relative_path):
+        """Stores path under relative_path and removes the original."""
+        digest = file_digest(path)
+        size = os.path.getsize(path)
+        blob_path = self.blob_path(digest)
+        if os.path.isfile(blob_path):
+            os.remove(path)
+        else:
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            move_file(path, blob_path)
+        with self.lock:
+            self.entries[relative_path.replace("\\", "/")] = {"sha256": digest, "size": size}
+
+    def close(self):
+        # A run that backed up nothing leaves no index behind
+        if self.entries:
+            write_run_index(self.backup_folder, self.run_name, {"mode": "store", "files": self.entries})
+
+
+class ArchiveBackup:
+    """Streams every original of one run into a single backup-<run>.tar.gz.
+
+    Files with the same content are stored once and repeated as hard link members. Originals are
+    only removed once the archive is complete on disk.
+    """
+
+    def __init__(self, backup_folder, run_name=None):
+        self.backup_folder = backup_folder
+        self.run_name = run_name or new_run_name()
+        self.archive_name = f"backup-{self.run_name}.tar.gz"
+        self.archive_path = os.path.join(backup_folder, self.archive_name)
+        # Opened by the first file backed up, so a run that backs up nothing writes no archive
+        self.archive = None
+        self.members = {}
+        self.entries = {}
+        self.originals = []
+        self.lock = threading.Lock()
+
+    def add(self, path, relative_path):
+        digest = file_digest(path)
+        member_name = relative_path.replace("\\", "/")
+        import tarfile
+        with self.lock:
+            if self.archive is None:
+                os.makedirs(self.backup_folder, exist_ok=True)
+                self.archive = tarfile.open(f"{self.archive_path}.tmp", "w|gz")
+            first_member = self.members.get(digest)
+            if first_member is None:
+                self.archive.add(path, member_name, recursive=False)
+                self.members[digest] = member_name
+            else:
+                link = tarfile.TarInfo(member_name)
+                link.type = tarfile.LNKTYPE
+                link.linkname = first_member
+                self.archive.addfile(link)
+            self.entries[member_name] = {"sha256": digest, "size": os.path.getsize(path)}
+            self.originals.append(path)
+
+    def close(self):
+        with self.lock:
+            if self.archive is None:
+                return
+            self.archive.close()
+            os.replace(f"{self.archive_path}.tmp", self.archive_path)
+            write_run_index(self.backup_folder, self.run_name, {"mode": "archive", "archive": self.archive_name, "files": self.entries})
+            for path in self.originals:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+
+def open_backup(mode, backup_folder, run_name=None):
+    """The store or archive a run backs up into, or None for the loose 'folder' mode."""
+    if mode == 'store':
+        return ContentStore(backup_folder, run_name)
+    if mode == 'archive':
+        return ArchiveBackup(backup_folder, run_name)
+    if mode != 'folder':
+        raise ValueError(f"Unsupported backup mode: {mode}")
+    return None
+
+
+def write_run_index(backup_folder, run_name, data):
+    path = run_index_path(backup_folder, run_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    data = dict(data, version=INDEX_VERSION, run=run_name)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as file:
+        json.dump(data, file, indent=1)
+    os.replace(temp_path, path)
+
+
+def load_run_index(backup_folder, run_name):
+    with open(run_index_path(backup_folder, run_name), "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def list_runs(backup_folder):
+    runs_folder = os.path.join(backup_folder, RUNS_FOLDER)
+    if not os.path.isdir(runs_folder):
+        return []
+    return sorted(name[:-5] for name in os.listdir(runs_folder) if name.endswith(".json"))
+
+
+def restore_path(target_folder, relative_path):
+    destination = os.path.abspath(os.path.join(target_folder, relative_path))
+    if not destination.startswith(os.path.join(target_folder, "")):
+        raise ValueError(f"Refusing to restore outside the target folder: {relative_path}")
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    return destination
+
+
+def restore_run(backup_folder, run_name, target_folder):
+    """Writes every original of a run back under target_folder and returns how many were restored."""
+    index = load_run_index(backup_folder, run_name)
+    target_folder = os.path.abspath(target_folder)
+    restored = 0
+
+    if index["mode"] == "archive":
+        import tarfile
+        # One sequential pass over the compressed stream
+        with tarfile.open(os.path.join(backup_folder, index["archive"]), "r|gz") as archive:
+            for member in archive:
+                if member.islnk():
+                    # Duplicates come back as copies of the member they link to, not as hard links
+                    shutil.copy2(restore_path(target_folder, member.linkname), restore_path(target_folder, member.name))
+                else:
+                    archive.extract(member, target_folder, filter="data")
+                restored += 1
+        return restored
+
+    store = ContentStore(backup_folder, run_name)
+    for relative_path, entry in index["files"].items():
+        shutil.copy2(store.blob_path(entry["sha256"]), restore_path(target_folder, relative_path))
+        restored += 1
+    return restored
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List and restore the backup runs of a backup folder.")
+    parser.add_argument("backup_folder", help="backup folder a conversion wrote its store or archives to")
+    parser.add_argument("--restore", metavar="RUN", help="run to restore, see the list printed without it")
+    parser.add_argument("--target", help="folder to restore into, required with --restore")
+    args = parser.parse_args()
+
+    if not args.restore:
+        for run_name in list_runs(args.backup_folder):
+            index = load_run_index(args.backup_folder, run_name)
+            print(f"{run_name}  {index['mode']:>7}  {len(index['files'])} files")
+        return
+
+    if not args.target:
+        parser.error("--restore needs --target")
+    restored = restore_run(args.backup_folder, args.restore, args.target)
+    print(f"Restored {restored} files into {args.target}")
+
+
+if __name__ == "__main__":
+    main()
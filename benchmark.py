@@ -0,0 +1,592 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import numpy as np
+from keyvalues import load_vmt
+from synthetic_tree import VTF_IMAGE_FORMATS, VTF_PIXEL_LAYOUTS, add_tree_arguments, generate_tree, pack_vpk, tree_arguments, vtf_bytes, vtf_level
+from texture_kernels import BUMP_BASIS_TRANSPOSE, derive_gray_maps, ssbump_to_normal_and_height
+
+DEFAULT_SSBUMP_SIZES = [512, 2048, 4096]
+REFERENCE_SAMPLE_ROWS = 8
+DEFAULT_VMT_COUNT = 40000
+BENCHMARKS = ["ssbump", "keyvalues", "stages", "graymaps", "encoders", "dds", "vtf", "vpk"]
+ENCODER_FORMATS = ["png", "tga", "jpg", "bmp", "dds"]
+# Map of the synthetic_maps pair each DDS block format is timed on
+DDS_BENCH_MAPS = {"BC1": "normal", "BC4": "roughness", "BC5": "normal"}
+# Operations of the graymaps benchmark, timed with the first 1, 2, ... of them requested
+GRAY_MAP_OPERATIONS = ["invert", "autocontrast", "equalize", "rgb"]
+STAGES = ["scan", "parse", "resolve", "ssbump", "roughness", "emit", "backup"]
+
+SAMPLE_VMT = """"LightmappedGeneric"
+{
+	"$basetexture" "brick/wall{index}"
+	"$bumpmap" "brick/wall{index}_height-ssbump" // ssbump
+	"$ssbump" "1"
+	"$surfaceprop" "brick"
+	"$envmap" "env_cubemap" [$WIN32]
+	">=dx90" { "$detail" "detail/noise" "$detailscale" "4" }
+	"Proxies"
+	{
+		"TextureScroll" { "texturescrollvar" "$basetexturetransform" "texturescrollrate" "0.1" }
+	}
+}
+"""
+# Most VMTs are one block of quoted pairs, without comments, conditionals or nested blocks
+FLAT_SAMPLE_VMT = """"LightmappedGeneric"
+{
+	"$basetexture" "brick/wall{index}"
+	"$bumpmap" "brick/wall{index}_normal"
+	"$surfaceprop" "brick"
+	"$envmap" "env_cubemap"
+	"$envmaptint" "[.2 .2 .2]"
+}
+"""
+
+
+def reference_ssbump_rows(pixels):
+    """The per-pixel loop the converters used before texture_kernels, kept to compare against."""
+    pixels = pixels.astype(np.float32) / 255.0
+    height, width = pixels.shape[:2]
+    basis = BUMP_BASIS_TRANSPOSE.tolist()
+
+    normal_image = np.zeros((height, width, 3), dtype=np.float32)
+    height_image = np.zeros((height, width), dtype=np.float32)
+
+    for y in range(height):
+        for x in range(width):
+            pixel = pixels[y, x]
+            normal_image[y, x, 0] = np.dot(pixel, basis[0]) * 0.5 + 0.5
+            normal_image[y, x, 1] = np.dot(pixel, basis[1]) * 0.5 + 0.5
+            normal_image[y, x, 2] = np.dot(pixel, basis[2]) * 0.5 + 0.5
+            height_image[y, x] = 1.0 - pixel[0]
+
+    return (normal_image * 255).astype(np.uint8), (height_image * 255).astype(np.uint8)
+
+
+def best_time(func, repeats):
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def bench_ssbump(sizes, sample_rows=REFERENCE_SAMPLE_ROWS, repeats=3, seed=0):
+    """Times the ssbump kernel against the old loop, which is run on a few rows and extrapolated."""
+    rng = np.random.default_rng(seed)
+    results = []
+
+    for size in sizes:
+        pixels = rng.integers(0, 256, (size, size, 3), dtype=np.uint8)
+        kernel_time = best_time(lambda: ssbump_to_normal_and_height(pixels), repeats)
+
+        sample = pixels[:sample_rows]
+        start = time.perf_counter()
+        expected_normal, expected_height = reference_ssbump_rows(sample)
+        reference_time = (time.perf_counter() - start) * size / sample_rows
+
+        normal, height = ssbump_to_normal_and_height(sample)
+        identical = np.array_equal(normal, expected_normal) and np.array_equal(height, expected_height)
+
+        results.append({
+            "size": size,
+            "kernel_seconds": kernel_time,
+            "reference_seconds": reference_time,
+            "speedup": reference_time / kernel_time,
+            "identical": identical,
+        })
+    return results
+
+
+def reference_gray_maps(path, operations):
+    """The old way: one decode and grayscale conversion per requested map."""
+    from PIL import Image, ImageOps
+    reference_operations = {"invert": ImageOps.invert, "autocontrast": ImageOps.autocontrast, "equalize": ImageOps.equalize}
+    maps = {}
+    for operation in operations:
+        gray = Image.open(path).convert('L')
+        maps[operation] = Image.fromarray(np.dstack((gray, gray, gray))) if operation == "rgb" else reference_operations[operation](gray)
+    return maps
+
+
+def encode_maps(maps):
+    import io
+    for image in maps.values():
+        image.save(io.BytesIO(), format="TGA")
+
+
+def bench_gray_maps(size, repeats=3, seed=0):
+    """Times decoding a texture, deriving 1 to 4 maps from it and encoding them, against one decode per map."""
+    from PIL import Image
+    rng = np.random.default_rng(seed)
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "texture.png")
+        Image.fromarray(rng.integers(0, 256, (size, size, 3), dtype=np.uint8)).save(path)
+
+        def derive(operations):
+            with Image.open(path) as image:
+                encode_maps(derive_gray_maps(image, operations))
+
+        for count in range(1, len(GRAY_MAP_OPERATIONS) + 1):
+            operations = GRAY_MAP_OPERATIONS[:count]
+            derive_time = best_time(lambda: derive(operations), repeats)
+            reference_time = best_time(lambda: encode_maps(reference_gray_maps(path, operations)), repeats)
+            results.append({
+                "size": size,
+                "outputs": count,
+                "seconds": derive_time,
+                "reference_seconds": reference_time,
+                "speedup": reference_time / derive_time,
+            })
+    return results
+
+
+def print_gray_map_results(results):
+    print(f"{'outputs':>7}  {'one decode':>10}  {'per map':>9}  {'speedup':>7}")
+    for result in results:
+        print(f"{result['outputs']:>7}  {result['seconds']:>9.3f}s  {result['reference_seconds']:>8.3f}s  {result['speedup']:>6.1f}x")
+
+
+def synthetic_maps(size, seed=0):
+    """A normal ('RGB') and a roughness ('L') map with smooth detail, compressible like real textures are."""
+    from PIL import Image
+    rng = np.random.default_rng(seed)
+    coarse = Image.fromarray(rng.integers(0, 256, (size // 32, size // 32, 3), dtype=np.uint8)).resize((size, size), Image.BICUBIC)
+    grain = rng.integers(0, 8, (size, size, 3), dtype=np.uint8)
+    normal = Image.fromarray(np.asarray(coarse) // 2 + grain + 64)
+    return {"normal": normal, "roughness": normal.convert('L')}
+
+
+def bench_encoders(size, repeats=3):
+    """Encode throughput and output size of every encoder profile and output format."""
+    import io
+    from PIL import Image
+    from dds_encoder import encode_dds
+    from encoder_profiles import ENCODER_PROFILES, encoder_options
+    maps = synthetic_maps(size)
+    results = []
+    for profile in ENCODER_PROFILES:
+        for texture_format in ENCODER_FORMATS:
+            image_format = Image.registered_extensions()["." + texture_format]
+            options = encoder_options(profile, image_format)
+            raw_bytes = sum(len(image.getbands()) * size * size for image in maps.values())
+            encoded_bytes = [0]
+
+            def encode():
+                encoded_bytes[0] = 0
+                for name, image in maps.items():
+                    buffer = io.BytesIO()
+                    if image_format == "DDS":
+                        buffer.write(encode_dds(image, "BC5" if name == "normal" else None, **options))
+                    else:
+                        image.save(buffer, format=image_format, **options)
+                    encoded_bytes[0] += buffer.tell()
+
+            seconds = best_time(encode, repeats)
+            results.append({
+                "profile": profile,
+                "format": texture_format,
+                "seconds": seconds,
+                "mb_per_second": raw_bytes / 1e6 / seconds,
+                "bytes": encoded_bytes[0],
+                "ratio": encoded_bytes[0] / raw_bytes,
+            })
+    return results
+
+
+def print_encoder_results(results):
+    print(f"{'profile':>9}  {'format':>6}  {'time':>8}  {'MB/s':>7}  {'size':>9}  {'of raw':>6}")
+    for result in results:
+        print(f"{result['profile']:>9}  {result['format']:>6}  {result['seconds']:>7.3f}s  {result['mb_per_second']:>7.1f}  "
+              f"{result['bytes'] / 1e6:>7.2f}MB  {result['ratio']:>6.0%}")
+
+
+def bench_dds(size, repeats=3):
+    """Times the BCn encoder on the synthetic maps and measures its error against the source.
+
+    The files are read back with Pillow, so the error is what a decoder sees. BC4 and BC5 store
+    every pixel within 1/14 of its block's range (plus rounding) of the source; within_bound checks that.
+    """
+    import io
+    from PIL import Image
+    from dds_encoder import encode_dds, image_blocks
+    maps = synthetic_maps(size)
+    results = []
+    for block_format, name in DDS_BENCH_MAPS.items():
+        image = maps[name]
+        data = [None]
+
+        def encode():
+            data[0] = encode_dds(image, block_format)
+
+        seconds = best_time(encode, repeats)
+        decoded = Image.open(io.BytesIO(data[0]))
+        channels = {"BC1": 3, "BC4": 1, "BC5": 2}[block_format]
+        source = np.asarray(image).reshape(size, size, -1)[:, :, :channels].astype(np.int16)
+        result = np.asarray(decoded).reshape(size, size, -1)[:, :, :channels].astype(np.int16)
+        error = np.abs(source - result)
+        within_bound = None
+        if block_format != "BC1":
+            source_blocks = image_blocks(source.astype(np.uint8)).astype(np.float32)
+            block_range = source_blocks.max(axis=1) - source_blocks.min(axis=1)
+            within_bound = bool((image_blocks(error.astype(np.uint8)).max(axis=1) <= block_range / 14 + 1).all())
+        results.append({
+            "format": block_format,
+            "size": size,
+            "seconds": seconds,
+            "megapixels_per_second": size * size / 1e6 / seconds,
+            "bytes": len(data[0]),
+            "max_error": int(error.max()),
+            "rmse": float(np.sqrt((error.astype(np.float64) ** 2).mean())),
+            "within_bound": within_bound,
+        })
+    return results
+
+
+def print_dds_results(results):
+    print(f"{'format':>6}  {'time':>8}  {'MP/s':>6}  {'size':>9}  {'max err':>7}  {'rmse':>6}  within bound")
+    for result in results:
+        within_bound = "-" if result["within_bound"] is None else result["within_bound"]
+        print(f"{result['format']:>6}  {result['seconds']:>7.3f}s  {result['megapixels_per_second']:>6.1f}  "
+              f"{result['bytes'] / 1e6:>7.2f}MB  {result['max_error']:>7}  {result['rmse']:>6.2f}  {within_bound}")
+    print("Sizes include the mip chain")
+
+
+def bench_vtf(size, repeats=3):
+    """Times reading the top mip of a VTF in every synthetic VTF format, against Pillow loading the same
+    pixels from a TGA. The DXT decodes are compared with Pillow's decoder of the same blocks in a DDS file."""
+    import io
+    from PIL import Image
+    from dds_encoder import dds_header
+    from vtf_reader import read_vtf
+    image = synthetic_maps(size)["normal"].convert("RGBA")
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        tga_path = os.path.join(folder, "texture.tga")
+        image.save(tga_path)
+
+        def load_tga():
+            with Image.open(tga_path) as img:
+                img.load()
+
+        tga_seconds = best_time(load_tga, repeats)
+        for image_format in VTF_IMAGE_FORMATS:
+            vtf_path = os.path.join(folder, f"texture_{image_format}.vtf")
+            with open(vtf_path, "wb") as file:
+                file.write(vtf_bytes(image, image_format))
+            decoded = [None]
+
+            def load_vtf():
+                decoded[0] = read_vtf(vtf_path)
+
+            seconds = best_time(load_vtf, repeats)
+            if image_format in VTF_PIXEL_LAYOUTS:
+                reference = image
+            else:
+                header = bytearray(dds_header(size, size, "BC1", 1))
+                header[84:88] = image_format.encode()
+                reference = Image.open(io.BytesIO(bytes(header) + vtf_level(image, image_format)))
+            matches = np.array_equal(np.asarray(decoded[0]), np.asarray(reference.convert(decoded[0].mode)))
+            results.append({
+                "format": image_format,
+                "size": size,
+                "seconds": seconds,
+                "megapixels_per_second": size * size / 1e6 / seconds,
+                "tga_seconds": tga_seconds,
+                "bytes": os.path.getsize(vtf_path),
+                "matches_pillow": bool(matches),
+            })
+    return results
+
+
+def print_vtf_results(results):
+    print(f"{'format':>8}  {'time':>8}  {'MP/s':>6}  {'TGA load':>8}  {'size':>9}  matches Pillow")
+    for result in results:
+        print(f"{result['format']:>8}  {result['seconds']:>7.3f}s  {result['megapixels_per_second']:>6.1f}  "
+              f"{result['tga_seconds']:>7.3f}s  {result['bytes'] / 1e6:>7.2f}MB  {result['matches_pillow']}")
+
+
+def bench_vpk(tree_options, repeats=3):
+    """Packs a synthetic tree into a VPK and times indexing it, and reading every file from the mounted VPK
+    and from the loose tree."""
+    import vpk_reader
+    from material_index import MaterialIndex
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        root = os.path.join(folder, "materials")
+        generate_tree(root, **tree_options)
+        dir_path = os.path.join(folder, "pak01_dir.vpk")
+        pack_vpk(root, dir_path)
+
+        start = time.perf_counter()
+        mounted_root = vpk_reader.mount_material_root(dir_path)
+        index = MaterialIndex.scan(mounted_root, vpk_reader.mounted_files(mounted_root))
+        vpk_reader.override_files(mounted_root, index.overridden)
+        seconds = time.perf_counter() - start
+        file_count = sum(len(extensions) for extensions in index.entries.values())
+        results.append(stage_result("index", file_count, os.path.getsize(dir_path), seconds))
+
+        def read_all(paths):
+            for path in paths:
+                with vpk_reader.open_input(path) as file:
+                    file.read()
+
+        try:
+            mounted_paths = [path for extensions in index.entries.values() for path in extensions.values()]
+            seconds = best_time(lambda: read_all(mounted_paths), repeats)
+            results.append(stage_result("read vpk", len(mounted_paths), sum(map(vpk_reader.input_size, mounted_paths)), seconds))
+        finally:
+            vpk_reader.unmount(mounted_root)
+
+        loose_index = MaterialIndex.scan(root)
+        loose_paths = [path for extensions in loose_index.entries.values() for path in extensions.values()]
+        seconds = best_time(lambda: read_all(loose_paths), repeats)
+        results.append(stage_result("read loose", len(loose_paths), file_sizes(loose_paths), seconds))
+    return results
+
+
+def reference_parse_vmt(filepath):
+    """The line-split VMT parser the GUI converter used before keyvalues, kept to compare against."""
+    parameters = {}
+    with open(filepath, "r") as file:
+        lines = file.readlines()
+
+    current_context = parameters
+    context_stack = []
+    for line in lines[1:]:
+        line = line.strip()
+        if line.startswith('//') or not line:
+            continue
+        if line.startswith('{'):
+            context_stack.append(current_context)
+            current_context = {}
+            continue
+        if line.startswith('}'):
+            previous_context = context_stack.pop()
+            previous_context.update(current_context)
+            current_context = previous_context
+            continue
+        if ' ' not in line:
+            current_context[line] = {}
+            continue
+        key, val = line.split(None, 1)
+        current_context[key.strip('"').lower()] = val.split('//')[0].strip().strip('"')
+    return parameters
+
+
+def read_bytes(filepath):
+    with open(filepath, "rb") as file:
+        return file.read()
+
+
+def bench_keyvalues(count=DEFAULT_VMT_COUNT):
+    """Times reading count small VMTs against reading and parsing them, with both parsers, for a
+    flat VMT and one with comments, conditionals and nested blocks."""
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        for sample_name, sample in [("flat", FLAT_SAMPLE_VMT), ("nested", SAMPLE_VMT)]:
+            paths = []
+            for index in range(count):
+                path = os.path.join(folder, f"{sample_name}{index}.vmt")
+                with open(path, "w") as file:
+                    file.write(sample.replace("{index}", str(index)))
+                paths.append(path)
+
+            for name, parse in [("read only", read_bytes), ("keyvalues", load_vmt), ("line parser", reference_parse_vmt)]:
+                start = time.perf_counter()
+                for path in paths:
+                    parse(path)
+                results.append({"sample": sample_name, "parser": name, "files": count, "seconds": time.perf_counter() - start})
+    return results
+
+
+def print_keyvalues_results(results):
+    read_seconds = {result["sample"]: result["seconds"] for result in results if result["parser"] == "read only"}
+    print(f"{'sample':>6}  {'parser':>11}  {'time':>8}  {'files/s':>9}  vs read")
+    for result in results:
+        print(f"{result['sample']:>6}  {result['parser']:>11}  {result['seconds']:>7.2f}s  {result['files'] / result['seconds']:>9.0f}  "
+              f"{result['seconds'] / read_seconds[result['sample']]:>6.2f}x")
+
+
+def stage_result(stage, files, size, seconds):
+    return {
+        "stage": stage,
+        "files": files,
+        "bytes": size,
+        "seconds": seconds,
+        "files_per_second": files / seconds if seconds else None,
+        "mb_per_second": size / 1e6 / seconds if size and seconds else None,
+    }
+
+
+def file_sizes(paths):
+    return sum(os.path.getsize(path) for path in paths)
+
+
+def bench_stages(tree_options, darkness_value=128, backup_mode="folder"):
+    """Generates a synthetic tree and times each converter stage over it, one stage after the other."""
+    import conversion_engine as engine
+    from backup_store import open_backup
+    from material_index import MaterialIndex
+
+    # VTF trees are converted into TGA maps, the VTFs are found by the fallback lookup
+    texture_format = tree_options.get("texture_format", "tga")
+    if texture_format == "vtf":
+        texture_format = "tga"
+    results = []
+
+    def timed(work):
+        start = time.perf_counter()
+        value = work()
+        return value, time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as folder:
+        root = os.path.join(folder, "materials")
+        backup_folder = os.path.join(folder, "backup")
+        os.makedirs(backup_folder)
+        generate_tree(root, **tree_options)
+
+        index, seconds = timed(lambda: MaterialIndex.scan(root))
+        results.append(stage_result("scan", sum(len(extensions) for extensions in index.entries.values()), None, seconds))
+        vmt_files = index.vmt_files()
+
+        parameters, seconds = timed(lambda: {vmt_file: engine.parse_vmt_file(vmt_file) for vmt_file in vmt_files})
+        results.append(stage_result("parse", len(vmt_files), file_sizes(vmt_files), seconds))
+
+        _, seconds = timed(lambda: [
+            engine.referenced_texture_files(parameters[vmt_file], root, texture_format, index) for vmt_file in vmt_files
+        ])
+        results.append(stage_result("resolve", len(vmt_files), None, seconds))
+
+        ssbump_sources = {}
+        for vmt_file in vmt_files:
+            bumpmap = parameters[vmt_file].get("$bumpmap")
+            ssbump_sources[vmt_file] = engine.find_texture_file(bumpmap, root, texture_format, index) if bumpmap else None
+        ssbumps = sorted(set(path for path in ssbump_sources.values() if path))
+        derived, seconds = timed(lambda: {path: engine.convert_ssbump_to_normal_and_height(path, texture_format) for path in ssbumps})
+        results.append(stage_result("ssbump", len(ssbumps), file_sizes(ssbumps), seconds))
+
+        roughness_sources = engine.collect_roughness_sources(parameters, root, texture_format, index)
+        _, seconds = timed(lambda: [engine.generate_roughness_map(path, texture_format, darkness_value) for path in roughness_sources])
+        results.append(stage_result("roughness", len(roughness_sources), file_sizes(roughness_sources), seconds))
+
+        vmat_files, seconds = timed(lambda: [
+            engine.convert_vmt_to_vmat(vmt_file, root, texture_format, True, True, parameters[vmt_file], True,
+                                       *derived.get(ssbump_sources[vmt_file], (None, None)))
+            for vmt_file in vmt_files
+        ])
+        results.append(stage_result("emit", len(vmt_files), file_sizes(vmat_files), seconds))
+
+        backup_files = vmt_files + ssbumps
+        backup_size = file_sizes(backup_files)
+        backup = open_backup(backup_mode, backup_folder)
+
+        def back_up():
+            for path in backup_files:
+                if backup is None:
+                    engine.move_to_backup(path, backup_folder, root)
+                else:
+                    backup.add(path, os.path.relpath(path, root))
+            if backup is not None:
+                backup.close()
+
+        _, seconds = timed(back_up)
+        results.append(stage_result("backup", len(backup_files), backup_size, seconds))
+        results[-1]["backup_mode"] = backup_mode
+    return results
+
+
+def print_stage_results(results):
+    print(f"{'stage':>10}  {'files':>7}  {'time':>8}  {'files/s':>9}  {'MB/s':>7}")
+    for result in results:
+        mb_per_second = f"{result['mb_per_second']:>7.1f}" if result["mb_per_second"] else f"{'-':>7}"
+        print(f"{result['stage']:>10}  {result['files']:>7}  {result['seconds']:>7.3f}s  "
+              f"{result['files_per_second']:>9.0f}  {mb_per_second}")
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(path, results, options):
+    """Stores the results with the commit and machine they were measured on, to compare between commits."""
+    data = {
+        "commit": current_commit(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "options": options,
+        "results": results,
+    }
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(data, file, indent=1)
+
+
+def print_ssbump_results(results):
+    print(f"{'size':>11}  {'kernel':>10}  {'per-pixel loop*':>15}  {'speedup':>9}  identical")
+    for result in results:
+        size = f"{result['size']}x{result['size']}"
+        print(f"{size:>11}  {result['kernel_seconds']:>9.3f}s  {result['reference_seconds']:>14.1f}s  "
+              f"{result['speedup']:>8.0f}x  {result['identical']}")
+    print("* extrapolated from the rows the old loop was run on")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the converter hot paths.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SSBUMP_SIZES, help="ssbump edge lengths to time")
+    parser.add_argument("--sample-rows", type=int, default=REFERENCE_SAMPLE_ROWS, help="rows the per-pixel loop is timed on")
+    parser.add_argument("--repeats", type=int, default=3, help="kernel runs per size, the best is reported")
+    parser.add_argument("--vmt-count", type=int, default=DEFAULT_VMT_COUNT, help="VMT files the parsers are timed on")
+    parser.add_argument("--gray-map-size", type=int, default=2048, help="texture edge length of the graymaps, encoders, dds and vtf benchmarks")
+    parser.add_argument("--only", choices=BENCHMARKS, nargs="+", default=BENCHMARKS, help="benchmarks to run")
+    parser.add_argument("--backup-mode", choices=["folder", "store", "archive"], default="folder", help="backup mode timed by the stages benchmark")
+    parser.add_argument("--json", metavar="PATH", help="also write the results to a JSON file")
+    add_tree_arguments(parser)
+    args = parser.parse_args()
+
+    results = {}
+    if "ssbump" in args.only:
+        results["ssbump"] = bench_ssbump(args.sizes, args.sample_rows, args.repeats)
+        print_ssbump_results(results["ssbump"])
+    if "keyvalues" in args.only:
+        results["keyvalues"] = bench_keyvalues(args.vmt_count)
+        print_keyvalues_results(results["keyvalues"])
+    if "stages" in args.only:
+        results["stages"] = bench_stages(tree_arguments(args), backup_mode=args.backup_mode)
+        print_stage_results(results["stages"])
+    if "encoders" in args.only:
+        results["encoders"] = bench_encoders(args.gray_map_size, args.repeats)
+        print_encoder_results(results["encoders"])
+    if "dds" in args.only:
+        results["dds"] = bench_dds(args.gray_map_size, args.repeats)
+        print_dds_results(results["dds"])
+    if "vtf" in args.only:
+        results["vtf"] = bench_vtf(args.gray_map_size, args.repeats)
+        print_vtf_results(results["vtf"])
+    if "vpk" in args.only:
+        results["vpk"] = bench_vpk(tree_arguments(args), args.repeats)
+        print_stage_results(results["vpk"])
+    if "graymaps" in args.only:
+        results["graymaps"] = bench_gray_maps(args.gray_map_size, args.repeats)
+        print_gray_map_results(results["graymaps"])
+
+    if args.json:
+        write_results(args.json, results, vars(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,928 @@
+import atexit
+import io
+import os
+import shutil
+import threading
+import logging
+import time
+import sys
+import tempfile
+from queue import SimpleQueue
+from backup_store import DEFAULT_BACKUP_MODE, move_file, open_backup
+from conversion_manifest import ConversionManifest
+from material_index import VTF_EXTENSION, MaterialIndex
+from keyvalues import parse_vmt
+from vmat_emitters import SHADER_PROFILES, material_path, profile_for, write_vmat
+from encoder_profiles import DEFAULT_ENCODER_PROFILE, ENCODER_PROFILES, encoder_options
+from memory_governor import MemoryGovernor, default_memory_budget
+import tracing
+from vpk_reader import archive_entry, input_size, is_vpk, mount_material_root, mounted_files, mounts, open_input, override_files, restore_mounts, unmount
+from cost_planner import VMT_SECONDS, derivation_cost, derivation_memory, image_size, largest_first, schedule_seconds
+from derived_textures import ROUGHNESS, SSBUMP_NORMAL_HEIGHT, DerivedTextureRegistry, when_all_done
+
+# PIL and numpy, multiprocessing, the executors and the logging handlers are imported by the
+# functions that use them, so planning a run, a dry run and the command line help start without
+# loading them
+
+# Constants
+LOG_FILE = "conversion_log.txt"
+DEFAULT_CONCURRENT_THREADS = min(6, os.cpu_count() or 1)
+DEFAULT_CONCURRENT_PROCESSES = os.cpu_count() or 1
+# 'process' spreads the CPU-bound image work over all cores, 'thread' suits I/O-bound trees
+DEFAULT_BACKEND = 'process'
+
+# Suffix of images being written; they are renamed to their real name once complete
+PARTIAL_SUFFIX = '.partial'
+
+# VMT parameters that reference a colour texture, the only kind a roughness map is derived from
+ROUGHNESS_SOURCE_PARAMETERS = ['$basetexture', '$basetexture2']
+
+# Log files rotate at LOG_MAX_BYTES, keeping LOG_BACKUP_COUNT old ones next to the current log
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUP_COUNT = 3
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+class RecordQueueHandler(logging.Handler):
+    """Puts records on a queue as they are. QueueHandler formats each record in the logging thread
+    so it can be pickled, which a queue read by a thread of the same process does not need."""
+
+    def __init__(self, queue):
+        super().__init__()
+        self.queue = queue
+
+    def emit(self, record):
+        self.queue.put_nowait(record)
+
+# Converting threads only put records on a queue; a listener thread formats and writes them, so
+# no worker waits on the log file or the console. One set of handlers however often it is set up.
+_log_file = None
+_log_handlers = []
+_log_listeners = []
+_log_queue_handler = None
+_worker_log_queue = None
+
+def setup_logging(log_file, verbose=False):
+    """Logs to log_file and stdout through a queue. Per-file detail is logged at DEBUG and is
+    dropped before it is formatted unless verbose. Setting up the same log_file again only
+    changes the level, so repeated runs do not stack handlers."""
+    global _log_file, _log_queue_handler
+    root = logging.getLogger()
+    root.setLevel(logging.DEBUG if verbose else logging.INFO)
+    if log_file == _log_file:
+        return
+    shutdown_logging()
+
+    from logging.handlers import RotatingFileHandler
+    file_handler = RotatingFileHandler(log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8')
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    _log_handlers[:] = [file_handler, logging.StreamHandler(sys.stdout)]  # Also print to console
+    log_queue = SimpleQueue()
+    start_log_listener(log_queue)
+    _log_queue_handler = RecordQueueHandler(log_queue)
+    root.addHandler(_log_queue_handler)
+    _log_file = log_file
+
+def start_log_listener(log_queue):
+    from logging.handlers import QueueListener
+    listener = QueueListener(log_queue, *_log_handlers)
+    listener.start()
+    _log_listeners.append(listener)
+
+def worker_log_queue():
+    """Queue that spawned worker processes log to, written by this process's handlers. None without logging set up."""
+    global _worker_log_queue
+    if not _log_handlers:
+        return None
+    if _worker_log_queue is None:
+        import multiprocessing
+        _worker_log_queue = multiprocessing.get_context('spawn').Queue()
+        start_log_listener(_worker_log_queue)
+    return _worker_log_queue
+
+def shutdown_logging():
+    """Writes out every queued record and closes the log file."""
+    global _log_file, _log_queue_handler, _worker_log_queue
+    for listener in _log_listeners:
+        listener.stop()
+    del _log_listeners[:]
+    if _worker_log_queue is not None:
+        _worker_log_queue.close()
+        _worker_log_queue = None
+    if _log_queue_handler is not None:
+        logging.getLogger().removeHandler(_log_queue_handler)
+        _log_queue_handler = None
+    for handler in _log_handlers:
+        handler.close()
+    del _log_handlers[:]
+    _log_file = None
+
+atexit.register(shutdown_logging)
+
+# Pass arguments rather than a formatted string where the message is costly to build: it is
+# only formatted when the level is enabled
+def log_debug(message, *args):
+    logging.debug(message, *args)
+
+def log_info(message, *args):
+    logging.info(message, *args)
+
+def log_warning(message, *args):
+    logging.warning(message, *args)
+
+def log_error(message, *args):
+    logging.error(message, *args)
+
+def validate_parameters(target_folder, backup_folder, texture_format):
+    if not os.path.isdir(target_folder) and not is_vpk(target_folder):
+        raise ValueError("Target folder does not exist or is not a directory or _dir.vpk file.")
+    if not os.path.isdir(backup_folder):
+        raise ValueError("Backup folder does not exist or is not a directory.")
+    if texture_format not in ['tga', 'png', 'jpg', 'dds', 'bmp']:
+        raise ValueError("Unsupported texture format.")
+
+def scan_material_tree(folder):
+    """Index of the files under folder and of a VPK mounted at it. The files on disk that override
+    the VPK's are known from the scan, so reading a file never checks the disk first."""
+    index = MaterialIndex.scan(folder, mounted_files(folder))
+    override_files(folder, index.overridden)
+    return index
+
+def parse_dir(dir_name):
+    """VMT files under a material folder or in a _dir.vpk, which stays mounted so they can be read."""
+    return scan_material_tree(mount_material_root(dir_name)).vmt_files()
+
+def parse_vmt_file(filepath):
+    parameters = {}
+    try:
+        with tracing.span('parse', file=filepath) as span:
+            with open_input(filepath) as file:
+                data = file.read()
+            shader, parameters = parse_vmt(data)
+            if span:
+                span.set(bytes=len(data))
+        parameters["shader"] = shader if shader in SHADER_PROFILES else "unknown"
+        log_debug("Parsed VMT file '%s': %s", filepath, parameters)
+
+    except Exception as e:
+        log_error(f"Unable to open or parse {filepath}: {e}")
+        parameters["ERROR"] = f"Unable to open or parse {filepath}: {e}"
+    return parameters
+
+def move_with_retry(src, dst, retries=5, delay=0.05):
+    for attempt in range(retries):
+        try:
+            move_file(src, dst)
+            return True
+        except PermissionError as e:
+            # A file another program holds open fails with a sharing violation, which may clear up
+            if attempt < retries - 1:
+                log_warning(f"File {src} is in use, retrying...")
+                time.sleep(delay * 2 ** attempt)
+            else:
+                log_error(f"Failed to move {src} to {dst} after {retries} attempts: {e}")
+        except OSError as e:
+            log_error(f"Failed to move {src} to {dst}: {e}")
+            return False
+    return False
+
+def move_to_backup(src, backup_folder, base_path):
+    with tracing.span('backup', file=src):
+        return move_file_to_backup(src, backup_folder, base_path)
+
+def move_file_to_backup(src, backup_folder, base_path):
+    try:
+        relative_path = os.path.relpath(src, base_path)
+        backup_path = os.path.join(backup_folder, relative_path)
+        os.makedirs(os.path.dirname(backup_path), exist_ok=True)
+        if move_with_retry(src, backup_path):
+            log_debug("Moved file from %s to %s", src, backup_path)
+            return True
+        else:
+            log_error(f"Failed to move file to backup: {src}")
+            return False
+    except Exception as e:
+        log_error(f"Error moving {src} to backup: {e}")
+        return False
+
+def open_image(path):
+    """Opens and decodes an image inside a 'decode' span; use it as a context manager like Image.open."""
+    from PIL import Image
+    with tracing.span('decode', file=path) as span:
+        with open_input(path) as file:
+            if path.lower().endswith('.' + VTF_EXTENSION):
+                from vtf_reader import read_vtf
+                img = read_vtf(file)
+            else:
+                img = Image.open(file)
+                try:
+                    img.load()
+                except Exception:
+                    img.close()
+                    raise
+        if span:
+            span.set(bytes=input_size(path), width=img.width, height=img.height)
+    return img
+
+def save_image(img, path, encoder_profile=DEFAULT_ENCODER_PROFILE, block_format=None):
+    """Encodes img in memory with the save options of encoder_profile and writes it with one call,
+    as separate 'encode' and 'write' spans. DDS files are block compressed by dds_encoder, in
+    block_format or the default for the image mode.
+
+    The file is written next to path and renamed over it, so an interrupted write never leaves a truncated image.
+    """
+    from PIL import Image
+    image_format = Image.registered_extensions().get(os.path.splitext(path)[1].lower())
+    options = encoder_options(encoder_profile, image_format)
+    with tracing.span('encode', file=path, width=img.width, height=img.height, profile=encoder_profile):
+        buffer = io.BytesIO()
+        if image_format == 'DDS':
+            from dds_encoder import encode_dds
+            buffer.write(encode_dds(img, block_format, **options))
+        else:
+            img.save(buffer, format=image_format, **options)
+    with tracing.span('write', file=path, bytes=buffer.tell()):
+        partial_path = path + PARTIAL_SUFFIX
+        try:
+            # Maps of VPK textures go to a folder tree that is created as it is written
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(partial_path, 'wb') as file:
+                file.write(buffer.getbuffer())
+            os.replace(partial_path, path)
+        except BaseException:
+            remove_partial(partial_path)
+            raise
+
+def remove_partial(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+def ssbump_output_paths(ssbump_path, output_format):
+    base_name, _ = os.path.splitext(ssbump_path)
+    base_name = base_name.replace('-ssbump', '').replace('_height', '')
+    return f"{base_name}_normal.{output_format}", f"{base_name}_height.{output_format}"
+
+def convert_ssbump_to_normal_and_height(ssbump_path, output_format='png', overwrite=True, checkpoint=None, encoder_profile=DEFAULT_ENCODER_PROFILE, strip_workers=None):
+    """Returns the normal and height map paths, or (None, None) on failure. Raises ConversionCancelled
+    when checkpoint does, before either map is written."""
+    try:
+        normal_map_path, height_map_path = ssbump_output_paths(ssbump_path, output_format)
+        if not overwrite and os.path.isfile(normal_map_path) and os.path.isfile(height_map_path):
+            log_debug("Keeping existing normal and height maps for: %s", ssbump_path)
+            return normal_map_path, height_map_path
+
+        log_debug("Converting ssbump map to normal and height maps for: %s", ssbump_path)
+        from texture_kernels import ssbump_image_to_normal_and_height
+        with open_image(ssbump_path) as img:
+            with tracing.span('transform', file=ssbump_path, operation='ssbump', width=img.width, height=img.height):
+                normal_img, height_img = ssbump_image_to_normal_and_height(img, workers=strip_workers, checkpoint=checkpoint)
+
+        save_image(normal_img, normal_map_path, encoder_profile, block_format='BC5')
+        save_image(height_img, height_map_path, encoder_profile)
+
+        log_debug("Generated normal map: %s", normal_map_path)
+        log_debug("Generated height map: %s", height_map_path)
+
+        return normal_map_path, height_map_path
+    except ConversionCancelled:
+        raise
+    except Exception as e:
+        log_error(f"Error converting ssbump to normal and height: {e}")
+        return None, None
+
+def vmat_path_for(vmt_file, base_path):
+    """The VMAT of a VMT under base_path, at the same place relative to base_path."""
+    relative_path = os.path.relpath(vmt_file, base_path)
+    return os.path.join(base_path, os.path.splitext(relative_path)[0] + '.vmat')
+
+def convert_vmt_to_vmat(vmt_file, base_path, texture_format, generate_height, generate_normal, parameters=None, overwrite_vmat=True, normal_map_path=None, height_map_path=None):
+    vmat_file_export = vmat_path_for(vmt_file, base_path)
+    if not overwrite_vmat and os.path.isfile(vmat_file_export):
+        log_debug("Keeping existing VMAT file: %s", vmat_file_export)
+        return vmat_file_export
+
+    if parameters is None:
+        parameters = parse_vmt_file(vmt_file)
+    log_debug("Processing VMT file: %s", vmt_file)
+
+    base_texture_name = parameters.get('$basetexture', '').replace('"', '')
+    bumpmap_texture_name = parameters.get('$bumpmap', '').replace('"', '')
+    normalmap_texture_name = parameters.get('$normalmap', '').replace('"', '')
+    roughness_texture_name = f"{base_texture_name}_roughness.{texture_format}"
+    parameters['$roughness'] = roughness_texture_name
+
+    values = {'roughness': material_path(roughness_texture_name.lower()), 'metalness': '0'}
+    if '$basetexture' in parameters:
+        values['color'] = material_path(f"{parameters['$basetexture'].lower()}.{texture_format}")
+    if normal_map_path:
+        values['normal'] = material_path(os.path.relpath(normal_map_path, base_path))
+    elif bumpmap_texture_name and generate_normal:
+        values['normal'] = material_path(f"{bumpmap_texture_name.lower().replace('-ssbump', '_normal')}.{texture_format}")
+    else:
+        values['normal'] = f"materials/default/default_normal.{texture_format}"
+    if generate_height and height_map_path:
+        values['height'] = material_path(os.path.relpath(height_map_path, base_path))
+
+    try:
+        with tracing.span('encode', file=vmat_file_export):
+            text = profile_for(parameters.get('shader', '')).render(values)
+        with tracing.span('write', file=vmat_file_export, bytes=len(text)):
+            os.makedirs(os.path.dirname(vmat_file_export), exist_ok=True)
+            write_vmat(vmat_file_export, text)
+        log_debug("VMAT file generated: %s", vmat_file_export)
+    except Exception as e:
+        log_error(f"Error writing VMAT file {vmat_file_export}: {e}")
+
+    return vmat_file_export
+
+def texture_extensions(texture_format):
+    """Extensions a texture is looked up with: an exported texture first, then the VTF the game ships."""
+    return [texture_format, VTF_EXTENSION]
+
+def find_texture_file(texture_name, base_path, texture_format, index=None):
+    if index is not None:
+        texture_file = index.resolve(texture_name, texture_extensions(texture_format))
+        if texture_file:
+            return texture_file
+    else:
+        for extension in texture_extensions(texture_format):
+            texture_file = os.path.join(base_path, f"{texture_name}.{extension}")
+            if os.path.isfile(texture_file):
+                return texture_file
+    log_warning(f"Texture file for '{texture_name}' not found.")
+    return None
+
+def referenced_texture_files(parameters, base_path, texture_format, index=None):
+    """Paths of the texture files a VMT's conversion reads, whether or not they exist yet."""
+    texture_files = []
+    for key in ROUGHNESS_SOURCE_PARAMETERS + ['$bumpmap', '$normalmap']:
+        texture_name = parameters.get(key, '').replace('"', '')
+        if texture_name:
+            texture_file = index.resolve(texture_name, texture_extensions(texture_format)) if index is not None else None
+            texture_files.append(texture_file or os.path.join(base_path, f"{texture_name}.{texture_format}"))
+    return texture_files
+
+def collect_roughness_sources(vmt_parameters, base_path, texture_format, index=None):
+    """Returns each texture file referenced as a colour texture by the parsed VMTs, once."""
+    texture_names = {}
+    for parameters in vmt_parameters.values():
+        for key in ROUGHNESS_SOURCE_PARAMETERS:
+            texture_name = parameters.get(key, '').replace('"', '')
+            if texture_name:
+                texture_names.setdefault(os.path.normcase(os.path.normpath(texture_name)), texture_name)
+
+    sources = {}
+    for texture_name in texture_names.values():
+        texture_path = find_texture_file(texture_name, base_path, texture_format, index)
+        if texture_path:
+            sources.setdefault(os.path.normcase(os.path.abspath(texture_path)), texture_path)
+    return list(sources.values())
+
+def roughness_source_files(parameters, texture_format, index):
+    """The colour textures of one VMT that roughness maps are generated from, as collect_roughness_sources finds them."""
+    texture_files = []
+    for key in ROUGHNESS_SOURCE_PARAMETERS:
+        texture_name = parameters.get(key, '').replace('"', '')
+        texture_file = index.resolve(texture_name, texture_extensions(texture_format)) if texture_name else None
+        if texture_file:
+            texture_files.append(texture_file)
+    return texture_files
+
+def generate_roughness_map(texture_path, texture_format, darkness_value, overwrite=True, checkpoint=None, encoder_profile=DEFAULT_ENCODER_PROFILE, strip_workers=None):
+    base_name, _ = os.path.splitext(texture_path)
+    roughness_file_path = f"{base_name}_roughness.{texture_format}"
+    if not overwrite and os.path.isfile(roughness_file_path):
+        log_debug("Keeping existing roughness map: %s", roughness_file_path)
+        return roughness_file_path
+
+    try:
+        from texture_kernels import roughness_image
+        # Grayscale, invert, darkness scaling and the shiny surface threshold in one decode and one encode
+        with open_image(texture_path) as img:
+            with tracing.span('transform', file=texture_path, operation='roughness', width=img.width, height=img.height):
+                roughness_img = roughness_image(img, darkness_value, workers=strip_workers, checkpoint=checkpoint)
+
+        save_image(roughness_img, roughness_file_path, encoder_profile)
+        log_debug("Generated roughness map: %s", roughness_file_path)
+        return roughness_file_path
+    except ConversionCancelled:
+        raise
+    except Exception as e:
+        log_error(f"Error processing {texture_path}: {e}")
+        return None
+
+def roughness_worker(texture_path, texture_format, darkness_value, overwrite_tga, encoder_profile, control, governor, memory, strip_workers):
+    control.wait_if_paused()
+    if control.is_cancelled():
+        return None
+    try:
+        with governor.reserve(memory, control.checkpoint):
+            return generate_roughness_map(texture_path, texture_format, darkness_value, overwrite_tga, control.checkpoint, encoder_profile, strip_workers)
+    except ConversionCancelled:
+        return None
+    finally:
+        tracing.flush()
+
+def ssbump_worker(ssbump_path, texture_format, overwrite_tga, encoder_profile, control, governor, memory, strip_workers):
+    control.wait_if_paused()
+    if control.is_cancelled():
+        return None, None
+    try:
+        with governor.reserve(memory, control.checkpoint):
+            return convert_ssbump_to_normal_and_height(ssbump_path, texture_format, overwrite_tga, control.checkpoint, encoder_profile, strip_workers)
+    except ConversionCancelled:
+        return None, None
+    finally:
+        tracing.flush()
+
+def derivation_succeeded(future):
+    """Whether a derivation finished with all its maps written; the workers return None for a map they did not write."""
+    if future is None or not future.done() or future.cancelled() or future.exception() is not None:
+        return False
+    result = future.result()
+    return all(result) if isinstance(result, tuple) else result is not None
+
+def worker_thread(vmt_file_name, parameters, base_path, backup_folder, texture_format, overwrite_vmat, generate_normal, generate_height, normal_map_path, height_map_path, backup_files, control):
+    """Writes the VMAT of one VMT and backs up its sources. Returns False when it should be retried, None when cancelled."""
+    import multiprocessing
+    worker_name = f"{multiprocessing.current_process().name}/{threading.current_thread().name}"
+
+    control.wait_if_paused()
+    if control.is_cancelled():
+        log_debug("[%s] Cancelled processing.", worker_name)
+        return None
+
+    try:
+        start_time = time.time()
+        log_debug("[%s] Processing VMT file: %s", worker_name, vmt_file_name)
+
+        # Generate VMAT file, pointing at the normal and height maps derived from its ssbump, if any
+        vmat_file = convert_vmt_to_vmat(vmt_file_name, base_path, texture_format, generate_height, generate_normal, parameters, overwrite_vmat, normal_map_path, height_map_path)
+
+        # Move the original VMT and, for one of the VMTs sharing it, the ssbump to the backup folder
+        for backup_file in backup_files:
+            move_to_backup(backup_file, backup_folder, base_path)
+
+        end_time = time.time()
+        elapsed_time = end_time - start_time
+        if elapsed_time > 5:  # Arbitrary threshold for "long processing time"
+            log_warning(f"[{worker_name}] Processing of {os.path.basename(vmt_file_name)} took {elapsed_time:.2f} seconds")
+        return True
+
+    except Exception as e:
+        log_error(f"[{worker_name}] Error processing VMT file {vmt_file_name}: {e}")
+        return False
+    finally:
+        tracing.flush()
+
+class ConversionCancelled(Exception):
+    """Raised by ConversionControl.checkpoint to abandon the texture being processed."""
+
+class ConversionControl:
+    """Pause and cancel signals shared by the parent and the workers of one conversion run.
+
+    The process backend uses manager events, which can be passed to worker processes. Waiting
+    while paused blocks on the event, so a resume or cancel wakes the workers at once.
+    """
+
+    def __init__(self, backend=DEFAULT_BACKEND):
+        self.manager = None
+        # Called in the parent on cancel, such as to wake the run's event loop
+        self.cancel_callbacks = []
+        if backend == 'process':
+            import multiprocessing
+            self.manager = multiprocessing.get_context('spawn').Manager()
+            self.pause_event = self.manager.Event()
+            self.cancel_event = self.manager.Event()
+        else:
+            self.pause_event = threading.Event()
+            self.cancel_event = threading.Event()
+        self.pause_event.set()  # Set means running
+
+    def __getstate__(self):
+        # Only the event proxies travel to worker processes, the manager stays with the parent
+        return {'manager': None, 'cancel_callbacks': [], 'pause_event': self.pause_event, 'cancel_event': self.cancel_event}
+
+    def pause(self):
+        self.pause_event.clear()
+
+    def resume(self):
+        self.pause_event.set()
+
+    def is_paused(self):
+        return not self.pause_event.is_set()
+
+    def cancel(self):
+        self.cancel_event.set()
+        self.pause_event.set()  # Let paused workers see the cancel
+        for callback in self.cancel_callbacks:
+            callback()
+
+    def is_cancelled(self):
+        return self.cancel_event.is_set()
+
+    def wait_if_paused(self):
+        self.pause_event.wait()
+
+    def checkpoint(self):
+        """Called between strips of a texture: blocks while paused and raises ConversionCancelled once cancelled."""
+        self.wait_if_paused()
+        if self.is_cancelled():
+            raise ConversionCancelled()
+
+    def close(self):
+        if self.manager is not None:
+            self.manager.shutdown()
+            self.manager = None
+
+def init_worker_process(log_queue, log_level, trace_dir=None, vpk_mounts=None):
+    # Worker processes are spawned, so they start without the parent's logging, tracing and VPK setup;
+    # their records go back to the parent, which alone writes the log
+    restore_mounts(vpk_mounts)
+    if log_queue is not None:
+        from logging.handlers import QueueHandler
+        root = logging.getLogger()
+        root.setLevel(log_level)
+        root.addHandler(QueueHandler(log_queue))
+    if trace_dir:
+        tracing.enable(trace_dir)
+
+def worker_count(backend):
+    return DEFAULT_CONCURRENT_PROCESSES if backend == 'process' else DEFAULT_CONCURRENT_THREADS
+
+def strip_worker_count(backend):
+    """Strip threads of one large image, so that the pool's workers together use each core once."""
+    return max(1, (os.cpu_count() or 1) // worker_count(backend))
+
+def create_executor(backend, trace_dir=None):
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+    if backend == 'process':
+        import multiprocessing
+        return ProcessPoolExecutor(
+            max_workers=worker_count(backend), mp_context=multiprocessing.get_context('spawn'),
+            initializer=init_worker_process, initargs=(worker_log_queue(), logging.getLogger().level, trace_dir, mounts())
+        )
+    return ThreadPoolExecutor(max_workers=worker_count(backend))
+
+def estimate_time(total, processed, start_time):
+    elapsed_time = time.time() - start_time
+    if processed == 0:
+        return "Calculating..."
+    average_time_per_file = elapsed_time / processed
+    estimated_remaining_time = average_time_per_file * (total - processed)
+    minutes, seconds = divmod(estimated_remaining_time, 60)
+    return f"{int(minutes)}m {int(seconds)}s remaining"
+
+def format_rate(processed, processed_bytes, start_time):
+    elapsed_time = max(time.time() - start_time, 1e-6)
+    return f"{processed / elapsed_time:.1f} files/s, {processed_bytes / 1e6 / elapsed_time:.1f} MB/s"
+
+class ConversionPlan:
+    """What one run will do: the VMTs to convert and the textures derived for them, before anything is written."""
+
+    def __init__(self, target_folder, texture_format, settings):
+        self.target_folder = target_folder
+        self.texture_format = texture_format
+        self.settings = settings
+        self.index = None
+        self.manifest = None
+        self.found = 0
+        self.vmt_files = []
+        self.vmt_parameters = {}
+        self.input_signatures = {}
+        # VMT -> ssbump it needs converted first, or None
+        self.ssbump_sources = {}
+        # VMT -> files moved to the backup folder after its conversion
+        self.backup_files = {}
+        self.roughness_sources = []
+        # VMT -> colour textures its roughness maps are generated from
+        self.roughness_dependencies = {}
+        # Source texture -> (width, height) from its header, None when unreadable
+        self.image_sizes = {}
+        # (source path, operation) -> estimated single-core seconds of the derivation
+        self.derivation_costs = {}
+        # Filled in by convert_materials
+        self.converted = 0
+        self.cancelled = False
+        self.trace_summary = None
+        self.memory_summary = None
+
+    @property
+    def skipped(self):
+        return self.found - len(self.vmt_files)
+
+    def ssbump_files(self):
+        return sorted(set(path for path in self.ssbump_sources.values() if path))
+
+    def estimated_seconds(self):
+        """Estimated single-core seconds of all the work of the run."""
+        return sum(self.derivation_costs.values()) + VMT_SECONDS * len(self.vmt_files)
+
+    def critical_path_seconds(self):
+        """Longest chain of dependent work, the shortest the run can take however many workers it has."""
+        chains = [cost for (_, operation), cost in self.derivation_costs.items() if operation == ROUGHNESS]
+        for vmt_file in self.vmt_files:
+            ssbump_path = self.ssbump_sources[vmt_file]
+            chains.append(VMT_SECONDS + (self.derivation_costs[(ssbump_path, SSBUMP_NORMAL_HEIGHT)] if ssbump_path else 0.0))
+        return max(chains, default=0.0)
+
+    def estimated_wall_seconds(self, workers):
+        """Estimated duration of the run on workers, scheduled largest-first."""
+        costs = list(self.derivation_costs.values()) + [VMT_SECONDS] * len(self.vmt_files)
+        return max(schedule_seconds(costs, workers), self.critical_path_seconds())
+
+    def input_bytes(self, vmt_file):
+        """Size of a VMT and the textures it references, from the signatures taken while planning."""
+        signatures = self.input_signatures[vmt_file]
+        sizes = [signatures["vmt"]] + list(signatures["textures"].values())
+        return sum(signature[0] for signature in sizes if signature)
+
+def conversion_settings(texture_format, generate_normal, generate_height, generate_roughness, darkness_value):
+    return {
+        'texture_format': texture_format,
+        'generate_normal': bool(generate_normal),
+        'generate_height': bool(generate_height),
+        'generate_roughness': bool(generate_roughness),
+        'darkness_value': int(darkness_value) if generate_roughness else None,
+    }
+
+def plan_conversion(target_folder, texture_format, generate_normal, generate_height, generate_roughness, darkness_value):
+    target_folder = os.path.abspath(target_folder)
+    settings = conversion_settings(texture_format, generate_normal, generate_height, generate_roughness, darkness_value)
+    plan = ConversionPlan(target_folder, texture_format, settings)
+
+    # One scan of the tree serves VMT discovery, texture lookups, change detection and backup bookkeeping
+    index = plan.index = scan_material_tree(target_folder)
+    file_list = index.vmt_files()
+    plan.found = len(file_list)
+    vmt_parameters = {vmt_file: parse_vmt_file(vmt_file) for vmt_file in file_list}
+
+    # Only VMTs whose inputs or settings changed since their last conversion are converted again
+    manifest = plan.manifest = ConversionManifest.load(target_folder)
+    for vmt_file in file_list:
+        with tracing.span('lookup', file=vmt_file):
+            texture_files = referenced_texture_files(vmt_parameters[vmt_file], target_folder, texture_format, index)
+            plan.input_signatures[vmt_file] = manifest.input_signatures(vmt_file, texture_files, index.signature)
+    plan.vmt_files = [
+        vmt_file for vmt_file in file_list
+        if not manifest.is_current(vmt_file, plan.input_signatures[vmt_file], settings, vmat_path_for(vmt_file, target_folder))
+    ]
+    plan.vmt_parameters = {vmt_file: vmt_parameters[vmt_file] for vmt_file in plan.vmt_files}
+
+    # Each ssbump is converted once however many VMTs share it, and backed up by only one of them
+    backed_up_bumpmaps = set()
+    for vmt_file in plan.vmt_files:
+        bumpmap_texture_name = plan.vmt_parameters[vmt_file].get('$bumpmap', '').replace('"', '')
+        with tracing.span('lookup', file=vmt_file, texture=bumpmap_texture_name):
+            bumpmap_file_path = find_texture_file(bumpmap_texture_name, target_folder, texture_format, index) if bumpmap_texture_name else None
+        # Files read from a VPK stay in it untouched, so there is nothing to back up
+        plan.backup_files[vmt_file] = [vmt_file] if archive_entry(vmt_file) is None else []
+        plan.ssbump_sources[vmt_file] = None
+        if not bumpmap_file_path:
+            continue
+        if "-ssbump" in bumpmap_texture_name:
+            plan.ssbump_sources[vmt_file] = bumpmap_file_path
+        bumpmap_key = os.path.normcase(os.path.abspath(bumpmap_file_path))
+        if bumpmap_key not in backed_up_bumpmaps and archive_entry(bumpmap_file_path) is None:
+            backed_up_bumpmaps.add(bumpmap_key)
+            plan.backup_files[vmt_file].append(bumpmap_file_path)
+
+    # Roughness maps only for the colour textures the VMTs reference, each generated once
+    if generate_roughness:
+        plan.roughness_sources = collect_roughness_sources(plan.vmt_parameters, target_folder, texture_format, index)
+        for vmt_file in plan.vmt_files:
+            plan.roughness_dependencies[vmt_file] = roughness_source_files(plan.vmt_parameters[vmt_file], texture_format, index)
+
+    # Costs come from the image headers, no pixels are decoded while planning
+    derivations = [(path, SSBUMP_NORMAL_HEIGHT) for path in plan.ssbump_files()] + [(path, ROUGHNESS) for path in plan.roughness_sources]
+    for source_path, operation in derivations:
+        with tracing.span('lookup', file=source_path, operation='cost'):
+            if source_path not in plan.image_sizes:
+                plan.image_sizes[source_path] = image_size(source_path)
+            source_format = os.path.splitext(source_path)[1][1:].lower()
+            plan.derivation_costs[(source_path, operation)] = derivation_cost(plan.image_sizes[source_path], operation, texture_format, source_format)
+    return plan
+
+def convert_materials(target_folder, backup_folder, texture_format, overwrite_vmat, overwrite_tga, generate_normal, generate_height, generate_roughness, darkness_value, backend=DEFAULT_BACKEND, control=None, progress=None, dry_run=False, backup_mode=DEFAULT_BACKUP_MODE, trace_path=None, verbose=False, memory_budget=None, encoder_profile=DEFAULT_ENCODER_PROFILE):
+    """Converts every changed VMT under target_folder and returns the ConversionPlan it followed.
+
+    progress(processed, total, start_time, processed_bytes) is called before the first and after every
+    converted VMT; processed_bytes is the size of the converted VMTs and the textures they reference.
+    With dry_run the plan is returned without converting, backing up or logging to a file.
+    backup_mode is one of backup_store.BACKUP_MODES.
+    With trace_path, every stage of every material is recorded as a span, written there as a Chrome
+    trace and summarised in plan.trace_summary.
+    By default only summaries, warnings and errors are logged; verbose adds every file's parameters and outputs.
+    memory_budget caps the bytes the texture tasks may hold at once, by default half the available memory;
+    how often tasks waited for it is reported in plan.memory_summary.
+    encoder_profile, one of encoder_profiles.ENCODER_PROFILES, sets how the generated maps are compressed.
+    target_folder may also be a _dir.vpk, whose materials are then read from the VPK without extracting
+    them; the VMATs and maps go to vpk_reader.output_folder and the VPK is not backed up.
+    Raises ValueError for invalid folders or texture format.
+    """
+    validate_parameters(target_folder, backup_folder, texture_format)
+    if encoder_profile not in ENCODER_PROFILES:
+        raise ValueError("Unknown encoder profile.")
+    # The plan's paths all start with the target folder, so they stay valid whatever the working directory
+    target_folder = mount_material_root(os.path.abspath(target_folder))
+    backup_folder = os.path.abspath(backup_folder)
+
+    if dry_run:
+        try:
+            return plan_conversion(target_folder, texture_format, generate_normal, generate_height, generate_roughness, darkness_value)
+        finally:
+            unmount(target_folder)
+
+    os.makedirs(target_folder, exist_ok=True)
+
+    log_file = os.path.join(target_folder, LOG_FILE)
+    setup_logging(log_file, verbose)
+
+    trace_dir = None
+    if trace_path:
+        trace_dir = tempfile.mkdtemp(prefix="vmt2vmat-trace-")
+        tracing.enable(trace_dir)
+
+    plan = plan_conversion(target_folder, texture_format, generate_normal, generate_height, generate_roughness, darkness_value)
+    if plan.skipped:
+        log_info(f"Skipping {plan.skipped} VMT files unchanged since their last conversion.")
+    file_list, vmt_parameters, index, manifest = plan.vmt_files, plan.vmt_parameters, plan.index, plan.manifest
+    backup_files = plan.backup_files
+
+    total_vmt_files = len(file_list)
+    progress_count = [0]
+    processed_bytes = [0]
+    start_time = time.time()
+    if progress is not None:
+        progress(0, total_vmt_files, start_time, 0)
+
+    # Loose backups are moved by the workers; a store or archive is written from this thread only
+    backup = open_backup(backup_mode, backup_folder)
+
+    owns_control = control is None
+    if owns_control:
+        control = ConversionControl(backend)
+    # Texture tasks reserve their estimated peak memory from this budget before decoding
+    governor = MemoryGovernor(memory_budget or default_memory_budget(), control.manager)
+    control.cancel_callbacks.append(governor.wake)
+
+    def back_up(vmt_file):
+        for backup_file in backup_files[vmt_file]:
+            try:
+                with tracing.span('backup', file=backup_file, mode=backup_mode):
+                    backup.add(backup_file, os.path.relpath(backup_file, target_folder))
+                log_debug("Backed up %s into the %s", backup_file, backup_mode)
+            except Exception as e:
+                log_error(f"Error backing up {backup_file}: {e}")
+
+    def update_progress(vmt_file):
+        converted_files.append(vmt_file)
+        progress_count[0] += 1
+        processed_bytes[0] += plan.input_bytes(vmt_file)
+        log_debug("Progress count: %d", progress_count[0])
+        if progress is not None:
+            progress(progress_count[0], total_vmt_files, start_time, processed_bytes[0])
+
+    registry = DerivedTextureRegistry()
+    derivations = {}
+    converted_files = []
+    # Worker and executor threads report finished work here; only this thread submits and updates progress
+    events = SimpleQueue()
+    vmt_futures = {}
+    retried = set()
+    # A cancel wakes the loop below, so queued work is dropped without waiting for a running file to finish
+    def wake_on_cancel():
+        events.put(('cancelled', None, None))
+    control.cancel_callbacks.append(wake_on_cancel)
+
+    try:
+        tile_workers = strip_worker_count(backend)
+        with create_executor(backend, trace_dir) as executor:
+            def submit(function, *args):
+                try:
+                    return executor.submit(function, *args)
+                except Exception as e:
+                    # A broken process pool takes no more work; the task fails like one whose worker died
+                    from concurrent.futures import Future
+                    failed = Future()
+                    failed.set_exception(e)
+                    return failed
+
+            submitters = {
+                SSBUMP_NORMAL_HEIGHT: lambda path: submit(
+                    ssbump_worker, path, texture_format, overwrite_tga, encoder_profile, control, governor, derivation_memory(plan.image_sizes[path], SSBUMP_NORMAL_HEIGHT), tile_workers
+                ),
+                ROUGHNESS: lambda path: submit(
+                    roughness_worker, path, texture_format, darkness_value, overwrite_tga, encoder_profile, control, governor, derivation_memory(plan.image_sizes[path], ROUGHNESS), tile_workers
+                ),
+            }
+            # Largest derivations start first, so a huge ssbump does not start last and hold up the end of the run;
+            # the lookups below then get the futures these start
+            for source_path, operation in largest_first(plan.derivation_costs):
+                registry.derive(source_path, operation, lambda: submitters[operation](source_path))
+
+            for vmt_file in file_list:
+                ssbump_path = plan.ssbump_sources[vmt_file]
+                derivations[vmt_file] = None
+                if ssbump_path:
+                    derivations[vmt_file] = registry.derive(
+                        ssbump_path, SSBUMP_NORMAL_HEIGHT, lambda path=ssbump_path: submitters[SSBUMP_NORMAL_HEIGHT](path)
+                    )
+
+            roughness_futures = []
+            if plan.roughness_sources:
+                log_info(f"Generating {len(plan.roughness_sources)} roughness maps...")
+            for texture_path in plan.roughness_sources:
+                future = registry.derive(texture_path, ROUGHNESS, lambda path=texture_path: submitters[ROUGHNESS](path))
+                future.add_done_callback(lambda f, path=texture_path: events.put(('derived', path, f)))
+                roughness_futures.append(future)
+
+            def submit_vmt(vmt_file):
+                derivation = derivations[vmt_file]
+                normal_map_path, height_map_path = None, None
+                if derivation is not None and not derivation.cancelled():
+                    try:
+                        normal_map_path, height_map_path = derivation.result()
+                    except Exception as e:
+                        # A worker that died or a task that could not be pickled; the VMAT is written without the maps
+                        log_error(f"Error converting ssbump {plan.ssbump_sources[vmt_file]}: {e}")
+                future = submit(
+                    worker_thread, vmt_file, vmt_parameters[vmt_file], target_folder, backup_folder, texture_format, overwrite_vmat,
+                    generate_normal, generate_height, normal_map_path, height_map_path,
+                    backup_files[vmt_file] if backup is None else [], control
+                )
+                vmt_futures[vmt_file] = future
+                future.add_done_callback(lambda f: events.put(('finished', vmt_file, f)))
+
+            for vmt_file in file_list:
+                dependencies = [derivations[vmt_file]] if derivations[vmt_file] is not None else []
+                when_all_done(dependencies, lambda vmt_file=vmt_file: events.put(('ready', vmt_file, None)))
+
+            outstanding = len(file_list) + len(roughness_futures)
+            while outstanding:
+                kind, vmt_file, future = events.get()
+                if control.is_cancelled():
+                    registry.cancel_pending()
+                    for pending in vmt_futures.values():
+                        pending.cancel()
+                if kind == 'cancelled':
+                    continue
+
+                if kind == 'ready' and not control.is_cancelled():
+                    submit_vmt(vmt_file)
+                    continue
+                if kind == 'derived' and not future.cancelled() and future.exception() is not None:
+                    # Roughness events carry the source texture in place of a VMT
+                    log_error(f"Error generating roughness map for {vmt_file}: {future.exception()}")
+                if kind == 'finished' and not future.cancelled():
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        # The worker never returned, for example because its process was killed
+                        log_error(f"Error processing VMT file {vmt_file}: {e}")
+                        result = False
+                    if result:
+                        if backup is not None:
+                            back_up(vmt_file)
+                        for backup_file in backup_files[vmt_file]:
+                            index.discard(backup_file)
+                        update_progress(vmt_file)
+                    elif result is False and vmt_file not in retried and not control.is_cancelled():
+                        # Retry failed files once
+                        log_info(f"Retrying failed file: {vmt_file}")
+                        retried.add(vmt_file)
+                        submit_vmt(vmt_file)
+                        continue
+                outstanding -= 1
+        plan.cancelled = control.is_cancelled()
+    finally:
+        control.cancel_callbacks.remove(wake_on_cancel)
+        control.cancel_callbacks.remove(governor.wake)
+        plan.memory_summary = governor.summary()
+        log_info(plan.memory_summary)
+        # A VMT is skipped by later runs only once every map derived for it was written too
+        for vmt_file in converted_files:
+            derived = [derivations.get(vmt_file)] if plan.ssbump_sources[vmt_file] else []
+            derived += [registry.get(path, ROUGHNESS) for path in plan.roughness_dependencies.get(vmt_file, [])]
+            if all(derivation_succeeded(future) for future in derived):
+                manifest.record(vmt_file, plan.input_signatures[vmt_file], plan.settings)
+        manifest.save()
+        if backup is not None:
+            backup.close()
+        if owns_control:
+            control.close()
+        if trace_dir:
+            tracing.flush()
+            spans = tracing.load_spans(trace_dir)
+            tracing.disable()
+            shutil.rmtree(trace_dir, ignore_errors=True)
+            tracing.export_chrome_trace(spans, trace_path)
+            plan.trace_summary = tracing.format_summary(tracing.summarize(spans))
+            log_info(f"Wrote {len(spans)} trace spans to {trace_path}\n{plan.trace_summary}")
+        unmount(target_folder)
+
+    plan.converted = progress_count[0]
+    if plan.cancelled:
+        log_info("Conversion cancelled.")
+    return plan
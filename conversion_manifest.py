@@ -0,0 +1,76 @@
+import json
+import os
+import threading
+
+MANIFEST_FILE = ".vmt2vmat_manifest.json"
+MANIFEST_VERSION = 1
+
+
+def file_signature(path):
+    """Size and modification time of a file, or None when it does not exist."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+class ConversionManifest:
+    """Records, per VMT, the inputs and settings of its last successful conversion.
+
+    A VMT whose own file, referenced textures and conversion settings all still match its entry,
+    and whose VMAT still exists, does not need to be converted again.
+    """
+
+    def __init__(self, path, entries=None):
+        self.path = path
+        self.entries = entries if entries is not None else {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def load(cls, target_folder):
+        path = os.path.join(target_folder, MANIFEST_FILE)
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return cls(path)
+        if data.get("version") != MANIFEST_VERSION:
+            return cls(path)
+        return cls(path, data.get("entries", {}))
+
+    def key(self, path):
+        return os.path.relpath(path, os.path.dirname(self.path)).replace("\\", "/").lower()
+
+    def input_signatures(self, vmt_file, texture_files, signature=file_signature):
+        """Signatures of a VMT and the texture files it references, to pass to is_current and record.
+
+        signature can be swapped for a cached lookup such as MaterialIndex.signature.
+        """
+        signatures = {"vmt": signature(vmt_file), "textures": {}}
+        for texture_file in sorted(texture_files):
+            signatures["textures"][self.key(texture_file)] = signature(texture_file)
+        return signatures
+
+    def is_current(self, vmt_file, signatures, settings, vmat_file):
+        with self.lock:
+            entry = self.entries.get(self.key(vmt_file))
+        if entry is None or signatures["vmt"] is None:
+            return False
+        return (
+            entry["inputs"] == signatures
+            and entry["settings"] == settings
+            and os.path.isfile(vmat_file)
+        )
+
+    def record(self, vmt_file, signatures, settings):
+        with self.lock:
+            self.entries[self.key(vmt_file)] = {"inputs": signatures, "settings": settings}
+
+    def save(self):
+        with self.lock:
+            data = {"version": MANIFEST_VERSION, "entries": self.entries}
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as file:
+                json.dump(data, file, separators=(",", ":"))
+            os.replace(temp_path, self.path)
@@ -0,0 +1,102 @@
+import heapq
+import os
+import struct
+from derived_textures import ROUGHNESS, SSBUMP_NORMAL_HEIGHT
+from vpk_reader import open_input
+
+# Single-core seconds per megapixel of each derivation, decode and transform included, measured
+# on TGA sources. The encode of every output image is added per output format.
+DERIVATION_SECONDS_PER_MEGAPIXEL = {SSBUMP_NORMAL_HEIGHT: 0.06, ROUGHNESS: 0.01}
+DERIVATION_OUTPUTS = {SSBUMP_NORMAL_HEIGHT: 2, ROUGHNESS: 1}
+# Decode seconds per megapixel of source formats slower to decode than TGA, added to the derivation
+SOURCE_DECODE_SECONDS_PER_MEGAPIXEL = {'vtf': 0.03}
+ENCODE_SECONDS_PER_MEGAPIXEL = {'tga': 0.005, 'bmp': 0.005, 'dds': 0.06, 'jpg': 0.03, 'png': 0.17}
+# Bytes per pixel held for a whole derivation: an RGBA source and its RGB conversion, the outputs
+# and their encoded copy. The strip working memory of texture_kernels comes on top.
+DERIVATION_BYTES_PER_PIXEL = {SSBUMP_NORMAL_HEIGHT: 14, ROUGHNESS: 6}
+# Parsing, emitting the VMAT and backing up one VMT
+VMT_SECONDS = 0.002
+
+# JPEG start-of-frame markers, the segments that carry the image size
+_JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def _jpeg_size(file):
+    file.seek(2)
+    while True:
+        marker = file.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+        if marker[1] in (0xD8, 0x01) or 0xD0 <= marker[1] <= 0xD7:
+            continue
+        length = struct.unpack('>H', file.read(2))[0]
+        if marker[1] in _JPEG_SOF_MARKERS:
+            height, width = struct.unpack('>xHH', file.read(5))
+            return width, height
+        file.seek(length - 2, os.SEEK_CUR)
+
+
+def image_size(path):
+    """(width, height) of an image read from its header, without decoding pixels, or None if unknown."""
+    try:
+        with open_input(path) as file:
+            header = file.read(32)
+            if header.startswith(b'\x89PNG'):
+                return struct.unpack('>II', header[16:24])
+            if header.startswith(b'VTF\0'):
+                return struct.unpack('<HH', header[16:20])
+            if header.startswith(b'DDS '):
+                height, width = struct.unpack('<II', header[12:20])
+                return width, height
+            if header.startswith(b'BM'):
+                if struct.unpack('<I', header[14:18])[0] == 12:
+                    return struct.unpack('<HH', header[18:22])
+                width, height = struct.unpack('<ii', header[18:26])
+                return width, abs(height)
+            if header.startswith(b'\xff\xd8'):
+                return _jpeg_size(file)
+            if path.lower().endswith('.tga') and len(header) >= 18:
+                return struct.unpack('<HH', header[12:16])
+    except (OSError, struct.error):
+        return None
+    # Anything else is left to PIL, which also only reads the header until the pixels are loaded
+    try:
+        from PIL import Image
+        with open_input(path) as file, Image.open(file) as img:
+            return img.size
+    except Exception:
+        return None
+
+
+def derivation_cost(size, operation, output_format, source_format=None):
+    """Estimated single-core seconds of deriving operation's outputs from an image of size (width, height)."""
+    if size is None:
+        return 0.0
+    megapixels = size[0] * size[1] / 1e6
+    decode = SOURCE_DECODE_SECONDS_PER_MEGAPIXEL.get(source_format, 0.0)
+    encode = ENCODE_SECONDS_PER_MEGAPIXEL.get(output_format, 0.0) * DERIVATION_OUTPUTS[operation]
+    return megapixels * (DERIVATION_SECONDS_PER_MEGAPIXEL[operation] + decode + encode)
+
+
+def derivation_memory(size, operation):
+    """Estimated peak bytes of deriving operation's outputs from an image of size (width, height):
+    the decoded source, the output images, the encode buffer and the strip working memory."""
+    if size is None:
+        return 0
+    from texture_kernels import ROUGHNESS_STRIP_BYTES_PER_PIXEL, SSBUMP_STRIP_BYTES_PER_PIXEL, TILE_MEMORY_LIMIT
+    strip_bytes_per_pixel = {SSBUMP_NORMAL_HEIGHT: SSBUMP_STRIP_BYTES_PER_PIXEL, ROUGHNESS: ROUGHNESS_STRIP_BYTES_PER_PIXEL}[operation]
+    pixels = size[0] * size[1]
+    return pixels * DERIVATION_BYTES_PER_PIXEL[operation] + min(pixels * strip_bytes_per_pixel, TILE_MEMORY_LIMIT)
+
+
+def largest_first(costs):
+    """Keys of costs ordered by descending cost, ties in their original order."""
+    return sorted(costs, key=lambda key: -costs[key])
+
+
+def schedule_seconds(costs, workers):
+    """Wall time of running jobs of the given costs largest-first on workers, each taking the next job when free."""
+    finish_times = [0.0] * max(1, workers)
+    for cost in sorted(costs, reverse=True):
+        heapq.heappush(finish_times, heapq.heappop(finish_times) + cost)
+    return max(finish_times)
@@ -0,0 +1,151 @@
+import struct
+import numpy as np
+
+# Block format -> DDS FourCC and bytes per 4x4 block
+BLOCK_FORMATS = {
+    'BC1': (b'DXT1', 8),  # RGB, colour maps
+    'BC4': (b'ATI1', 8),  # one channel, roughness and height maps
+    'BC5': (b'ATI2', 16),  # two channels, the X and Y of normal maps
+}
+
+# Blocks encoded per numpy pass, so the per-pixel float intermediates stay small
+BLOCKS_PER_CHUNK = 16384
+
+DDSD_FLAGS = 0x1 | 0x2 | 0x4 | 0x1000 | 0x20000 | 0x80000  # caps, height, width, pixel format, mipmap count, linear size
+DDPF_FOURCC = 0x4
+DDSCAPS_TEXTURE, DDSCAPS_COMPLEX, DDSCAPS_MIPMAP = 0x1000, 0x8, 0x400000
+
+# BC4 index of the palette entry k/7 of the way from the low to the high endpoint: index 0 is the
+# high endpoint, 1 the low one and 2-7 the interpolated values from high to low
+_BC4_INDICES = np.array([1, 7, 6, 5, 4, 3, 2, 0], dtype=np.uint64)
+_BC4_SHIFTS = np.arange(16, dtype=np.uint64) * 3
+# BC1 index of the palette entry k/3 of the way from endpoint0 to endpoint1
+_BC1_INDICES = np.array([0, 2, 3, 1], dtype=np.uint32)
+_BC1_SHIFTS = np.arange(16, dtype=np.uint32) * 2
+
+
+def default_block_format(mode):
+    return 'BC4' if mode == 'L' else 'BC1'
+
+
+def image_blocks(pixels):
+    """(height, width, channels) uint8 pixels -> (blocks, 16, channels), edges repeated up to whole blocks."""
+    height, width, channels = pixels.shape
+    padded_height, padded_width = -(-height // 4) * 4, -(-width // 4) * 4
+    if (padded_height, padded_width) != (height, width):
+        pixels = np.pad(pixels, ((0, padded_height - height), (0, padded_width - width), (0, 0)), mode='edge')
+    blocks = pixels.reshape(padded_height // 4, 4, padded_width // 4, 4, channels).transpose(0, 2, 1, 3, 4)
+    return blocks.reshape(-1, 16, channels)
+
+
+def encode_bc4(values):
+    """(blocks, 16) uint8 -> (blocks, 8) uint8 BC4 blocks, with the block's extremes as endpoints."""
+    high = values.max(axis=1)
+    low = values.min(axis=1)
+    span = high.astype(np.float32) - low
+    steps = (values - low[:, None]).astype(np.float32) * (7 / np.maximum(span, 1))[:, None]
+    indices = _BC4_INDICES[np.rint(steps).astype(np.intp)]
+    # A flat block keeps index 0, the high endpoint, everywhere
+    indices[span == 0] = 0
+    bits = np.bitwise_or.reduce(indices << _BC4_SHIFTS, axis=1)
+
+    blocks = np.empty((len(values), 8), dtype=np.uint8)
+    blocks[:, 0] = high
+    blocks[:, 1] = low
+    blocks[:, 2:] = bits.astype('<u8').view(np.uint8).reshape(-1, 8)[:, :6]
+    return blocks
+
+
+def _to_565(colors):
+    colors = np.clip(np.rint(colors), 0, 255).astype(np.uint16)
+    return ((colors[:, 0] * 31 + 127) // 255) << 11 | ((colors[:, 1] * 63 + 127) // 255) << 5 | ((colors[:, 2] * 31 + 127) // 255)
+
+
+def unpack_565(values):
+    red, green, blue = (values >> 11) & 31, (values >> 5) & 63, values & 31
+    return np.stack([(red << 3) | (red >> 2), (green << 2) | (green >> 4), (blue << 3) | (blue >> 2)], axis=1).astype(np.float32)
+
+
+def encode_bc1(colors):
+    """(blocks, 16, 3) uint8 -> (blocks, 8) uint8 BC1 blocks, with endpoints on the principal axis of each block's colours."""
+    colors = colors.astype(np.float32)
+    mean = colors.mean(axis=1)
+    centered = colors - mean[:, None]
+    covariance = np.einsum('nki,nkj->nij', centered, centered)
+
+    # Power iteration from the covariance column of the channel that varies most
+    strongest = covariance.diagonal(axis1=1, axis2=2).argmax(axis=1)
+    axis = covariance[np.arange(len(colors)), :, strongest]
+    for _ in range(4):
+        axis = np.einsum('nij,nj->ni', covariance, axis)
+        axis /= np.maximum(np.linalg.norm(axis, axis=1, keepdims=True), 1e-12)
+    projections = np.einsum('nki,ni->nk', centered, axis)
+    color0 = _to_565(mean + axis * projections.max(axis=1)[:, None])
+    color1 = _to_565(mean + axis * projections.min(axis=1)[:, None])
+
+    # Four-colour mode needs color0 > color1; equal endpoints leave every index at 0, color0
+    swap = color0 < color1
+    color0, color1 = np.where(swap, color1, color0), np.where(swap, color0, color1)
+    endpoint0, endpoint1 = unpack_565(color0), unpack_565(color1)
+    # The palette is evenly spaced along the endpoint line, so the nearest entry follows from each
+    # colour's position along it: 0, 1/3, 2/3 and 1 of the way from endpoint0 are indices 0, 2, 3 and 1
+    line = endpoint1 - endpoint0
+    positions = np.einsum('nki,ni->nk', colors - endpoint0[:, None], line) / np.maximum((line * line).sum(axis=1), 1)[:, None]
+    steps = np.rint(np.clip(positions, 0, 1) * 3).astype(np.intp)
+    indices = _BC1_INDICES[steps]
+    indices[color0 == color1] = 0
+    bits = np.bitwise_or.reduce(indices << _BC1_SHIFTS, axis=1)
+
+    blocks = np.empty((len(colors), 8), dtype=np.uint8)
+    blocks[:, 0:2] = color0.astype('<u2').view(np.uint8).reshape(-1, 2)
+    blocks[:, 2:4] = color1.astype('<u2').view(np.uint8).reshape(-1, 2)
+    blocks[:, 4:8] = bits.astype('<u4').view(np.uint8).reshape(-1, 4)
+    return blocks
+
+
+def encode_level(pixels, block_format):
+    """Encodes one (height, width, channels) uint8 mip level into its BCn bytes."""
+    blocks = image_blocks(pixels)
+    encoded = []
+    for start in range(0, len(blocks), BLOCKS_PER_CHUNK):
+        chunk = blocks[start:start + BLOCKS_PER_CHUNK]
+        if block_format == 'BC1':
+            encoded.append(encode_bc1(chunk[:, :, :3]))
+        elif block_format == 'BC4':
+            encoded.append(encode_bc4(chunk[:, :, 0]))
+        else:
+            encoded.append(np.concatenate([encode_bc4(chunk[:, :, 0]), encode_bc4(chunk[:, :, 1])], axis=1))
+    return b''.join(chunk.tobytes() for chunk in encoded)
+
+
+def mip_levels(image):
+    """The image and its box-filtered halvings down to 1x1."""
+    from PIL import Image
+    levels = [image]
+    while image.width > 1 or image.height > 1:
+        image = image.resize((max(1, image.width // 2), max(1, image.height // 2)), Image.BOX)
+        levels.append(image)
+    return levels
+
+
+def dds_header(width, height, block_format, mip_count):
+    fourcc, block_bytes = BLOCK_FORMATS[block_format]
+    top_level_size = max(1, -(-width // 4)) * max(1, -(-height // 4)) * block_bytes
+    caps = DDSCAPS_TEXTURE | (DDSCAPS_COMPLEX | DDSCAPS_MIPMAP if mip_count > 1 else 0)
+    pixel_format = struct.pack('<II4s5I', 32, DDPF_FOURCC, fourcc, 0, 0, 0, 0, 0)
+    return b'DDS ' + struct.pack('<7I44x', 124, DDSD_FLAGS, height, width, top_level_size, 0, mip_count) + pixel_format + struct.pack('<5I', caps, 0, 0, 0, 0)
+
+
+def encode_dds(image, block_format=None, mipmaps=True):
+    """Encodes a PIL image as a block-compressed DDS file with a full mip chain, returned as bytes.
+
+    block_format is a key of BLOCK_FORMATS, by default BC4 for 'L' images and BC1 otherwise.
+    """
+    block_format = block_format or default_block_format(image.mode)
+    image = image.convert('L' if block_format == 'BC4' else 'RGB')
+    levels = mip_levels(image) if mipmaps else [image]
+    data = [dds_header(image.width, image.height, block_format, len(levels))]
+    for level in levels:
+        pixels = np.asarray(level)
+        data.append(encode_level(pixels.reshape(pixels.shape[0], pixels.shape[1], -1), block_format))
+    return b''.join(data)
@@ -0,0 +1,64 @@
+import os
+import threading
+
+SSBUMP_NORMAL_HEIGHT = "ssbump_normal_height"
+ROUGHNESS = "roughness"
+
+
+class DerivedTextureRegistry:
+    """Per-run registry of textures derived from a source texture, keyed by source path and operation.
+
+    The first request for a derivation starts it; every later request, whether the derivation is
+    still in flight or already finished, gets the same future back.
+    """
+
+    def __init__(self):
+        self.futures = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(source_path, operation):
+        return os.path.normcase(os.path.abspath(source_path)), operation
+
+    def derive(self, source_path, operation, submit):
+        """Returns the future of (source_path, operation), calling submit() to start it the first time."""
+        key = self.key(source_path, operation)
+        with self.lock:
+            future = self.futures.get(key)
+            if future is None:
+                future = submit()
+                self.futures[key] = future
+        return future
+
+    def get(self, source_path, operation):
+        """The future of (source_path, operation), or None when it was never requested."""
+        with self.lock:
+            return self.futures.get(self.key(source_path, operation))
+
+    def cancel_pending(self):
+        with self.lock:
+            futures = list(self.futures.values())
+        for future in futures:
+            future.cancel()
+
+    def __len__(self):
+        with self.lock:
+            return len(self.futures)
+
+
+def when_all_done(futures, callback):
+    """Calls callback() once every future in futures has finished, right away if there are none."""
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def on_done(_):
+        with lock:
+            remaining[0] -= 1
+            finished = remaining[0] == 0
+        if finished:
+            callback()
+
+    if not futures:
+        callback()
+    for future in futures:
+        future.add_done_callback(on_done)
@@ -0,0 +1,22 @@
+# Pillow save options per output profile and image format. 'balanced' is what Pillow does by
+# default, so it writes the same files as before profiles existed. DDS options go to
+# dds_encoder.encode_dds instead.
+ENCODER_PROFILES = {
+    'fast': {
+        'PNG': {'compress_level': 1},
+        'TGA': {'compression': None},
+        'DDS': {'mipmaps': False},
+    },
+    'balanced': {},
+    'archival': {
+        'PNG': {'compress_level': 9, 'optimize': True},
+        'TGA': {'compression': 'tga_rle'},
+        'JPEG': {'optimize': True},
+    },
+}
+DEFAULT_ENCODER_PROFILE = 'balanced'
+
+
+def encoder_options(profile, image_format):
+    """Keyword arguments for Image.save of an image_format file ('PNG', 'TGA', ...) written with profile."""
+    return ENCODER_PROFILES[profile].get(image_format, {})
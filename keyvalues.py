@@ -0,0 +1,237 @@
+import codecs
+import re
+from functools import lru_cache
+
+# Platform symbols that hold for the PC builds these materials are converted from
+DEFAULT_DEFINES = frozenset(['$win32', '$windows'])
+# DirectX level the '>=dx90' style blocks of a VMT are evaluated against
+DX_LEVEL = 95
+
+# One alternative per token kind, for the text between quotes and the files parse cannot split
+# at quotes: quoted string (the closing quote may be missing at the end of a line), comment,
+# brace, [conditional] and unquoted string. The first character tells the kinds apart again.
+_TOKEN = re.compile(r'"[^"\n]*"?|//[^\n]*|[{}]|\[[^\]\n]*\]|[^\s{}"\[]+')
+_DX_BLOCK = re.compile(r'(<=|>=|<|>)dx(\d+)(?:_\w+)?$')
+# Tokens of recurring texts between quoted strings, such as ' { ' or a comment, emptied when full
+BETWEEN_CACHE_SIZE = 4096
+_between_tokens = {}
+
+
+def evaluate_condition(condition, defines=DEFAULT_DEFINES):
+    """Whether a KeyValues conditional such as '[$WIN32]', '[!$X360]' or '[$OSX||$LINUX]' holds."""
+    for alternative in condition.strip('[] ').split('||'):
+        for term in alternative.split('&&'):
+            term = term.strip()
+            negated = term.startswith('!')
+            if (term.lstrip('!').lower() in defines) == negated:
+                break
+        else:
+            return True
+    return False
+
+
+# Conditionals repeat across files, so each is evaluated once per set of defines
+_condition_holds = lru_cache(maxsize=256)(evaluate_condition)
+
+
+def decode(data):
+    if isinstance(data, bytes):
+        # Same result as the utf-8-sig codec, whose BOM check runs in Python
+        if data.startswith(codecs.BOM_UTF8):
+            data = data[3:]
+        return data.decode('utf-8', 'replace')
+    return data
+
+
+def _flat_material(parts):
+    """The quoted strings of text split at quotes when it is a single block of quoted pairs, as most
+    VMTs are: the shader name, then keys and values alternating. None for anything else."""
+    if len(parts) < 7 or len(parts) % 4 != 3:
+        return None
+    strings = parts[1::2]
+    if (parts[2].strip() != '{' or parts[-1].strip() != '}' or parts[0].strip()
+            or ''.join(parts[4:-1:2]).strip() or '\n' in ''.join(strings)):
+        return None
+    return strings
+
+
+def parse(data, defines=DEFAULT_DEFINES):
+    """Parses KeyValues text or bytes into a list of (key, value) pairs.
+
+    A value is either a string or, for a nested block, another list of pairs. Pairs and blocks
+    followed by a conditional that does not hold for defines are left out.
+    """
+    return _parse_split(decode(data).split('"'), defines)
+
+
+def _parse_split(parts, defines):
+    # Splitting at the quotes yields every quoted string at C speed. A flat material needs nothing
+    # else; otherwise only the braces, comments and conditionals between the strings are tokenized.
+    # Files where that split goes wrong, such as an unterminated quote or a comment running into
+    # the next quote, take the tokenizer.
+    strings = _flat_material(parts)
+    if strings is not None:
+        return [(strings[0], list(zip(strings[1::2], strings[2::2])))]
+    # Conditionals are evaluated through a cache, which needs hashable defines
+    defines = frozenset(defines)
+    strings = parts[1::2]
+    if '\n' not in ''.join(strings):
+        if len(parts) % 2:
+            strings.append(None)
+        root = _parse_segments(zip(parts[0::2], strings), defines)
+        if root is not None:
+            return root
+    return _parse_segments([('"'.join(parts), None)], defines, tokenize=True)
+
+
+def _tokenize_between(between):
+    """Tokens of the text between two quoted strings, and whether a comment or conditional is still
+    open at its end. Cached, as the same few such texts recur in every VMT."""
+    if '//' in between or '[' in between:
+        line_end = between[between.rfind('\n') + 1:]
+        result = tuple(_TOKEN.findall(between)), '//' in line_end or line_end.rfind('[') > line_end.rfind(']')
+    else:
+        result = tuple(between.split()), False
+    if len(_between_tokens) >= BETWEEN_CACHE_SIZE:
+        _between_tokens.clear()
+    _between_tokens[between] = result
+    return result
+
+
+def _parse_segments(segments, defines, tokenize=False):
+    """Parses (text between quotes, quoted string after it) segments; the string is None when the
+    text is the rest of the file. Returns None when the text was not split at quotes correctly.
+    With tokenize, every segment goes through the tokenizer, for text that was not split at all."""
+    root = []
+    current = root
+    stack = []
+    key = None
+    # Conditionals follow the pair or block key they apply to
+    skip_next_block = False
+
+    for between, string in segments:
+        if not between.isspace():
+            if tokenize:
+                tokens = _TOKEN.findall(between)
+            else:
+                cached = _between_tokens.get(between)
+                if cached is None:
+                    cached = _tokenize_between(between)
+                tokens, left_open = cached
+                # A comment or conditional left open at the next quote would have swallowed it
+                if left_open and string is not None:
+                    return None
+
+            for token in tokens:
+                if token == '{':
+                    block = []
+                    if not skip_next_block:
+                        current.append((key if key is not None else '', block))
+                    stack.append(current)
+                    current = block
+                    key = None
+                    skip_next_block = False
+                    continue
+                if token == '}':
+                    if stack:
+                        current = stack.pop()
+                    key = None
+                    continue
+                first = token[0]
+                if first == '"':
+                    token = token[1:-1] if len(token) > 1 and token[-1] == '"' else token[1:]
+                elif first == '/' and token.startswith('//'):
+                    continue
+                elif first == '[':
+                    if not _condition_holds(token, defines):
+                        if key is not None:
+                            skip_next_block = True
+                        elif current:
+                            current.pop()
+                    continue
+                elif '{' in token or '}' in token:
+                    # A brace run into a word, which only the tokenizer splits apart
+                    return None
+                if key is None:
+                    key = token
+                else:
+                    current.append((key, token))
+                    key = None
+
+        if string is None:
+            continue
+        if key is None:
+            key = string
+        else:
+            current.append((key, string))
+            key = None
+
+    return root
+
+
+def to_dict(pairs):
+    """Turns parsed pairs into nested dicts with lower-cased keys; the last duplicate key wins."""
+    result = {}
+    for key, value in pairs:
+        result[key.lower()] = to_dict(value) if isinstance(value, list) else value
+    return result
+
+
+def dx_block_applies(key, dx_level=DX_LEVEL):
+    key = key.lower()
+    if 'dx' not in key:
+        return None
+    match = _DX_BLOCK.match(key)
+    if match is None:
+        return None
+    operator, level = match.group(1), int(match.group(2))
+    if operator == '>=':
+        return dx_level >= level
+    if operator == '>':
+        return dx_level > level
+    if operator == '<=':
+        return dx_level <= level
+    return dx_level < level
+
+
+# Block names repeat across files, so each is matched once per dx level
+_dx_block_holds = lru_cache(maxsize=256)(dx_block_applies)
+
+
+def material_parameters(pairs, dx_level=DX_LEVEL):
+    """Flattens the body of a material into a parameter dict.
+
+    Blocks such as '>=dx90' are merged in when they hold for dx_level and dropped when they do
+    not; every other block, like Proxies, stays a nested dict under its lower-cased name.
+    """
+    parameters = {}
+    for key, value in pairs:
+        if isinstance(value, list):
+            applies = _dx_block_holds(key, dx_level)
+            if applies is None:
+                parameters[key.lower()] = to_dict(value)
+            elif applies:
+                parameters.update(material_parameters(value, dx_level))
+        else:
+            parameters[key.lower()] = value
+    return parameters
+
+
+def parse_vmt(data, defines=DEFAULT_DEFINES, dx_level=DX_LEVEL):
+    """Returns the lower-cased shader name and the parameters of VMT text or bytes."""
+    parts = decode(data).split('"')
+    strings = _flat_material(parts)
+    if strings is not None:
+        # No blocks, so the parameters are the pairs themselves
+        return strings[0].lower(), dict(zip(map(str.lower, strings[1::2]), strings[2::2]))
+    for key, value in _parse_split(parts, defines):
+        if isinstance(value, list):
+            return key.lower(), material_parameters(value, dx_level)
+    return '', {}
+
+
+def load_vmt(path, defines=DEFAULT_DEFINES, dx_level=DX_LEVEL):
+    """Reads a VMT in one call and parses it with parse_vmt."""
+    with open(path, 'rb') as file:
+        data = file.read()
+    return parse_vmt(data, defines, dx_level)
@@ -0,0 +1,125 @@
+import os
+
+# Preference order when a texture name is resolved without an explicit extension
+DEFAULT_TEXTURE_EXTENSIONS = ['png', 'tga', 'jpg', 'jpeg', 'bmp']
+# Source 1 textures as shipped with the game, read by vtf_reader
+VTF_EXTENSION = 'vtf'
+
+
+def normalize_name(name):
+    """Lookup key of a texture or material name: forward slashes, no extension, lower case."""
+    return name.replace('\\', '/').strip().strip('/').lower()
+
+
+class MaterialIndex:
+    """In-memory index of a material tree, built with a single os.scandir walk.
+
+    Lookups are case-insensitive and take names the way VMTs write them, so 'Brick/Wall01'
+    resolves to brick/wall01.tga on a case-sensitive filesystem without touching the disk.
+    """
+
+    def __init__(self, root):
+        self.root = os.path.normpath(root)
+        self.prefix = os.path.join(self.root, '')
+        # normalized relative name without extension -> {extension: path}
+        self.entries = {}
+        # path -> [size, mtime_ns], filled on first use
+        self.signatures = {}
+        # Virtual files of the scan that a file on disk overrides
+        self.overridden = []
+
+    @classmethod
+    def scan(cls, root, virtual_files=()):
+        """Indexes the files under root. virtual_files are (path, signature) pairs of files served from
+        elsewhere as if they were under root, such as the files of a mounted VPK; a file on disk wins
+        and the virtual one is listed in overridden."""
+        index = cls(root)
+        virtual_paths = []
+        for path, signature in virtual_files:
+            index.add(path)
+            index.signatures[path] = signature
+            virtual_paths.append(path)
+        pending = [index.root]
+        while pending:
+            directory = pending.pop()
+            try:
+                with os.scandir(directory) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            pending.append(entry.path)
+                        else:
+                            index.add(entry.path)
+                            if index.signatures.pop(entry.path, None) is not None:
+                                index.overridden.append(entry.path)
+                            if os.name == 'nt':
+                                # Windows directory listings carry the stat result, so caching it costs nothing
+                                index.cache_signature(entry)
+            except OSError:
+                continue
+        # A file on disk whose name differs from the virtual one only in case replaced it in entries
+        for path in virtual_paths:
+            name, extension = index.key_for(path)
+            if index.entries[name][extension] != path:
+                index.overridden.append(path)
+        return index
+
+    def key_for(self, path):
+        # Scanned paths always start with the root, so the common case is a plain slice
+        if path.startswith(self.prefix):
+            relative_path = path[len(self.prefix):]
+        else:
+            relative_path = os.path.relpath(path, self.root)
+        name, extension = os.path.splitext(relative_path)
+        return normalize_name(name), extension[1:].lower()
+
+    def add(self, path):
+        name, extension = self.key_for(path)
+        self.entries.setdefault(name, {})[extension] = path
+
+    def cache_signature(self, entry):
+        try:
+            stat = entry.stat()
+        except OSError:
+            return
+        self.signatures[entry.path] = [stat.st_size, stat.st_mtime_ns]
+
+    def discard(self, path):
+        """Forgets a file that was moved or deleted, for example into the backup folder."""
+        name, extension = self.key_for(path)
+        extensions = self.entries.get(name)
+        if extensions is not None:
+            self.signatures.pop(extensions.pop(extension, None), None)
+            if not extensions:
+                del self.entries[name]
+
+    def files_with_extension(self, extension):
+        extension = extension.lower()
+        return [extensions[extension] for extensions in self.entries.values() if extension in extensions]
+
+    def vmt_files(self):
+        return self.files_with_extension('vmt')
+
+    def resolve(self, name, extensions=DEFAULT_TEXTURE_EXTENSIONS):
+        """Path of the first file named name with one of extensions, in preference order, or None."""
+        found = self.entries.get(normalize_name(name))
+        if found:
+            for extension in extensions:
+                path = found.get(extension.lower())
+                if path is not None:
+                    return path
+        return None
+
+    def signature(self, path):
+        """Size and modification time of an indexed file, stat'ed at most once, or None when it is not in the tree."""
+        name, extension = self.key_for(path)
+        indexed_path = self.entries.get(name, {}).get(extension)
+        if indexed_path is None:
+            return None
+        signature = self.signatures.get(indexed_path)
+        if signature is None:
+            try:
+                stat = os.stat(indexed_path)
+            except OSError:
+                return None
+            signature = self.signatures[indexed_path] = [stat.st_size, stat.st_mtime_ns]
+        return signature
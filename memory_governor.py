@@ -0,0 +1,83 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Share of the memory available at the start of a run that its texture tasks may reserve together
+DEFAULT_BUDGET_FRACTION = 0.5
+# Budget when the available memory cannot be read
+FALLBACK_BUDGET = 2 * 1024 ** 3
+
+
+def default_memory_budget():
+    try:
+        import psutil
+        return int(psutil.virtual_memory().available * DEFAULT_BUDGET_FRACTION)
+    except ImportError:
+        return FALLBACK_BUDGET
+
+
+class MemoryGovernor:
+    """A memory budget shared by the texture tasks of one run.
+
+    Each task reserves its estimated peak before decoding and waits while the reservation would
+    exceed the budget, so small textures run side by side and huge ones take turns. A task larger
+    than the whole budget runs once nothing else holds a reservation. With a manager, the budget
+    is shared by worker processes; it travels to them like ConversionControl.
+    """
+
+    def __init__(self, budget, manager=None):
+        self.budget = budget
+        stats = {'in_use': 0, 'peak': 0, 'tasks': 0, 'throttled': 0, 'wait_seconds': 0.0, 'max_wait_seconds': 0.0}
+        if manager is not None:
+            self.condition = manager.Condition()
+            self.stats = manager.dict(stats)
+        else:
+            self.condition = threading.Condition()
+            self.stats = stats
+
+    @contextmanager
+    def reserve(self, size, checkpoint=None):
+        """Holds size bytes of the budget for the with block. checkpoint, if given, is called
+        whenever a waiting task is woken, so a cancel can abandon the wait."""
+        size = min(size, self.budget)
+        start = time.perf_counter()
+        waited = False
+        while True:
+            with self.condition:
+                in_use = self.stats['in_use']
+                if not in_use or in_use + size <= self.budget:
+                    self.reserved(size, in_use, time.perf_counter() - start if waited else None)
+                    break
+                waited = True
+                self.condition.wait()
+            if checkpoint is not None:
+                checkpoint()
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.stats['in_use'] -= size
+                self.condition.notify_all()
+
+    def reserved(self, size, in_use, wait_seconds):
+        # Called with the condition held
+        self.stats['in_use'] = in_use + size
+        self.stats['peak'] = max(self.stats['peak'], in_use + size)
+        self.stats['tasks'] += 1
+        if wait_seconds is not None:
+            self.stats['throttled'] += 1
+            self.stats['wait_seconds'] += wait_seconds
+            self.stats['max_wait_seconds'] = max(self.stats['max_wait_seconds'], wait_seconds)
+
+    def wake(self):
+        """Wakes every waiting task, for instance to let it see a cancel."""
+        with self.condition:
+            self.condition.notify_all()
+
+    def summary(self):
+        stats = dict(self.stats)
+        return (
+            f"Memory budget {self.budget / 1024 ** 2:.0f} MB, peak reserved {stats['peak'] / 1024 ** 2:.0f} MB: "
+            f"{stats['throttled']} of {stats['tasks']} texture tasks waited, {stats['wait_seconds']:.1f}s in total, "
+            f"longest {stats['max_wait_seconds']:.1f}s"
+        )
@@ -9,15 +9,32 @@
 #
 
 import os
-import re
-from PIL import Image, ImageOps
-import numpy as np
+import keyvalues
+from vmat_emitters import bare_profile, write_vmat
+from PIL import Image
+from texture_kernels import derive_gray_maps
 
 # Directories
 base_materials_dir = 'C:/Desktop/vmt_converter_test/texture test/materials/'
 output_texture_dir = 'C:/Desktop/vmt_converter_test/converted_textures/'
 vmat_output_dir = 'C:/Desktop/vmt_converter_test/vmat_files/'
 
+# VMT shader -> VMAT profile; other shaders are marked for manual conversion
+shader_profiles = {
+    "lightmappedgeneric": bare_profile("complex", "csgo_complex.vfx"),
+    "vertexlitgeneric": bare_profile("simple", "csgo_simple.vfx"),
+}
+manual_conversion_profile = bare_profile("manual", "needs_manual_conversion")
+
+# Conversion type -> derive_gray_maps operation; types sharing an operation share its map
+CONVERSION_OPERATIONS = {
+    'roughness': 'invert',
+    'ao': 'autocontrast',
+    'height': 'equalize',
+    'ssbump_to_normal_height': 'invert',
+    'normal': 'rgb',
+}
+
 # Ensure directories exist
 os.makedirs(output_texture_dir, exist_ok=True)
 os.makedirs(vmat_output_dir, exist_ok=True)
@@ -25,68 +42,43 @@ os.makedirs(vmat_output_dir, exist_ok=True)
 def parse_vmt(vmt_content):
     attributes = {}
     proxies = {}
-    inside_proxies = False
-
-    for line in vmt_content:
-        line = line.strip()
 
-        if line.startswith("{") or line.startswith("}"):
+    for shader, body in keyvalues.parse(vmt_content):
+        if not isinstance(body, list):
             continue
+        attributes = keyvalues.material_parameters(body)
+        attributes["shader"] = shader.lower()
 
-        # Detect "Proxies" section
-        if line.lower() == '"proxies"':
-            inside_proxies = True
-            continue
-        elif inside_proxies and line.startswith("{"):
-            continue
-        elif inside_proxies and line.startswith("}"):
-            inside_proxies = False
-            continue
-
-        if inside_proxies:
-            match = re.match(r'"(\w+)"\s*{\s*"(\w+)"\s*"\$?(.*?)"', line, re.IGNORECASE)
-            if match:
-                proxy_type, var, value = match.groups()
-                if proxy_type not in proxies:
-                    proxies[proxy_type] = []
-                proxies[proxy_type].append({var: value})
-        else:
-            match = re.match(r'"?\$?(\w+)"?\s*"?([\w/._\[\]]+)"?', line, re.IGNORECASE)
-            if match:
-                key, value = match.groups()
-                attributes[key.lower()] = value
+        # Proxies can repeat, so they are read from the raw pairs rather than the merged dict
+        for key, block in body:
+            if key.lower() == "proxies" and isinstance(block, list):
+                for proxy_type, proxy_values in block:
+                    if isinstance(proxy_values, list):
+                        proxies.setdefault(proxy_type.lower(), []).append(keyvalues.to_dict(proxy_values))
+        break
 
     return attributes, proxies
 
-def convert_texture(texture_path, conversion_type):
-    output_path = texture_path.replace('.png', f'_{conversion_type}.tga')
+def convert_texture(texture_path, conversion_types):
+    """Writes one map per conversion type from a single decode of texture_path. Returns {conversion_type: output path}."""
     if not os.path.exists(texture_path):
         print(f"Error: {texture_path} does not exist.")
-        return None
+        return {}
 
     try:
-        img = Image.open(texture_path).convert('L')  # Grayscale conversion
+        with Image.open(texture_path) as img:
+            maps = derive_gray_maps(img, [CONVERSION_OPERATIONS[conversion_type] for conversion_type in conversion_types])
     except Exception as e:
         print(f"Failed to process {texture_path}: {e}")
-        return None
-
-    if conversion_type == 'roughness':
-        img = ImageOps.invert(img)
-    elif conversion_type == 'ao':
-        img = ImageOps.autocontrast(img)
-    elif conversion_type == 'height':
-        img = ImageOps.equalize(img)
-    elif conversion_type == 'ssbump_to_normal_height':
-        img = ImageOps.invert(img)
-    elif conversion_type == 'normal':
-        normal_img = Image.fromarray(np.dstack((img, img, img)))
-        normal_img.save(output_path)
-        print(f"Generated {output_path}")
-        return output_path
+        return {}
 
-    img.save(output_path)
-    print(f"Generated {output_path}")
-    return output_path
+    output_paths = {}
+    for conversion_type in conversion_types:
+        output_path = texture_path.replace('.png', f'_{conversion_type}.tga')
+        maps[CONVERSION_OPERATIONS[conversion_type]].save(output_path)
+        print(f"Generated {output_path}")
+        output_paths[conversion_type] = output_path
+    return output_paths
 
 def process_vmt_textures(vmt_file_path, attributes):
     base_texture = attributes.get("$basetexture", None)
@@ -104,14 +96,13 @@ def process_vmt_textures(vmt_file_path, attributes):
         "selfillum": None
     }
 
-    # Generate roughness map
-    roughness_path = convert_texture(base_texture_path, 'roughness')
-    used_textures["roughness"] = roughness_path
-
-    # Generate normal map from ssbump
+    # Roughness map, and the normal map of an ssbump, from one decode of the base texture
+    conversion_types = ['roughness']
     if attributes.get("$ssbump", None) == "1":
-        normal_path = convert_texture(base_texture_path, 'ssbump_to_normal_height')
-        used_textures["normal"] = normal_path
+        conversion_types.append('ssbump_to_normal_height')
+    output_paths = convert_texture(base_texture_path, conversion_types)
+    used_textures["roughness"] = output_paths.get('roughness')
+    used_textures["normal"] = output_paths.get('ssbump_to_normal_height')
 
     # Generate other maps if necessary
     if "$selfillum" in attributes:
@@ -122,30 +113,19 @@ def process_vmt_textures(vmt_file_path, attributes):
 def convert_vmt_to_vmat(vmt_file_path, used_textures, attributes, proxies):
     vmat_file_path = os.path.splitext(vmt_file_path)[0] + '.vmat'
     vmat_file_path = os.path.join(vmat_output_dir, os.path.basename(vmat_file_path))
-    vmat_content = []
-
-    shader_mapping = {
-        "lightmappedgeneric": "csgo_complex.vfx",
-        "vertexlitgeneric": "csgo_simple.vfx",
-    }
 
     shader_type = attributes.get("shader", "lightmappedgeneric").lower()
-    vmat_shader = shader_mapping.get(shader_type, "needs_manual_conversion")
-
-    vmat_content.append('"Layer0" {')
-    vmat_content.append(f'    "shader" "{vmat_shader}"')
-
-    if used_textures.get("basetexture"):
-        vmat_content.append(f'    "TextureColor" "{used_textures["basetexture"].replace("\\", "/")}"')
-    if used_textures.get("normal"):
-        vmat_content.append(f'    "TextureNormal" "{used_textures["normal"].replace("\\", "/")}"')
-    if used_textures.get("roughness"):
-        vmat_content.append(f'    "TextureRoughness" "{used_textures["roughness"].replace("\\", "/")}"')
-    if used_textures.get("selfillum"):
-        vmat_content.append(f'    "TextureSelfIllum" "{used_textures["selfillum"].replace("\\", "/")}"')
+    profile = shader_profiles.get(shader_type, manual_conversion_profile)
 
+    values = {
+        "color": used_textures.get("basetexture"),
+        "normal": used_textures.get("normal"),
+        "roughness": used_textures.get("roughness"),
+        "selfillum": used_textures.get("selfillum"),
+    }
+    values = {key: value.replace("\\", "/") for key, value in values.items() if value}
     if "$phong" in attributes and attributes["$phong"] == "1":
-        vmat_content.append(f'    "g_flMetalness" "0.5"')
+        values["metalness"] = "0.5"
 
     # Add proxies conversion if needed
     for proxy_type, proxy_values in proxies.items():
@@ -153,16 +133,13 @@ def convert_vmt_to_vmat(vmt_file_path, used_textures, attributes, proxies):
             # Add transformation logic
             pass
 
-    vmat_content.append('}')
-
-    with open(vmat_file_path, 'w') as vmat_file:
-        vmat_file.writelines(vmat_content)
+    write_vmat(vmat_file_path, profile.render(values))
 
     print(f"Converted {vmt_file_path} to {vmat_file_path}")
 
 def process_vmt_to_vmat(vmt_file_path):
-    with open(vmt_file_path, 'r') as vmt_file:
-        vmt_content = vmt_file.readlines()
+    with open(vmt_file_path, 'rb') as vmt_file:
+        vmt_content = vmt_file.read()
 
     attributes, proxies = parse_vmt(vmt_content)
     used_textures = process_vmt_textures(vmt_file_path, attributes)
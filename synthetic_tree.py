@@ -0,0 +1,248 @@
+import argparse
+import os
+import struct
+import zlib
+import numpy as np
+from PIL import Image
+
+DEFAULT_SHADER_MIX = {'lightmappedgeneric': 0.6, 'vertexlitgeneric': 0.3, 'unlitgeneric': 0.1}
+# Distinct noise images cycled through when saving textures, so large trees do not have to
+# generate fresh noise for every file
+NOISE_VARIANTS = 4
+VMTS_PER_FOLDER = 200
+# VTF image formats the synthetic VTFs can be written in
+VTF_IMAGE_FORMATS = {'DXT1': 13, 'DXT5': 15, 'BGRA8888': 12, 'BGR888': 3, 'I8': 5, 'IA88': 6}
+# Uncompressed VTF format -> PIL mode it is written from and the order its channels are stored in
+VTF_PIXEL_LAYOUTS = {'BGRA8888': ('RGBA', [2, 1, 0, 3]), 'BGR888': ('RGB', [2, 1, 0]), 'I8': ('L', [0]), 'IA88': ('LA', [0, 1])}
+VTF_THUMBNAIL_SIZE = 16
+VTF_ENVMAP_FLAG = 0x4000
+# Size at which the VPK writer starts a new numbered archive chunk
+VPK_CHUNK_BYTES = 200 * 1024 * 1024
+
+
+def parse_shader_mix(text):
+    """'lightmappedgeneric=0.6,vertexlitgeneric=0.4' -> {'lightmappedgeneric': 0.6, 'vertexlitgeneric': 0.4}"""
+    mix = {}
+    for item in text.split(','):
+        shader, weight = item.split('=')
+        mix[shader.strip().lower()] = float(weight)
+    return mix
+
+
+def vtf_level(image, image_format):
+    from dds_encoder import encode_bc1, encode_bc4, encode_level, image_blocks
+    if image_format == 'DXT1':
+        return encode_level(np.asarray(image.convert('RGB')), 'BC1')
+    if image_format in VTF_PIXEL_LAYOUTS:
+        mode, channels = VTF_PIXEL_LAYOUTS[image_format]
+        pixels = np.asarray(image.convert(mode)).reshape(image.height, image.width, -1)
+        return pixels[:, :, channels].tobytes()
+    pixels = np.asarray(image.convert('RGBA'))
+    blocks = image_blocks(pixels)
+    return np.concatenate([encode_bc4(blocks[:, :, 3]), encode_bc1(blocks[:, :, :3])], axis=1).tobytes()
+
+
+def vtf_bytes(image, image_format='DXT1', version=2, faces=1):
+    """A version 7.<version> VTF of a PIL image, with a DXT1 thumbnail and a full mip chain like vtex writes.
+
+    Versions 7.3 and later locate the thumbnail and the mips through a resource table. With 6 or 7 faces
+    the VTF is a cubemap with the image on every face; from 7.5 on cubemaps have no seventh, spherical face.
+    """
+    from dds_encoder import mip_levels
+    levels = mip_levels(image)
+    thumbnail = image.resize((min(VTF_THUMBNAIL_SIZE, image.width), min(VTF_THUMBNAIL_SIZE, image.height)))
+    flags, first_frame = 0, 0
+    if faces != 1:
+        if faces not in (6, 7) or faces == 7 and version >= 5:
+            raise ValueError(f"A version 7.{version} VTF cannot have {faces} faces.")
+        # Before 7.5, a first frame of -1 marks a cubemap without the spherical face
+        flags, first_frame = VTF_ENVMAP_FLAG, 0xFFFF if faces == 6 and version < 5 else 0
+    thumbnail_data = vtf_level(thumbnail, 'DXT1')
+    # Mips are stored smallest first, each with all of its faces
+    image_data = b''.join(vtf_level(level, image_format) * faces for level in reversed(levels))
+
+    layout = '<4s2II2HI2H4x3f4xfiBiBB'
+    header_size = 64 if version < 2 else 80
+    resources = b''
+    extra_fields = []
+    if version >= 2:
+        layout += 'H'
+        extra_fields.append(1)
+    if version >= 3:
+        layout += '3xI'
+        extra_fields.append(2)
+        resources = struct.pack('<3sBI3sBI', b'\x01\0\0', 0, header_size + 16, b'\x30\0\0', 0, header_size + 16 + len(thumbnail_data))
+    header = struct.pack(
+        layout, b'VTF\0', 7, version, header_size + len(resources), image.width, image.height, flags, 1, first_frame,
+        0.5, 0.5, 0.5, 1.0, VTF_IMAGE_FORMATS[image_format], len(levels), 13, thumbnail.width, thumbnail.height, *extra_fields,
+    )
+    return header.ljust(header_size, b'\0') + resources + thumbnail_data + image_data
+
+
+def pack_vpk(folder, dir_path, prefix='materials/', chunk_bytes=VPK_CHUNK_BYTES, version=2, preload_bytes=0):
+    """Packs every file under folder into a version 1 or 2 VPK at dir_path (a ..._dir.vpk), under prefix.
+    VMTs are stored in the _dir.vpk itself and everything else in numbered chunks, as the game's VPKs do.
+    The first preload_bytes of every chunked file are stored in its directory entry instead."""
+    tree = {}
+    for directory, _, names in os.walk(folder):
+        for name in names:
+            path = os.path.join(directory, name)
+            relative = prefix + os.path.relpath(path, folder).replace('\\', '/').lower()
+            parent, _, file_name = relative.rpartition('/')
+            stem, dot, extension = file_name.rpartition('.')
+            if not dot:
+                stem, extension = extension, ' '
+            tree.setdefault(extension, {}).setdefault(parent or ' ', []).append((stem, path))
+
+    base = dir_path[:-len('_dir.vpk')]
+    dir_data, chunk_index, chunk = [], 0, None
+    dir_data_size = chunk_size = 0
+    tree_bytes = []
+    try:
+        for extension, folders in tree.items():
+            tree_bytes.append(extension.encode() + b'\0')
+            for parent, files in folders.items():
+                tree_bytes.append(parent.encode() + b'\0')
+                for stem, path in files:
+                    with open(path, 'rb') as file:
+                        data = file.read()
+                    crc, preload = zlib.crc32(data), b''
+                    if extension == 'vmt':
+                        archive_index, offset = 0x7FFF, dir_data_size
+                        dir_data.append(data)
+                        dir_data_size += len(data)
+                    else:
+                        preload, data = data[:preload_bytes], data[preload_bytes:]
+                        if chunk is None or chunk_size + len(data) > chunk_bytes:
+                            if chunk is not None:
+                                chunk.close()
+                                chunk_index += 1
+                            chunk = open(f"{base}_{chunk_index:03d}.vpk", 'wb')
+                            chunk_size = 0
+                        archive_index, offset = chunk_index, chunk_size
+                        chunk.write(data)
+                        chunk_size += len(data)
+                    tree_bytes.append(stem.encode() + b'\0')
+                    tree_bytes.append(struct.pack('<IHHIIH', crc, len(preload), archive_index, offset, len(data), 0xFFFF) + preload)
+                tree_bytes.append(b'\0')
+            tree_bytes.append(b'\0')
+        tree_bytes.append(b'\0')
+    finally:
+        if chunk is not None:
+            chunk.close()
+
+    tree_data = b''.join(tree_bytes)
+    with open(dir_path, 'wb') as file:
+        if version == 1:
+            file.write(struct.pack('<3I', 0x55AA1234, 1, len(tree_data)))
+        else:
+            file.write(struct.pack('<3I4I', 0x55AA1234, 2, len(tree_data), dir_data_size, 0, 0, 0))
+        file.write(tree_data)
+        file.writelines(dir_data)
+
+
+def vmt_text(shader, base_texture, bumpmap, index):
+    lines = [f'"{shader}"', '{', f'\t"$basetexture" "{base_texture}"']
+    if bumpmap:
+        lines.append(f'\t"$bumpmap" "{bumpmap}"')
+        lines.append('\t"$ssbump" "1"')
+    lines.append('\t"$surfaceprop" "concrete"')
+    if index % 10 == 0:
+        lines += ['\t"Proxies"', '\t{', '\t\t"TextureScroll" { "texturescrollvar" "$basetexturetransform" "texturescrollrate" "0.1" }', '\t}']
+    lines.append('}')
+    return '\n'.join(lines) + '\n'
+
+
+def generate_tree(root, vmt_count=1000, shader_mix=None, ssbump_ratio=0.3, shared_texture_ratio=0.5,
+                  texture_size=256, texture_format='tga', seed=0):
+    """Writes a material tree of vmt_count VMTs and their textures under root and describes it.
+
+    shared_texture_ratio is the fraction of VMTs that reuse a base texture another VMT already
+    references; ssbump_ratio is the fraction of VMTs with an ssbump, shared along with the texture.
+    """
+    rng = np.random.default_rng(seed)
+    shader_mix = shader_mix or DEFAULT_SHADER_MIX
+    shaders = list(shader_mix)
+    weights = np.array([shader_mix[shader] for shader in shaders], dtype=np.float64)
+    weights /= weights.sum()
+
+    texture_count = max(1, min(vmt_count, round(vmt_count * (1 - shared_texture_ratio))))
+    noise = [rng.integers(0, 256, (texture_size, texture_size, 3), dtype=np.uint8) for _ in range(NOISE_VARIANTS)]
+    # The first texture_count VMTs each get their own texture, the rest reuse one of them
+    texture_ids = np.concatenate([np.arange(texture_count), rng.integers(0, texture_count, vmt_count - texture_count)])
+    rng.shuffle(texture_ids)
+    has_ssbump = rng.random(texture_count) < ssbump_ratio
+
+    summary = {'vmts': vmt_count, 'textures': 0, 'ssbumps': 0, 'bytes': 0, 'shaders': {}}
+    written_textures = set()
+
+    def save_texture(texture_name, pixels):
+        path = os.path.join(root, f"{texture_name}.{texture_format}")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if texture_format == 'vtf':
+            with open(path, 'wb') as file:
+                file.write(vtf_bytes(Image.fromarray(pixels)))
+        else:
+            Image.fromarray(pixels).save(path)
+        summary['bytes'] += os.path.getsize(path)
+
+    for index in range(vmt_count):
+        texture_id = int(texture_ids[index])
+        texture_name = f"textures/set{texture_id // VMTS_PER_FOLDER}/texture{texture_id}"
+        bumpmap = f"{texture_name}_height-ssbump" if has_ssbump[texture_id] else None
+        if texture_id not in written_textures:
+            written_textures.add(texture_id)
+            save_texture(texture_name, noise[texture_id % NOISE_VARIANTS])
+            summary['textures'] += 1
+            if bumpmap:
+                save_texture(bumpmap, noise[(texture_id + 1) % NOISE_VARIANTS])
+                summary['ssbumps'] += 1
+
+        shader = shaders[rng.choice(len(shaders), p=weights)]
+        summary['shaders'][shader] = summary['shaders'].get(shader, 0) + 1
+        vmt_path = os.path.join(root, f"set{index // VMTS_PER_FOLDER}", f"material{index}.vmt")
+        os.makedirs(os.path.dirname(vmt_path), exist_ok=True)
+        text = vmt_text(shader, texture_name, bumpmap, index)
+        with open(vmt_path, 'w') as file:
+            file.write(text)
+        summary['bytes'] += len(text)
+
+    return summary
+
+
+def add_tree_arguments(parser):
+    parser.add_argument("--vmts", type=int, default=1000, help="number of VMT files (default: 1000)")
+    parser.add_argument("--shader-mix", type=parse_shader_mix, default=DEFAULT_SHADER_MIX,
+                        help="weighted VMT shaders, e.g. lightmappedgeneric=0.6,vertexlitgeneric=0.4")
+    parser.add_argument("--ssbump-ratio", type=float, default=0.3, help="fraction of textures with an ssbump (default: 0.3)")
+    parser.add_argument("--shared-ratio", type=float, default=0.5, help="fraction of VMTs reusing another VMT's texture (default: 0.5)")
+    parser.add_argument("--texture-size", type=int, default=256, help="texture edge length in pixels (default: 256)")
+    parser.add_argument("--texture-format", default="tga", help="texture file format, vtf writes DXT1 VTFs (default: tga)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed, the same seed gives the same tree")
+
+
+def tree_arguments(args):
+    return {
+        'vmt_count': args.vmts,
+        'shader_mix': args.shader_mix,
+        'ssbump_ratio': args.ssbump_ratio,
+        'shared_texture_ratio': args.shared_ratio,
+        'texture_size': args.texture_size,
+        'texture_format': args.texture_format,
+        'seed': args.seed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic material tree to benchmark the converters on.")
+    parser.add_argument("root", help="folder to write the tree into")
+    add_tree_arguments(parser)
+    args = parser.parse_args()
+
+    summary = generate_tree(args.root, **tree_arguments(args))
+    print(f"Wrote {summary['vmts']} VMTs, {summary['textures']} textures and {summary['ssbumps']} ssbumps "
+          f"({summary['bytes'] / 1e6:.1f} MB) to {args.root}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import os
+import tarfile
+
+import pytest
+
+import backup_store
+from backup_store import list_runs, load_run_index, open_backup, restore_run
+
+ORIGINALS = {
+    'brick/wall01.vmt': b'"LightmappedGeneric" { "$basetexture" "brick/wall01" }\n',
+    'brick/wall02.vmt': b'"LightmappedGeneric" { "$basetexture" "brick/wall02" }\n',
+    'brick/wall01_height-ssbump.tga': bytes(range(256)) * 4,
+    # Same content as brick/wall01.vmt, in another directory
+    'concrete/floor01.vmt': b'"LightmappedGeneric" { "$basetexture" "brick/wall01" }\n',
+}
+
+
+def write_tree(folder, files):
+    for relative_path, data in files.items():
+        path = os.path.join(folder, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as file:
+            file.write(data)
+
+
+def read_tree(folder):
+    files = {}
+    for directory, _, names in os.walk(folder):
+        for name in names:
+            path = os.path.join(directory, name)
+            with open(path, 'rb') as file:
+                files[os.path.relpath(path, folder).replace('\\', '/')] = file.read()
+    return files
+
+
+def back_up(mode, tree, backup, files, run_name=None):
+    store = open_backup(mode, str(backup), run_name)
+    for relative_path in files:
+        store.add(os.path.join(tree, relative_path), relative_path)
+    store.close()
+    return store.run_name
+
+
+@pytest.mark.parametrize('mode', ['store', 'archive'])
+def test_round_trip(tmp_path, mode):
+    tree = tmp_path / 'materials'
+    write_tree(tree, ORIGINALS)
+    run_name = back_up(mode, tree, tmp_path / 'backup', ORIGINALS)
+
+    assert read_tree(tree) == {}
+    assert list_runs(str(tmp_path / 'backup')) == [run_name]
+    assert restore_run(str(tmp_path / 'backup'), run_name, str(tmp_path / 'restored')) == len(ORIGINALS)
+    assert read_tree(tmp_path / 'restored') == ORIGINALS
+
+
+def test_store_keeps_duplicate_content_once(tmp_path):
+    tree = tmp_path / 'materials'
+    write_tree(tree, ORIGINALS)
+    backup = tmp_path / 'backup'
+    first = back_up('store', tree, backup, ORIGINALS)
+    # A second run of the same files adds no blobs
+    write_tree(tree, ORIGINALS)
+    second = back_up('store', tree, backup, ORIGINALS)
+
+    blobs = read_tree(backup / backup_store.OBJECTS_FOLDER)
+    assert sorted(blobs.values()) == sorted(set(ORIGINALS.values()))
+    index = load_run_index(str(backup), first)['files']
+    assert index['brick/wall01.vmt']['sha256'] == index['concrete/floor01.vmt']['sha256']
+    for run_name in (first, second):
+        assert restore_run(str(backup), run_name, str(tmp_path / run_name)) == len(ORIGINALS)
+        assert read_tree(tmp_path / run_name) == ORIGINALS
+
+
+def test_archive_stores_duplicate_content_as_links(tmp_path):
+    tree = tmp_path / 'materials'
+    write_tree(tree, ORIGINALS)
+    backup = tmp_path / 'backup'
+    run_name = back_up('archive', tree, backup, ORIGINALS)
+
+    with tarfile.open(backup / f'backup-{run_name}.tar.gz', 'r:gz') as archive:
+        members = {member.name: member for member in archive.getmembers()}
+    assert members['brick/wall01.vmt'].isfile()
+    assert members['concrete/floor01.vmt'].islnk()
+    assert members['concrete/floor01.vmt'].linkname == 'brick/wall01.vmt'
+
+    restore_run(str(backup), run_name, str(tmp_path / 'restored'))
+    restored = tmp_path / 'restored' / 'concrete' / 'floor01.vmt'
+    # Restored as an independent copy, not a hard link
+    assert restored.read_bytes() == ORIGINALS['concrete/floor01.vmt']
+    assert restored.stat().st_nlink == 1
+
+
+@pytest.mark.parametrize('mode', ['store', 'archive'])
+def test_two_runs_in_the_same_second(tmp_path, monkeypatch, mode):
+    times = iter([1700000000.25, 1700000000.75])
+    monkeypatch.setattr(backup_store.time, 'time', lambda: next(times))
+    first_name, second_name = backup_store.new_run_name(), backup_store.new_run_name()
+    monkeypatch.undo()
+    backup = tmp_path / 'backup'
+    first_files = {'brick/wall01.vmt': ORIGINALS['brick/wall01.vmt']}
+    second_files = {'brick/wall01.vmt': ORIGINALS['brick/wall02.vmt']}
+
+    write_tree(tmp_path / 'first', first_files)
+    first = back_up(mode, tmp_path / 'first', backup, first_files, first_name)
+    write_tree(tmp_path / 'second', second_files)
+    second = back_up(mode, tmp_path / 'second', backup, second_files, second_name)
+
+    assert first[:15] == second[:15] and first != second
+    assert list_runs(str(backup)) == [first, second]
+    restore_run(str(backup), first, str(tmp_path / 'restored-first'))
+    restore_run(str(backup), second, str(tmp_path / 'restored-second'))
+    assert read_tree(tmp_path / 'restored-first') == first_files
+    assert read_tree(tmp_path / 'restored-second') == second_files
+
+
+def test_empty_run_writes_nothing(tmp_path):
+    backup = tmp_path / 'backup'
+    for mode in ('store', 'archive'):
+        open_backup(mode, str(backup)).close()
+    assert not backup.exists()
+
+
+def test_restore_refuses_paths_outside_the_target(tmp_path):
+    backup = tmp_path / 'backup'
+    write_tree(tmp_path / 'materials', {'wall.vmt': b'x'})
+    run_name = back_up('store', tmp_path / 'materials', backup, ['wall.vmt'])
+    index = load_run_index(str(backup), run_name)
+    index['files'] = {'../escaped.vmt': index['files']['wall.vmt']}
+    backup_store.write_run_index(str(backup), run_name, index)
+
+    with pytest.raises(ValueError):
+        restore_run(str(backup), run_name, str(tmp_path / 'restored'))
+    assert not (tmp_path / 'escaped.vmt').exists()
+
+
+@pytest.mark.parametrize('mode', ['store', 'archive'])
+def test_conversion_round_trip(tmp_path, mode):
+    from conversion_engine import convert_materials
+    from synthetic_tree import generate_tree
+    tree = tmp_path / 'materials'
+    generate_tree(str(tree), vmt_count=6, ssbump_ratio=0.5, texture_size=16)
+    vmts = {path: data for path, data in read_tree(tree).items() if path.endswith('.vmt')}
+    backup = tmp_path / 'backup'
+    backup.mkdir()
+
+    plan = convert_materials(str(tree), str(backup), 'tga', True, True, True, True, True, 128, 'thread', backup_mode=mode)
+    assert plan.converted == 6
+    assert not any(path.endswith('.vmt') for path in read_tree(tree))
+    run_name, = list_runs(str(backup))
+    restore_run(str(backup), run_name, str(tmp_path / 'restored'))
+    restored = read_tree(tmp_path / 'restored')
+    assert {path: data for path, data in restored.items() if path.endswith('.vmt')} == vmts
@@ -0,0 +1,166 @@
+import json
+import os
+from concurrent.futures import BrokenExecutor, ThreadPoolExecutor
+
+import pytest
+
+import conversion_engine
+from conversion_engine import convert_materials, plan_conversion
+from conversion_manifest import MANIFEST_FILE
+from synthetic_tree import generate_tree
+
+
+def convert(tree, backup, **options):
+    settings = dict(texture_format='tga', overwrite_vmat=True, overwrite_tga=True, generate_normal=True, generate_height=True,
+                    generate_roughness=True, darkness_value=128, backend='thread')
+    settings.update(options)
+    return convert_materials(str(tree), str(backup), **settings)
+
+
+def plan(tree, darkness_value=128):
+    return plan_conversion(str(tree), 'tga', True, True, True, darkness_value)
+
+
+def restore_backups(tree, backup):
+    """Moves the backed up VMTs and ssbumps back into the tree, keeping their modification times."""
+    for directory, _, names in os.walk(backup):
+        for name in names:
+            path = os.path.join(directory, name)
+            os.replace(path, os.path.join(tree, os.path.relpath(path, backup)))
+
+
+def manifest_keys(tree):
+    with open(os.path.join(tree, MANIFEST_FILE), encoding='utf-8') as file:
+        return set(json.load(file)['entries'])
+
+
+def vmts_referencing(tree, texture_name):
+    found = set()
+    for directory, _, names in os.walk(tree):
+        for name in names:
+            if name.endswith('.vmt'):
+                path = os.path.join(directory, name)
+                with open(path) as file:
+                    if f'"{texture_name}"' in file.read():
+                        found.add(os.path.relpath(path, tree).replace('\\', '/'))
+    return found
+
+
+@pytest.fixture
+def tree(tmp_path):
+    root = tmp_path / 'materials'
+    generate_tree(str(root), vmt_count=12, ssbump_ratio=0.5, texture_size=16)
+    backup = tmp_path / 'backup'
+    backup.mkdir()
+    return root, backup
+
+
+def test_unchanged_rerun_is_skipped(tree):
+    root, backup = tree
+    first = convert(root, backup)
+    assert first.converted == 12
+    restore_backups(root, backup)
+
+    rerun = plan(root)
+    assert rerun.found == 12
+    assert rerun.vmt_files == []
+
+
+def test_touched_texture_is_reconverted(tree):
+    root, backup = tree
+    convert(root, backup)
+    restore_backups(root, backup)
+
+    texture = root / 'textures' / 'set0' / 'texture0.tga'
+    stat = texture.stat()
+    os.utime(texture, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    rerun = plan(root)
+    expected = vmts_referencing(root, 'textures/set0/texture0')
+    assert expected
+    assert {os.path.relpath(path, root).replace('\\', '/') for path in rerun.vmt_files} == expected
+
+
+def test_changed_settings_reconvert_everything(tree):
+    root, backup = tree
+    convert(root, backup)
+    restore_backups(root, backup)
+
+    assert len(plan(root, darkness_value=64).vmt_files) == 12
+
+
+def test_failed_ssbump_derivation_is_not_recorded(tree):
+    root, backup = tree
+    ssbump = next(root.glob('textures/*/*-ssbump.tga'))
+    ssbump.write_bytes(b'not an image')
+    failed = vmts_referencing(root, os.path.relpath(ssbump, root).replace('\\', '/')[:-len('.tga')])
+    assert failed
+
+    # The VMATs are still written, without the maps of the broken ssbump
+    assert convert(root, backup).converted == 12
+    recorded = manifest_keys(root)
+    assert not recorded & failed
+    assert len(recorded) == 12 - len(failed)
+
+
+def test_worker_exception_fails_only_its_vmt(tree, monkeypatch):
+    root, backup = tree
+    original = conversion_engine.worker_thread
+
+    def worker_thread(vmt_file, *args):
+        if vmt_file.endswith('material0.vmt'):
+            raise RuntimeError("worker died")
+        return original(vmt_file, *args)
+
+    monkeypatch.setattr(conversion_engine, 'worker_thread', worker_thread)
+    assert convert(root, backup).converted == 11
+    assert 'set0/material0.vmt' not in manifest_keys(root)
+
+
+def test_failed_ssbump_task_still_writes_the_vmats(tree, monkeypatch):
+    root, backup = tree
+
+    def ssbump_worker(*args):
+        raise RuntimeError("worker died")
+
+    monkeypatch.setattr(conversion_engine, 'ssbump_worker', ssbump_worker)
+    with_ssbump = set()
+    for path in root.glob('textures/*/*-ssbump.tga'):
+        with_ssbump |= vmts_referencing(root, os.path.relpath(path, root).replace('\\', '/')[:-len('.tga')])
+    assert convert(root, backup).converted == 12
+    assert not manifest_keys(root) & with_ssbump
+
+
+def test_broken_executor_ends_the_run(tree, monkeypatch):
+    root, backup = tree
+
+    # Breaks after every derivation and a few of the VMTs were submitted
+    breaking_point = len(plan(root).derivation_costs) + 4
+
+    class BreakingExecutor(ThreadPoolExecutor):
+        submitted = 0
+
+        def submit(self, *args):
+            BreakingExecutor.submitted += 1
+            if BreakingExecutor.submitted > breaking_point:
+                raise BrokenExecutor("A worker process was killed")
+            return super().submit(*args)
+
+    monkeypatch.setattr(conversion_engine, 'create_executor', lambda backend, trace_dir=None: BreakingExecutor(2))
+    result = convert(root, backup)
+    assert 0 < result.converted < 12
+    assert len(manifest_keys(root)) <= result.converted
+
+
+def test_relative_folders(tree, monkeypatch):
+    root, backup = tree
+    monkeypatch.chdir(root.parent)
+    assert convert('materials', 'backup').converted == 12
+    vmats = {os.path.relpath(os.path.join(directory, name), root)
+             for directory, _, names in os.walk(root.parent) for name in names if name.endswith('.vmat')}
+    assert vmats == {os.path.join('set0', f'material{index}.vmat') for index in range(12)}
+
+
+def test_vmat_path_for():
+    base_path = os.path.join(os.sep, 'game', 'materials')
+    assert conversion_engine.vmat_path_for(os.path.join(base_path, 'brick', 'Wall.VMT'), base_path) == os.path.join(base_path, 'brick', 'Wall.vmat')
+    assert conversion_engine.vmat_path_for(os.path.join(base_path, 'a.vmt.d', 'b.vmt'), base_path) == os.path.join(base_path, 'a.vmt.d', 'b.vmat')
@@ -0,0 +1,201 @@
+import io
+import struct
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import dds_encoder
+from benchmark import synthetic_maps
+from dds_encoder import BLOCK_FORMATS, encode_dds, image_blocks, mip_levels
+
+HEADER_SIZE = 128
+# Root mean square error of BC1 on smooth colour images, in 0-255 levels
+BC1_RMSE_CEILING = 4.0
+
+
+def gradient(width, height):
+    x, y = np.meshgrid(np.linspace(0, 255, width), np.linspace(0, 255, height))
+    return Image.fromarray(np.dstack([x, y, (x + y) / 2]).astype(np.uint8))
+
+
+def noise(width, height, seed=0):
+    return Image.fromarray(np.random.default_rng(seed).integers(0, 256, (height, width, 3), dtype=np.uint8))
+
+
+def mip_sizes(width, height):
+    sizes = [(width, height)]
+    while width > 1 or height > 1:
+        width, height = max(1, width // 2), max(1, height // 2)
+        sizes.append((width, height))
+    return sizes
+
+
+def decode_bc4(blocks):
+    """(blocks, 8) uint8 -> (blocks, 16) values, both palette modes."""
+    e0, e1 = blocks[:, 0].astype(np.float64), blocks[:, 1].astype(np.float64)
+    eight = np.stack([e0, e1] + [((7 - k) * e0 + k * e1) / 7 for k in range(1, 7)], axis=1)
+    six = np.stack([e0, e1] + [((5 - k) * e0 + k * e1) / 5 for k in range(1, 5)]
+                   + [np.zeros_like(e0), np.full_like(e0, 255)], axis=1)
+    palette = np.rint(np.where((e0 > e1)[:, None], eight, six))
+    bits = np.zeros(len(blocks), dtype=np.uint64)
+    bits.view(np.uint8).reshape(-1, 8)[:, :6] = blocks[:, 2:]
+    indices = (bits[:, None] >> (np.arange(16, dtype=np.uint64) * 3)) & 7
+    return np.take_along_axis(palette, indices.astype(np.intp), axis=1)
+
+
+def decode_bc1(blocks):
+    """(blocks, 8) uint8 -> (blocks, 16, 3) colours, both palette modes."""
+    c0 = blocks[:, 0:2].copy().view('<u2')[:, 0].astype(np.int64)
+    c1 = blocks[:, 2:4].copy().view('<u2')[:, 0].astype(np.int64)
+
+    def rgb(value):
+        r, g, b = value >> 11 & 31, value >> 5 & 63, value & 31
+        return np.stack([r * 255 / 31, g * 255 / 63, b * 255 / 31], axis=1)
+
+    p0, p1 = rgb(c0), rgb(c1)
+    four = np.stack([p0, p1, (2 * p0 + p1) / 3, (p0 + 2 * p1) / 3], axis=1)
+    three = np.stack([p0, p1, (p0 + p1) / 2, np.zeros_like(p0)], axis=1)
+    palette = np.rint(np.where((c0 > c1)[:, None, None], four, three))
+    bits = blocks[:, 4:8].copy().view('<u4')[:, 0].astype(np.int64)
+    indices = (bits[:, None] >> (np.arange(16) * 2)) & 3
+    return np.take_along_axis(palette, indices[:, :, None], axis=1)
+
+
+def decode_level(data, block_format, width, height):
+    """BCn bytes of one level -> (padded height, padded width, channels) pixels."""
+    block_bytes = BLOCK_FORMATS[block_format][1]
+    blocks = np.frombuffer(data, dtype=np.uint8).reshape(-1, block_bytes)
+    if block_format == 'BC1':
+        values = decode_bc1(blocks)
+    elif block_format == 'BC4':
+        values = decode_bc4(blocks)[:, :, None]
+    else:
+        values = np.stack([decode_bc4(blocks[:, :8]), decode_bc4(blocks[:, 8:])], axis=2)
+    rows, columns = -(-height // 4), -(-width // 4)
+    pixels = values.reshape(rows, columns, 4, 4, -1).transpose(0, 2, 1, 3, 4).reshape(rows * 4, columns * 4, -1)
+    return pixels
+
+
+def decode_dds(data):
+    """Header fields and the decoded (height, width, channels) pixels of every level of a DDS file."""
+    assert data[:4] == b'DDS '
+    size, flags, height, width, linear_size, depth, mip_count = struct.unpack_from('<7I', data, 4)
+    pixel_format = struct.unpack_from('<II4s5I', data, 76)
+    caps = struct.unpack_from('<5I', data, 108)
+    block_format = next(name for name, (fourcc, _) in BLOCK_FORMATS.items() if fourcc == pixel_format[2])
+    block_bytes = BLOCK_FORMATS[block_format][1]
+    header = dict(size=size, flags=flags, height=height, width=width, linear_size=linear_size, depth=depth,
+                  mip_count=mip_count, pixel_format=pixel_format, caps=caps, block_format=block_format)
+    levels = []
+    offset = HEADER_SIZE
+    for level_width, level_height in mip_sizes(width, height)[:mip_count]:
+        length = -(-level_width // 4) * -(-level_height // 4) * block_bytes
+        pixels = decode_level(data[offset:offset + length], block_format, level_width, level_height)
+        levels.append(pixels[:level_height, :level_width])
+        offset += length
+    assert offset == len(data)
+    return header, levels
+
+
+def source_levels(image, block_format):
+    channels = {'BC1': 3, 'BC4': 1, 'BC5': 2}[block_format]
+    image = image.convert('L' if block_format == 'BC4' else 'RGB')
+    return [np.asarray(level).reshape(level.height, level.width, -1)[:, :, :channels] for level in mip_levels(image)]
+
+
+def assert_within_block_bound(source, decoded):
+    """Every pixel within 1/14 of its block's range, plus rounding, in every channel."""
+    source_blocks = image_blocks(source).astype(np.float64)
+    error_blocks = image_blocks(np.abs(source.astype(np.int16) - decoded).astype(np.uint8))
+    block_range = source_blocks.max(axis=1) - source_blocks.min(axis=1)
+    assert (error_blocks.max(axis=1) <= block_range / 14 + 1).all()
+
+
+@pytest.mark.parametrize('block_format', ['BC1', 'BC4', 'BC5'])
+@pytest.mark.parametrize('mipmaps', [True, False])
+def test_header_fields(block_format, mipmaps):
+    data = encode_dds(gradient(20, 12), block_format, mipmaps=mipmaps)
+    header, levels = decode_dds(data)
+    fourcc, block_bytes = BLOCK_FORMATS[block_format]
+    assert header['size'] == 124
+    assert header['flags'] == dds_encoder.DDSD_FLAGS
+    assert (header['width'], header['height']) == (20, 12)
+    assert header['linear_size'] == 5 * 3 * block_bytes
+    assert header['mip_count'] == (5 if mipmaps else 1)
+    assert header['pixel_format'] == (32, dds_encoder.DDPF_FOURCC, fourcc, 0, 0, 0, 0, 0)
+    expected_caps = dds_encoder.DDSCAPS_TEXTURE
+    if mipmaps:
+        expected_caps |= dds_encoder.DDSCAPS_COMPLEX | dds_encoder.DDSCAPS_MIPMAP
+    assert header['caps'] == (expected_caps, 0, 0, 0, 0)
+    assert len(levels) == header['mip_count']
+
+    # Pillow reads the same file back at the same size
+    with Image.open(io.BytesIO(data)) as image:
+        assert image.size == (20, 12)
+
+
+def test_default_block_format():
+    assert decode_dds(encode_dds(gradient(8, 8).convert('L')))[0]['block_format'] == 'BC4'
+    assert decode_dds(encode_dds(gradient(8, 8)))[0]['block_format'] == 'BC1'
+
+
+@pytest.mark.parametrize('size', [(1, 1), (2, 3), (3, 2), (4, 4), (5, 7), (17, 9), (64, 1), (1, 33), (100, 60)])
+def test_mip_chain(size):
+    width, height = size
+    image = gradient(width, height)
+    data = encode_dds(image, 'BC4')
+    header, levels = decode_dds(data)
+    expected = mip_sizes(width, height)
+    assert header['mip_count'] == len(expected) == int(np.log2(max(width, height))) + 1
+    assert [(level.shape[1], level.shape[0]) for level in levels] == expected
+    assert len(data) == HEADER_SIZE + sum(-(-w // 4) * -(-h // 4) * 8 for w, h in expected)
+    for source, decoded in zip(source_levels(image, 'BC4'), levels):
+        assert_within_block_bound(source, decoded)
+
+
+@pytest.mark.parametrize('block_format', ['BC4', 'BC5'])
+@pytest.mark.parametrize('image', [
+    synthetic_maps(64)['normal'], gradient(37, 23), noise(32, 16), Image.new('RGB', (8, 8), (200, 17, 90)),
+], ids=['maps', 'gradient', 'noise', 'flat'])
+def test_bc4_bc5_block_error_bound(block_format, image):
+    _, levels = decode_dds(encode_dds(image, block_format))
+    for source, decoded in zip(source_levels(image, block_format), levels):
+        assert_within_block_bound(source, decoded)
+
+
+def test_flat_blocks_are_exact():
+    image = Image.new('RGB', (12, 8), (200, 17, 90))
+    for block_format in ('BC4', 'BC5'):
+        _, levels = decode_dds(encode_dds(image, block_format))
+        for source, decoded in zip(source_levels(image, block_format), levels):
+            assert (decoded == source).all()
+
+
+@pytest.mark.parametrize('image', [synthetic_maps(128)['normal'], gradient(64, 64), synthetic_maps(128)['normal'].resize((90, 54))],
+                         ids=['maps', 'gradient', 'odd size'])
+def test_bc1_rmse_ceiling(image):
+    _, levels = decode_dds(encode_dds(image, 'BC1'))
+    source = source_levels(image, 'BC1')[0].astype(np.float64)
+    assert np.sqrt(((source - levels[0]) ** 2).mean()) <= BC1_RMSE_CEILING
+
+    # The reference decoder and Pillow's agree up to rounding
+    with Image.open(io.BytesIO(encode_dds(image, 'BC1'))) as decoded:
+        pillow = np.asarray(decoded.convert('RGB')).astype(np.int16)
+    assert np.abs(pillow - levels[0]).max() <= 1
+
+
+def test_bc1_two_colour_blocks_are_exact():
+    # Both colours are exact in 5:6:5, so they become the endpoints
+    pixels = np.zeros((8, 8, 3), dtype=np.uint8)
+    pixels[::2] = (255, 0, 0)
+    pixels[1::2] = (0, 0, 255)
+    _, levels = decode_dds(encode_dds(Image.fromarray(pixels), 'BC1', mipmaps=False))
+    assert (levels[0] == pixels).all()
+
+
+def test_chunks_do_not_change_the_output(monkeypatch):
+    image = synthetic_maps(64)['normal']
+    expected = [encode_dds(image, block_format) for block_format in BLOCK_FORMATS]
+    monkeypatch.setattr(dds_encoder, 'BLOCKS_PER_CHUNK', 7)
+    assert [encode_dds(image, block_format) for block_format in BLOCK_FORMATS] == expected
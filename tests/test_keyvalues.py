@@ -0,0 +1,156 @@
+import keyvalues
+from keyvalues import evaluate_condition, parse, parse_vmt
+
+FLAT_VMT = '''"LightmappedGeneric"
+{
+	"$basetexture" "brick/wall01"
+	"$SurfaceProp" "brick"
+	"$envmaptint" "[.2 .2 .2]"
+}
+'''
+
+
+def tokenized(text, defines=keyvalues.DEFAULT_DEFINES):
+    """parse through the full tokenizer, which every other path has to agree with."""
+    return keyvalues._parse_segments([(text, None)], frozenset(defines), tokenize=True)
+
+
+def test_flat_material():
+    assert parse(FLAT_VMT) == [('LightmappedGeneric', [
+        ('$basetexture', 'brick/wall01'), ('$SurfaceProp', 'brick'), ('$envmaptint', '[.2 .2 .2]'),
+    ])]
+    assert parse_vmt(FLAT_VMT) == ('lightmappedgeneric', {
+        '$basetexture': 'brick/wall01', '$surfaceprop': 'brick', '$envmaptint': '[.2 .2 .2]',
+    })
+
+
+def test_flat_material_matches_the_tokenizer():
+    assert parse(FLAT_VMT) == tokenized(FLAT_VMT)
+    # The last of duplicate keys wins, as in material_parameters
+    duplicated = '"VertexLitGeneric" { "$alpha" "1" "$ALPHA" "0.5" }'
+    assert parse(duplicated) == tokenized(duplicated)
+    assert parse_vmt(duplicated) == ('vertexlitgeneric', {'$alpha': '0.5'})
+
+
+def test_bytes_with_bom():
+    assert parse_vmt(b'\xef\xbb\xbf' + FLAT_VMT.encode()) == parse_vmt(FLAT_VMT)
+
+
+def test_nested_blocks():
+    text = '''"VertexLitGeneric"
+{
+	"$basetexture" "models/crate"
+	"Proxies"
+	{
+		"AnimatedTexture" { "animatedtexturevar" "$basetexture" "animatedtextureframerate" "10" }
+		"Sine"
+		{
+			"resultvar" "$alpha"
+		}
+	}
+}
+'''
+    assert parse(text) == tokenized(text)
+    shader, parameters = parse_vmt(text)
+    assert shader == 'vertexlitgeneric'
+    assert parameters['proxies'] == {
+        'animatedtexture': {'animatedtexturevar': '$basetexture', 'animatedtextureframerate': '10'},
+        'sine': {'resultvar': '$alpha'},
+    }
+
+
+def test_comments():
+    text = '''// Wall material "with quotes" in a comment
+"LightmappedGeneric"
+{
+	"$basetexture" "brick/wall01" // the "real" texture
+	// "$detail" "detail/noise"
+	"$surfaceprop" "brick"
+}
+'''
+    assert parse(text) == tokenized(text)
+    assert parse_vmt(text) == ('lightmappedgeneric', {'$basetexture': 'brick/wall01', '$surfaceprop': 'brick'})
+
+
+def test_conditionals():
+    text = '''"LightmappedGeneric"
+{
+	"$envmap" "env_cubemap" [$WIN32]
+	"$envmap" "editor/cubemap" [$X360]
+	"$bumpmap" "brick/wall01_normal" [!$X360]
+	"$detail" "detail/noise" [$OSX || $LINUX]
+	"Proxies" [$X360]
+	{
+		"Sine" { "resultvar" "$alpha" }
+	}
+}
+'''
+    assert parse(text) == tokenized(text)
+    assert parse_vmt(text) == ('lightmappedgeneric', {'$envmap': 'env_cubemap', '$bumpmap': 'brick/wall01_normal'})
+    # Defines can be any collection of lower-cased symbols
+    _, parameters = parse_vmt(text, defines={'$x360'})
+    assert parameters['$envmap'] == 'editor/cubemap'
+    assert '$bumpmap' not in parameters and 'proxies' in parameters
+
+
+def test_evaluate_condition():
+    assert evaluate_condition('[$WIN32]')
+    assert not evaluate_condition('[!$WIN32]')
+    assert evaluate_condition('[$X360 || $WINDOWS]')
+    assert not evaluate_condition('[$WIN32 && $X360]')
+    assert evaluate_condition('[$WIN32&&!$X360]')
+
+
+def test_dx_blocks():
+    text = '''"LightmappedGeneric"
+{
+	"$basetexture" "brick/wall01"
+	"$detail" "detail/low"
+	">=dx90"
+	{
+		"$detail" "detail/noise"
+	}
+	"<dx90" { "$basetexture" "brick/wall01_dx8" }
+	"$detailscale" "4"
+	"dx9" { "$kept" "1" }
+}
+'''
+    assert parse(text) == tokenized(text)
+    assert parse_vmt(text) == ('lightmappedgeneric', {
+        '$basetexture': 'brick/wall01', '$detail': 'detail/noise', '$detailscale': '4', 'dx9': {'$kept': '1'},
+    })
+    _, parameters = parse_vmt(text, dx_level=81)
+    assert parameters['$basetexture'] == 'brick/wall01_dx8'
+    assert parameters['$detail'] == 'detail/low'
+
+
+def test_tokenizer_fallback():
+    # Unquoted strings, a brace run into a word, a quote inside a comment, an unterminated quote
+    # and an unclosed conditional cannot be split at quotes
+    cases = {
+        'LightmappedGeneric\n{\n\t$basetexture brick/wall01\n\t$surfaceprop "brick"}\n': [
+            ('LightmappedGeneric', [('$basetexture', 'brick/wall01'), ('$surfaceprop', 'brick')]),
+        ],
+        '"LightmappedGeneric"\n{\n\t"$basetexture" "brick/wall01"}\n': [
+            ('LightmappedGeneric', [('$basetexture', 'brick/wall01')]),
+        ],
+        '"LightmappedGeneric"\n{\n\t// "$basetexture" "brick/old"\n\t"$basetexture" "brick/wall01"\n}\n': [
+            ('LightmappedGeneric', [('$basetexture', 'brick/wall01')]),
+        ],
+        '"LightmappedGeneric"\n{\n\t"$basetexture" "brick/wall01\n\t"$surfaceprop" "brick"\n}\n': [
+            ('LightmappedGeneric', [('$basetexture', 'brick/wall01'), ('$surfaceprop', 'brick')]),
+        ],
+        # An unclosed conditional only has to agree with the tokenizer
+        '"LightmappedGeneric"\n{\n\t"$basetexture" "brick/wall01" [$WIN32\n\t"$surfaceprop" "brick"\n}\n': None,
+    }
+    for text, expected in cases.items():
+        assert parse(text) == tokenized(text)
+        if expected is not None:
+            assert parse(text) == expected
+
+
+def test_empty_and_truncated():
+    assert parse('') == []
+    assert parse_vmt('') == ('', {})
+    assert parse_vmt('"LightmappedGeneric"\n{\n\t"$basetexture" "brick/wall01"\n') == (
+        'lightmappedgeneric', {'$basetexture': 'brick/wall01'})
@@ -0,0 +1,171 @@
+import os
+import pickle
+import struct
+import zlib
+
+import pytest
+
+import vpk_reader
+from conversion_engine import scan_material_tree
+from synthetic_tree import pack_vpk
+from vpk_reader import VpkArchive, VpkError, archive_entry, input_size, mount_material_root, open_input
+
+FILES = {
+    'brick/wall01.vmt': b'"LightmappedGeneric" { "$basetexture" "brick/wall01" }\n',
+    'concrete/floor01.vmt': b'"LightmappedGeneric" { "$basetexture" "concrete/floor01" }\n',
+    'brick/wall01.tga': bytes(range(256)) * 3,
+    'brick/wall01_height-ssbump.tga': bytes(range(255, -1, -1)) * 2,
+    'concrete/floor01.tga': b'\x07' * 500,
+    'concrete/tiny.tga': b'tiny',
+    'noextension': b'a file without an extension',
+}
+
+
+def write_tree(folder, files):
+    for relative_path, data in files.items():
+        path = os.path.join(folder, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as file:
+            file.write(data)
+
+
+def make_vpk(tmp_path, **options):
+    write_tree(tmp_path / 'source', FILES)
+    dir_path = str(tmp_path / 'pak01_dir.vpk')
+    pack_vpk(str(tmp_path / 'source'), dir_path, **options)
+    return dir_path
+
+
+@pytest.fixture
+def mounted(tmp_path):
+    """The material folder of a mounted VPK, unmounted again after the test."""
+    folder = mount_material_root(make_vpk(tmp_path))
+    yield folder
+    vpk_reader.unmount(folder)
+
+
+def mounted_path(folder, relative_path):
+    return os.path.join(folder, *relative_path.split('/'))
+
+
+@pytest.mark.parametrize('version', [1, 2])
+def test_versions(tmp_path, version):
+    archive = VpkArchive.open(make_vpk(tmp_path, version=version))
+    try:
+        assert set(archive.entries) == {'materials/' + name for name in FILES}
+        for name, data in FILES.items():
+            assert archive.read('materials/' + name) == data
+            assert archive.size('materials/' + name) == len(data)
+            assert archive.entries['materials/' + name][0] == zlib.crc32(data)
+        # VMTs are stored after the tree in the _dir.vpk, everything else in chunk 000
+        assert archive.entries['materials/brick/wall01.vmt'][1] == vpk_reader.DIR_ARCHIVE_INDEX
+        assert archive.entries['materials/brick/wall01.tga'][1] == 0
+    finally:
+        archive.close()
+
+
+def test_files_across_chunks(tmp_path):
+    dir_path = make_vpk(tmp_path, chunk_bytes=600)
+    archive = VpkArchive.open(dir_path)
+    try:
+        indices = {archive_index for _, archive_index, _, _, _ in archive.entries.values()}
+        assert {0, 1, 2} <= indices
+        assert all(os.path.isfile(archive.chunk_path(index)) for index in indices)
+        for name, data in FILES.items():
+            assert archive.read('materials/' + name) == data
+    finally:
+        archive.close()
+
+
+def test_preload(tmp_path):
+    archive = VpkArchive.open(make_vpk(tmp_path, preload_bytes=16))
+    try:
+        _, _, _, length, preload = archive.entries['materials/brick/wall01.tga']
+        assert preload == FILES['brick/wall01.tga'][:16]
+        assert length == len(FILES['brick/wall01.tga']) - 16
+        # A file shorter than the preload is served from the directory alone
+        assert archive.entries['materials/concrete/tiny.tga'][3] == 0
+        for name, data in FILES.items():
+            assert archive.read('materials/' + name) == data
+            assert archive.size('materials/' + name) == len(data)
+        with archive.open_file('materials/brick/wall01.tga') as file:
+            file.seek(10)
+            assert file.read(12) == FILES['brick/wall01.tga'][10:22]
+    finally:
+        archive.close()
+
+
+def test_entry_file_seeks():
+    with vpk_reader.EntryFile(memoryview(bytearray(b'0123456789'))) as file:
+        assert file.seek(-3, os.SEEK_END) == 7
+        buffer = bytearray(5)
+        assert file.readinto(buffer) == 3 and buffer[:3] == b'789'
+        file.seek(2)
+        assert file.seek(2, os.SEEK_CUR) == 4
+
+
+def test_corrupt_entry():
+    entry = struct.pack('<IHHIIH', 0, 0, 0, 0, 4, 0)
+    with pytest.raises(VpkError, match='Corrupt'):
+        VpkArchive('pak01_dir.vpk').read_tree(b'tga\0brick\0wall01\0' + entry + b'\0\0\0')
+
+
+def test_not_a_vpk(tmp_path):
+    path = tmp_path / 'broken_dir.vpk'
+    path.write_bytes(struct.pack('<3I', 0x12345678, 2, 0))
+    with pytest.raises(VpkError):
+        VpkArchive.open(str(path))
+    path.write_bytes(struct.pack('<3I', vpk_reader.VPK_SIGNATURE, 3, 0))
+    with pytest.raises(VpkError):
+        VpkArchive.open(str(path))
+
+
+def test_mounted_files(tmp_path, mounted):
+    assert mounted == str(tmp_path / 'pak01' / 'materials')
+    listed = dict(vpk_reader.mounted_files(mounted))
+    assert set(listed) == {mounted_path(mounted, name) for name in FILES}
+    for name, data in FILES.items():
+        path = mounted_path(mounted, name)
+        assert listed[path] == [len(data), zlib.crc32(data)]
+        with open_input(path) as file:
+            assert file.read() == data
+        assert input_size(path) == len(data)
+    # Nothing was extracted
+    assert not os.path.exists(mounted)
+
+
+def test_loose_file_takes_precedence(mounted):
+    write_tree(mounted, {'brick/wall01.tga': b'loose copy'})
+    index = scan_material_tree(mounted)
+    path = mounted_path(mounted, 'brick/wall01.tga')
+    assert index.overridden == [path]
+    assert archive_entry(path) is None
+    with open_input(path) as file:
+        assert file.read() == b'loose copy'
+    assert input_size(path) == len(b'loose copy')
+    # The other files are still read from the VPK
+    with open_input(mounted_path(mounted, 'concrete/floor01.tga')) as file:
+        assert file.read() == FILES['concrete/floor01.tga']
+
+
+def test_loose_file_in_another_case_takes_precedence(mounted):
+    write_tree(mounted, {'Brick/Wall01.TGA': b'loose copy'})
+    index = scan_material_tree(mounted)
+    virtual_path = mounted_path(mounted, 'brick/wall01.tga')
+    loose_path = mounted_path(mounted, 'Brick/Wall01.TGA')
+    assert index.overridden == [virtual_path]
+    assert index.resolve('brick/wall01', ['tga']) == loose_path
+    assert archive_entry(virtual_path) is None
+    with open_input(index.resolve('brick/wall01', ['tga'])) as file:
+        assert file.read() == b'loose copy'
+
+
+def test_pickled_archive_maps_its_chunks_again(mounted):
+    archive, _, _ = vpk_reader.mounts()[mounted]
+    assert archive.read('materials/brick/wall01.tga') == FILES['brick/wall01.tga']
+    copy = pickle.loads(pickle.dumps(archive))
+    assert copy.maps == {}
+    try:
+        assert copy.read('materials/brick/wall01.tga') == FILES['brick/wall01.tga']
+    finally:
+        copy.close()
@@ -0,0 +1,129 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import vtf_reader
+from dds_encoder import dds_header
+from synthetic_tree import VTF_PIXEL_LAYOUTS, vtf_bytes, vtf_level
+from vtf_reader import VtfError, read_header, read_vtf
+
+VERSIONS = [0, 1, 2, 3, 4, 5]
+# Non-square, below one 4x4 block and not a whole number of blocks
+SIZES = [(16, 16), (32, 8), (8, 32), (1, 1), (3, 2), (2, 5), (13, 7)]
+
+
+def sample_image(width, height, seed=0):
+    rng = np.random.default_rng(seed)
+    x, y = np.meshgrid(np.linspace(0, 255, width), np.linspace(0, 255, height))
+    pixels = np.dstack([x, y, 255 - x, (x + y) / 2]) + rng.integers(-16, 16, (height, width, 4))
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8), 'RGBA')
+
+
+def read(data):
+    return read_vtf(io.BytesIO(data))
+
+
+def expected_pixels(image, image_format):
+    """What the reader should return for the top level: the source pixels for the uncompressed formats,
+    Pillow's decode of the same blocks in a DDS file for DXT."""
+    if image_format in VTF_PIXEL_LAYOUTS:
+        return np.asarray(image.convert(VTF_PIXEL_LAYOUTS[image_format][0]))
+    header = bytearray(dds_header(image.width, image.height, 'BC1', 1))
+    header[84:88] = image_format.encode()
+    with Image.open(io.BytesIO(bytes(header) + vtf_level(image, image_format))) as reference:
+        return np.asarray(reference.convert('RGB' if image_format == 'DXT1' else 'RGBA'))
+
+
+@pytest.mark.parametrize('version', VERSIONS)
+@pytest.mark.parametrize('image_format', ['DXT1', 'DXT5', 'BGRA8888'])
+def test_versions(version, image_format):
+    image = sample_image(24, 12)
+    data = vtf_bytes(image, image_format, version=version)
+    decoded = read(data)
+    assert decoded.size == (24, 12)
+    assert np.array_equal(np.asarray(decoded), expected_pixels(image, image_format))
+
+
+def test_header_data_offset():
+    image = sample_image(16, 8)
+    thumbnail_bytes = len(vtf_level(image, 'DXT1'))
+    for version, offset in [(0, 64), (1, 64), (2, 80), (3, 96), (4, 96), (5, 96)]:
+        header = read_header(io.BytesIO(vtf_bytes(image, version=version)))
+        assert header['data_offset'] == offset + thumbnail_bytes
+        assert (header['width'], header['height'], header['depth']) == (16, 8, 1)
+        assert header['mip_count'] == 5
+
+
+@pytest.mark.parametrize('size', SIZES)
+@pytest.mark.parametrize('image_format', ['DXT1', 'DXT5', 'BGRA8888', 'BGR888', 'I8', 'IA88'])
+def test_sizes(size, image_format):
+    image = sample_image(*size)
+    decoded = read(vtf_bytes(image, image_format))
+    assert decoded.size == size
+    assert np.array_equal(np.asarray(decoded), expected_pixels(image, image_format))
+
+
+@pytest.mark.parametrize('image_format, mode', [('BGRA8888', 'RGBA'), ('BGR888', 'RGB'), ('I8', 'L'), ('IA88', 'LA')])
+def test_uncompressed_formats(image_format, mode):
+    image = sample_image(12, 6)
+    decoded = read(vtf_bytes(image, image_format, version=4))
+    assert decoded.mode == mode
+    assert np.array_equal(np.asarray(decoded), np.asarray(image.convert(mode)))
+
+
+def test_dxt1_error():
+    # Smooth images survive DXT1 with small errors
+    image = sample_image(64, 64)
+    decoded = np.asarray(read(vtf_bytes(image, 'DXT1'))).astype(np.int16)
+    source = np.asarray(image.convert('RGB')).astype(np.int16)
+    assert np.sqrt(((decoded - source) ** 2).mean()) < 12
+
+
+@pytest.mark.parametrize('version, faces', [(2, 6), (2, 7), (4, 6), (4, 7), (5, 6)])
+def test_cubemaps(version, faces):
+    image = sample_image(16, 16)
+    data = vtf_bytes(image, 'BGRA8888', version=version, faces=faces)
+    assert read_header(io.BytesIO(data))['faces'] == faces
+    assert np.array_equal(np.asarray(read(data)), np.asarray(image))
+
+
+def test_path_and_truncated_file(tmp_path):
+    path = tmp_path / 'texture.vtf'
+    data = vtf_bytes(sample_image(16, 16), 'BGRA8888')
+    path.write_bytes(data)
+    assert np.array_equal(np.asarray(read_vtf(str(path))), np.asarray(read(data)))
+    with pytest.raises(VtfError, match='truncated'):
+        read(data[:-1])
+
+
+def test_invalid_files():
+    with pytest.raises(VtfError):
+        read(b'DDS ' + bytes(124))
+    with pytest.raises(VtfError):
+        read(b'VTF\0')
+    data = bytearray(vtf_bytes(sample_image(4, 4)))
+    data[4] = 8
+    with pytest.raises(VtfError, match='version'):
+        read(bytes(data))
+    data = bytearray(vtf_bytes(sample_image(4, 4)))
+    data[52] = 99
+    with pytest.raises(VtfError, match='format'):
+        read(bytes(data))
+
+
+def test_missing_image_resource():
+    data = bytearray(vtf_bytes(sample_image(4, 4), version=3))
+    # Retag the high resolution image resource
+    data[88:91] = b'\x31\x00\x00'
+    with pytest.raises(VtfError, match='no image data'):
+        read(bytes(data))
+
+
+def test_chunked_decode(monkeypatch):
+    image = sample_image(40, 24)
+    data = vtf_bytes(image, 'DXT5')
+    expected = np.asarray(read(data))
+    monkeypatch.setattr(vtf_reader, 'BLOCKS_PER_CHUNK', 3)
+    assert np.array_equal(np.asarray(read(data)), expected)
@@ -0,0 +1,195 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image, ImageOps
+
+OO_SQRT_3 = 0.57735025882720947
+BUMP_BASIS_TRANSPOSE = np.array([
+    [0.81649661064147949, -0.40824833512306213, -0.40824833512306213],
+    [0.0, 0.70710676908493042, -0.7071068286895752],
+    [OO_SQRT_3, OO_SQRT_3, OO_SQRT_3]
+])
+
+# Every uint8 level normalised exactly like the old per-pixel code did it (float32 / 255.0)
+_LEVELS = np.arange(256, dtype=np.uint8).astype(np.float32) / 255.0
+
+# _BASIS_TABLES[out, in, level] is level * BUMP_BASIS_TRANSPOSE[out][in] in float64, so adding
+# the three lookups for a pixel gives the same bits as np.dot(pixel, BUMP_BASIS_TRANSPOSE[out])
+_BASIS_TABLES = _LEVELS.astype(np.float64)[None, None, :] * BUMP_BASIS_TRANSPOSE[:, :, None]
+
+# The height map only depends on the red channel
+_HEIGHT_TABLE = ((1.0 - _LEVELS) * 255).astype(np.uint8)
+
+# Pixels per inner block, small enough for the float64 intermediates to stay in cache
+KERNEL_BLOCK_PIXELS = 16384
+
+# Ceiling for the strip working memory of one image, on top of its decoded source and outputs
+TILE_MEMORY_LIMIT = 256 * 1024 * 1024
+# Images this large have their strips spread over several threads
+TILED_MIN_PIXELS = 2048 * 2048
+
+# Rough strip working memory per pixel: the cropped strip, its array copy and the output copies
+SSBUMP_STRIP_BYTES_PER_PIXEL = 16
+ROUGHNESS_STRIP_BYTES_PER_PIXEL = 6
+
+# Roughness values below this are treated as a shiny surface and forced to zero
+SHINY_ROUGHNESS_THRESHOLD = 30
+
+
+def ssbump_to_normal_and_height(pixels):
+    """Converts an (height, width, 3) uint8 ssbump array into uint8 normal and height arrays."""
+    pixels = np.asarray(pixels, dtype=np.uint8)
+    image_shape = pixels.shape[:2]
+    flat = pixels.reshape(-1, 3)
+    count = len(flat)
+
+    normal_image = np.empty((count, 3), dtype=np.uint8)
+    height_image = np.empty(count, dtype=np.uint8)
+
+    block = min(KERNEL_BLOCK_PIXELS, max(count, 1))
+    total_buffer = np.empty(block, dtype=np.float64)
+    term_buffer = np.empty(block, dtype=np.float64)
+    scaled_buffer = np.empty(block, dtype=np.float32)
+
+    for start in range(0, count, block):
+        stop = min(count, start + block)
+        size = stop - start
+        total, term, scaled = total_buffer[:size], term_buffer[:size], scaled_buffer[:size]
+        channels = [np.ascontiguousarray(flat[start:stop, index]) for index in range(3)]
+
+        np.take(_HEIGHT_TABLE, channels[0], out=height_image[start:stop])
+        for out, tables in enumerate(_BASIS_TABLES):
+            np.take(tables[0], channels[0], out=total)
+            total += np.take(tables[1], channels[1], out=term)
+            total += np.take(tables[2], channels[2], out=term)
+            total *= 0.5
+            total += 0.5
+            # Same float64 -> float32 -> * 255 -> uint8 chain as the old normal_image buffer
+            scaled[...] = total
+            scaled *= 255
+            normal_image[start:stop, out] = scaled
+
+    return normal_image.reshape(image_shape + (3,)), height_image.reshape(image_shape)
+
+
+def strip_rows_for(width, bytes_per_pixel, memory_limit, workers):
+    """Rows per strip so that workers strips of width pixels fit in memory_limit."""
+    return max(1, memory_limit // max(1, width * bytes_per_pixel * workers))
+
+
+def map_image_strips(image, strip_function, output_modes, bytes_per_pixel, memory_limit=TILE_MEMORY_LIMIT, workers=None, checkpoint=None):
+    """Runs strip_function over horizontal strips of image and pastes its results into new images.
+
+    strip_function gets a PIL strip and returns one array or image per entry of output_modes.
+    checkpoint, if given, is called before every strip; it may block to pause the work or raise to abandon it.
+    workers is the thread count for images of at least TILED_MIN_PIXELS, by default one per core; callers
+    that process several images at once pass their share of the cores. Smaller images run in the calling thread.
+    """
+    image.load()
+    width, height = image.size
+    if width * height < TILED_MIN_PIXELS:
+        workers = 1
+    elif workers is None:
+        workers = os.cpu_count() or 1
+    rows = strip_rows_for(width, bytes_per_pixel, memory_limit, workers)
+    outputs = [Image.new(mode, image.size) for mode in output_modes]
+
+    def run_strip(top):
+        if checkpoint is not None:
+            checkpoint()
+        bottom = min(height, top + rows)
+        results = strip_function(image.crop((0, top, width, bottom)))
+        for output, result in zip(outputs, results):
+            if isinstance(result, np.ndarray):
+                result = Image.fromarray(result)
+            output.paste(result, (0, top))
+
+    tops = range(0, height, rows)
+    if workers > 1 and len(tops) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(run_strip, tops))
+    else:
+        for top in tops:
+            run_strip(top)
+    return outputs
+
+
+def ssbump_image_to_normal_and_height(image, memory_limit=TILE_MEMORY_LIMIT, workers=None, checkpoint=None):
+    """Converts a PIL ssbump image strip by strip into a normal ('RGB') and a height ('L') image."""
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    return map_image_strips(
+        image, lambda strip: ssbump_to_normal_and_height(np.asarray(strip)),
+        ('RGB', 'L'), SSBUMP_STRIP_BYTES_PER_PIXEL, memory_limit, workers, checkpoint
+    )
+
+
+def build_roughness_lut(darkness_value, shiny_threshold=SHINY_ROUGHNESS_THRESHOLD):
+    """Compiles invert, darkness scaling and the shiny threshold into one table indexed by gray level."""
+    darkness_factor = 255 - int(darkness_value)
+    lut = []
+    for gray in range(256):
+        roughness = min(255, int((255 - gray) * darkness_factor / 255))
+        lut.append(0 if roughness < shiny_threshold else roughness)
+    return lut
+
+
+def roughness_image(image, darkness_value, shiny_threshold=SHINY_ROUGHNESS_THRESHOLD, memory_limit=TILE_MEMORY_LIMIT, workers=None, checkpoint=None):
+    """Builds the grayscale roughness map of a PIL image in one table lookup per strip."""
+    lut = build_roughness_lut(darkness_value, shiny_threshold)
+    return map_image_strips(
+        image, lambda strip: [ImageOps.grayscale(strip).point(lut)],
+        ('L',), ROUGHNESS_STRIP_BYTES_PER_PIXEL, memory_limit, workers, checkpoint
+    )[0]
+
+
+def autocontrast_lut(histogram):
+    """ImageOps.autocontrast's table for an 'L' histogram: stretch the used levels to 0-255."""
+    used = [level for level in range(256) if histogram[level]]
+    if len(used) < 2:
+        return list(range(256))
+    low, high = used[0], used[-1]
+    scale = 255.0 / (high - low)
+    offset = -low * scale
+    return [min(255, max(0, int(level * scale + offset))) for level in range(256)]
+
+
+def equalize_lut(histogram):
+    """ImageOps.equalize's table for an 'L' histogram: spread the levels evenly over 0-255."""
+    counts = [count for count in histogram if count]
+    step = (sum(counts) - counts[-1]) // 255 if len(counts) > 1 else 0
+    if not step:
+        return list(range(256))
+    lut = []
+    n = step // 2
+    for level in range(256):
+        lut.append(n // step)
+        n += histogram[level]
+    return lut
+
+
+# Grayscale derivations of derive_gray_maps, as functions from the grayscale histogram to a point table
+GRAY_MAP_LUTS = {
+    'invert': lambda histogram: build_roughness_lut(0, shiny_threshold=0),
+    'autocontrast': autocontrast_lut,
+    'equalize': equalize_lut,
+}
+
+
+def derive_gray_maps(image, operations):
+    """Derives several maps of a PIL image from one grayscale conversion and one histogram.
+
+    operations are keys of GRAY_MAP_LUTS, each one table lookup over the grayscale image, or
+    'rgb', the grayscale image packed into three channels. Returns {operation: PIL image}.
+    """
+    gray = image if image.mode == 'L' else ImageOps.grayscale(image)
+    histogram = gray.histogram() if any(operation in ('autocontrast', 'equalize') for operation in operations) else None
+    maps = {}
+    for operation in operations:
+        if operation in maps:
+            continue
+        if operation == 'rgb':
+            maps[operation] = Image.merge('RGB', (gray, gray, gray))
+        else:
+            maps[operation] = gray.point(GRAY_MAP_LUTS[operation](histogram))
+    return maps
@@ -0,0 +1,135 @@
+import json
+import os
+import threading
+import time
+
+# Spans are only recorded between enable() and disable(). While disabled, span() hands out one
+# shared do-nothing object, so instrumented code pays a function call and nothing else.
+_enabled = False
+_trace_dir = None
+_spans = []
+_flush_lock = threading.Lock()
+
+
+class Span:
+    __slots__ = ('name', 'args', 'start')
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        duration = time.perf_counter_ns() - self.start
+        _spans.append((self.name, self.start // 1000, duration // 1000, os.getpid(), threading.get_native_id(), self.args))
+        return False
+
+    def set(self, **args):
+        self.args.update(args)
+
+    def __bool__(self):
+        return True
+
+
+class NullSpan:
+    """Stands in for a Span while tracing is disabled. It is falsy, so 'if span:' guards the
+    work that only feeds span arguments, such as a stat for the byte count."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set(self, **args):
+        pass
+
+    def __bool__(self):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+def span(name, **args):
+    """Times a with block as a span called name; args such as file, bytes, width and height travel with it."""
+    if not _enabled:
+        return NULL_SPAN
+    return Span(name, args)
+
+
+def enable(trace_dir):
+    """Records spans from now on; flush() writes them to one file per process in trace_dir."""
+    global _enabled, _trace_dir
+    os.makedirs(trace_dir, exist_ok=True)
+    _trace_dir = trace_dir
+    _enabled = True
+
+
+def disable():
+    global _enabled, _trace_dir
+    _enabled = False
+    _trace_dir = None
+    del _spans[:]
+
+
+def is_enabled():
+    return _enabled
+
+
+def flush():
+    """Appends the spans recorded so far to this process's file, so worker processes can hand them over."""
+    if not _enabled or not _spans:
+        return
+    with _flush_lock:
+        # Spans finishing on other threads meanwhile are appended after the batch and kept
+        batch = _spans[:]
+        del _spans[:len(batch)]
+        with open(os.path.join(_trace_dir, f"spans-{os.getpid()}.jsonl"), "a", encoding="utf-8") as file:
+            file.write(''.join(json.dumps(record) + '\n' for record in batch))
+
+
+def load_spans(trace_dir):
+    spans = []
+    for name in sorted(os.listdir(trace_dir)):
+        if name.startswith("spans-") and name.endswith(".jsonl"):
+            with open(os.path.join(trace_dir, name), "r", encoding="utf-8") as file:
+                spans.extend(tuple(json.loads(line)) for line in file)
+    return spans
+
+
+def export_chrome_trace(spans, path):
+    """Writes spans as a Chrome trace (chrome://tracing, ui.perfetto.dev): one complete event per span."""
+    events = [
+        {"name": name, "cat": "convert", "ph": "X", "ts": start, "dur": duration, "pid": pid, "tid": tid, "args": args}
+        for name, start, duration, pid, tid, args in spans
+    ]
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
+
+
+def summarize(spans):
+    """Per span name: count, total and maximum seconds, and the bytes the spans reported."""
+    rows = {}
+    for name, _, duration, _, _, args in spans:
+        row = rows.setdefault(name, {"stage": name, "count": 0, "seconds": 0.0, "max_seconds": 0.0, "bytes": 0})
+        row["count"] += 1
+        row["seconds"] += duration / 1e6
+        row["max_seconds"] = max(row["max_seconds"], duration / 1e6)
+        row["bytes"] += args.get("bytes", 0)
+    return sorted(rows.values(), key=lambda row: row["seconds"], reverse=True)
+
+
+def format_summary(rows):
+    lines = [f"{'stage':>10}  {'count':>7}  {'total':>9}  {'mean':>9}  {'max':>9}  {'MB/s':>7}"]
+    for row in rows:
+        mb_per_second = f"{row['bytes'] / 1e6 / row['seconds']:>7.1f}" if row["bytes"] and row["seconds"] else f"{'-':>7}"
+        lines.append(
+            f"{row['stage']:>10}  {row['count']:>7}  {row['seconds']:>8.3f}s  {row['seconds'] / row['count'] * 1000:>7.2f}ms  "
+            f"{row['max_seconds'] * 1000:>7.2f}ms  {mb_per_second}"
+        )
+    return '\n'.join(lines)
@@ -0,0 +1,162 @@
+from string import Formatter
+
+
+class ShaderProfile:
+    """A VMAT layout for one Source 2 shader, compiled once into static text and conditional lines.
+
+    Each line is a str.format template. A line with {fields} is only emitted when all of its fields
+    have a non-empty value; a (condition, line) pair is only emitted when any field named in the
+    space-separated condition does. Consecutive unconditional lines are merged at compile time,
+    so rendering a VMAT is a handful of format calls and one join.
+    """
+
+    def __init__(self, name, shader, lines):
+        self.name = name
+        self.shader = shader
+        self.segments = []
+        static = []
+        for line in lines:
+            condition, line = line if isinstance(line, tuple) else (None, line)
+            fields = [field for _, field, _, _ in Formatter().parse(line) if field]
+            if condition is None and not fields:
+                static.append(line.format())
+                continue
+            if static:
+                self.segments.append((''.join(static), None, None))
+                static = []
+            if condition is not None:
+                self.segments.append((line, condition.split(), any))
+            else:
+                self.segments.append((line, fields, all))
+        if static:
+            self.segments.append((''.join(static), None, None))
+
+    def render(self, values):
+        parts = []
+        for text, fields, test in self.segments:
+            if fields is None:
+                parts.append(text)
+            elif test(values.get(field) for field in fields):
+                parts.append(text.format_map(values))
+        return ''.join(parts)
+
+
+# Texture fields a profile can reference, all VMAT-relative paths like 'materials/brick/wall01.tga':
+# color, normal, height, roughness, selfillum
+
+ENVIRONMENT = ShaderProfile('environment', 'csgo_environment.vfx', [
+    '// THIS FILE IS AUTO-GENERATED\n\n',
+    'Layer0\n{{\n',
+    '\tshader "csgo_environment.vfx"\n\n',
+    '\t//---- Color ----\n',
+    '\tg_flModelTintAmount "1.000"\n',
+    '\tg_nScaleTexCoordUByModelScaleAxis "0" // None\n',
+    '\tg_nScaleTexCoordVByModelScaleAxis "0" // None\n',
+    '\tg_vColorTint "[1.000000 1.000000 1.000000 0.000000]"\n\n',
+    '\t//---- Fog ----\n',
+    '\tg_bFogEnabled "1"\n\n',
+    '\t//---- Material1 ----\n',
+    '\tg_flTexCoordRotation1 "0.000"\n',
+    '\tg_vTexCoordCenter1 "[0.500 0.500]"\n',
+    '\tg_vTexCoordOffset1 "[0.000 0.000]"\n',
+    '\tg_vTexCoordScale1 "[1.000 1.000]"\n',
+    '\tTextureColor1 "{color}"\n',
+    '\tTextureNormal1 "{normal}"\n',
+    '\tTextureHeight1 "{height}"\n',
+    '\tTextureMetalness1 "materials/default/default_metal.tga"\n',
+    '\tTextureRoughness1 "{roughness}"\n',
+    '\tTextureTintMask1 "materials/default/default_mask.tga"\n\n',
+    '\t//---- Texture Address Mode ----\n',
+    '\tg_nTextureAddressModeU "0" // Wrap\n',
+    '\tg_nTextureAddressModeV "0" // Wrap\n',
+    '}}\n',
+])
+
+COMPLEX = ShaderProfile('complex', 'csgo_complex.vfx', [
+    '"Layer0"\n{{\n',
+    '    "shader"    "csgo_complex.vfx"\n',
+    '    "F_DETAIL_TEXTURE"    "2"\n',
+    '    "g_bFogEnabled"    "1"\n',
+    '    "g_nScaleTexCoordUByModelScaleAxis"    "0"\n',
+    '    "g_nScaleTexCoordVByModelScaleAxis"    "0"\n',
+    '    "g_nTextureAddressModeU"    "0"\n',
+    '    "g_nTextureAddressModeV"    "0"\n',
+    '    "g_flDetailBlendFactor"    "1"\n',
+    '    "g_flDetailBlendToFull"    "0"\n',
+    '    "g_flMetalness"    "{metalness}"\n',
+    '    "g_flModelTintAmount"    "1"\n',
+    '    "TextureColor"    "{color}"\n',
+    '    "TextureRoughness"    "{roughness}"\n',
+    '    "TextureNormal"    "{normal}"\n',
+    '    "TextureSelfIllum"    "{selfillum}"\n',
+    ('color normal roughness', '    "Compiled Textures"\n    {{\n'),
+    '        "g_tColor"    "{color}"\n',
+    '        "g_tNormal"    "{normal}"\n',
+    '        "g_tRoughness"    "{roughness}"\n',
+    ('color normal roughness', '    }}\n'),
+    '}}\n',
+])
+
+SIMPLE = ShaderProfile('simple', 'csgo_simple.vfx', [
+    '"Layer0"\n{{\n',
+    '    "shader"    "csgo_simple.vfx"\n',
+    '    "g_flMetalness"    "{metalness}"\n',
+    '    "TextureColor"    "{color}"\n',
+    '    "TextureNormal"    "{normal}"\n',
+    '    "TextureRoughness"    "{roughness}"\n',
+    '    "TextureSelfIllum"    "{selfillum}"\n',
+    '}}\n',
+])
+
+UNLIT = ShaderProfile('unlit', 'csgo_unlitgeneric.vfx', [
+    '// THIS FILE IS AUTO-GENERATED\n\n',
+    'Layer0\n{{\n',
+    '\tshader "csgo_unlitgeneric.vfx"\n\n',
+    '\t//---- Color ----\n',
+    '\tg_vColorTint "[1.000000 1.000000 1.000000 0.000000]"\n',
+    '\tTextureColor "{color}"\n\n',
+    '\t//---- Texture Address Mode ----\n',
+    '\tg_nTextureAddressModeU "0" // Wrap\n',
+    '\tg_nTextureAddressModeV "0" // Wrap\n',
+    '}}\n',
+])
+
+
+def bare_profile(name, shader):
+    """The supervised converter's layout: the shader and only the textures and metalness that are set."""
+    return ShaderProfile(name, shader, [
+        '"Layer0" {{\n',
+        '    "shader" "' + shader + '"\n',
+        '    "TextureColor" "{color}"\n',
+        '    "TextureNormal" "{normal}"\n',
+        '    "TextureRoughness" "{roughness}"\n',
+        '    "TextureSelfIllum" "{selfillum}"\n',
+        '    "g_flMetalness" "{metalness}"\n',
+        '}}\n',
+    ])
+
+
+# VMT shader -> profile of the GUI and command line converter; anything else gets the default
+SHADER_PROFILES = {
+    'lightmappedgeneric': ENVIRONMENT,
+    'lightmappedreflective': ENVIRONMENT,
+    'worldvertextransition': ENVIRONMENT,
+    'vertexlitgeneric': COMPLEX,
+    'unlitgeneric': UNLIT,
+}
+DEFAULT_PROFILE = ENVIRONMENT
+
+
+def profile_for(vmt_shader, profiles=SHADER_PROFILES, default=DEFAULT_PROFILE):
+    return profiles.get(vmt_shader.lower(), default)
+
+
+def material_path(relative_path):
+    """VMAT reference of a path relative to the materials folder, with forward slashes."""
+    return "materials/" + relative_path.replace("\\", "/")
+
+
+def write_vmat(vmat_path, text):
+    # The whole VMAT goes to the file in one write
+    with open(vmat_path, 'w') as file:
+        file.write(text)
@@ -0,0 +1,93 @@
+import argparse
+import sys
+from backup_store import BACKUP_MODES, DEFAULT_BACKUP_MODE
+from encoder_profiles import DEFAULT_ENCODER_PROFILE, ENCODER_PROFILES
+
+# Only argparse and the option lists are imported up front; the engine is loaded after the arguments
+# are parsed so --help returns immediately, and the image libraries only once a texture is actually converted
+BACKENDS = ['process', 'thread']
+TEXTURE_FORMATS = ['tga', 'png', 'jpg', 'dds', 'bmp']
+# Derivations listed by --dry-run, the most expensive ones
+PLAN_LARGEST_SHOWN = 10
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Convert Source VMT materials to Source 2 VMAT materials without the GUI.")
+    parser.add_argument("target_folder", help="material directory containing the VMT and texture files, or a _dir.vpk to read them from")
+    parser.add_argument("backup_folder", help="directory the original VMT and ssbump files are moved to")
+    parser.add_argument("--format", dest="texture_format", choices=TEXTURE_FORMATS, default="tga", help="texture format (default: tga)")
+    parser.add_argument("--encoder-profile", choices=list(ENCODER_PROFILES), default=DEFAULT_ENCODER_PROFILE,
+                        help="fast compresses little for quick iteration, archival as much as possible, "
+                             "including RLE for TGA (default: balanced, Pillow's defaults)")
+    parser.add_argument("--keep-vmat", action="store_true", help="keep VMAT files that already exist")
+    parser.add_argument("--keep-textures", action="store_true", help="keep generated texture files that already exist")
+    parser.add_argument("--normal", action="store_true", help="reference normal maps converted from ssbumps")
+    parser.add_argument("--height", action="store_true", help="reference height maps converted from ssbumps")
+    parser.add_argument("--no-roughness", action="store_true", help="do not generate roughness maps")
+    parser.add_argument("--darkness", type=int, default=128, help="darkness value of the roughness maps, 0-255 (default: 128)")
+    parser.add_argument("--backend", choices=BACKENDS, default="process", help="execution backend (default: process)")
+    parser.add_argument("--backup-mode", choices=BACKUP_MODES, default=DEFAULT_BACKUP_MODE,
+                        help="folder mirrors the originals as loose files, store keeps each distinct file once, "
+                             "archive writes one .tar.gz per run (default: folder)")
+    parser.add_argument("--memory-budget", type=int, metavar="MB",
+                        help="memory the texture tasks may hold at once; larger textures wait their turn (default: half the available memory)")
+    parser.add_argument("--trace", metavar="PATH", help="record per-stage timing spans and write them to PATH as a Chrome trace")
+    parser.add_argument("--verbose", action="store_true", help="log the parameters and outputs of every file")
+    parser.add_argument("--dry-run", action="store_true", help="list what would be converted without writing anything")
+    return parser
+
+
+def print_plan(plan, backend):
+    from conversion_engine import worker_count
+    from cost_planner import largest_first
+    print(f"{plan.found} VMT files found, {plan.skipped} unchanged since their last conversion.")
+    print(f"{len(plan.vmt_files)} VMT files to convert:")
+    for vmt_file in plan.vmt_files:
+        print(f"  {vmt_file}")
+    print(f"{len(plan.ssbump_files())} ssbump maps to convert, {len(plan.roughness_sources)} roughness maps to generate, largest first:")
+    for source_path, operation in largest_first(plan.derivation_costs)[:PLAN_LARGEST_SHOWN]:
+        print(f"  {plan.derivation_costs[(source_path, operation)]:8.3f}s  {operation:<20}  {source_path}")
+    workers = worker_count(backend)
+    print(f"Estimated work {plan.estimated_seconds():.1f}s, critical path {plan.critical_path_seconds():.1f}s, "
+          f"about {plan.estimated_wall_seconds(workers):.1f}s with {workers} {backend} workers.")
+
+
+def print_progress(processed, total, start_time, processed_bytes):
+    from conversion_engine import estimate_time, format_rate
+    if processed:
+        print(f"Processed {processed}/{total} - {format_rate(processed, processed_bytes, start_time)} - {estimate_time(total, processed, start_time)}")
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if not 0 <= args.darkness <= 255:
+        print("Darkness value must be between 0 and 255.", file=sys.stderr)
+        return 2
+    if args.memory_budget is not None and args.memory_budget <= 0:
+        print("Memory budget must be a positive number of MB.", file=sys.stderr)
+        return 2
+
+    from conversion_engine import convert_materials
+    try:
+        plan = convert_materials(
+            args.target_folder, args.backup_folder, args.texture_format, not args.keep_vmat, not args.keep_textures,
+            args.normal, args.height, not args.no_roughness, args.darkness, args.backend,
+            progress=None if args.dry_run else print_progress, dry_run=args.dry_run, backup_mode=args.backup_mode,
+            trace_path=args.trace, verbose=args.verbose,
+            memory_budget=args.memory_budget * 1024 * 1024 if args.memory_budget else None, encoder_profile=args.encoder_profile
+        )
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+
+    if args.dry_run:
+        print_plan(plan, args.backend)
+        return 0
+    if plan.cancelled:
+        return 1
+    print(f"Converted {plan.converted}/{len(plan.vmt_files)} VMT files.")
+    return 0 if plan.converted == len(plan.vmt_files) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,284 @@
+import io
+import mmap
+import os
+import struct
+import threading
+
+VPK_SIGNATURE = 0x55AA1234
+DIR_SUFFIX = '_dir.vpk'
+# Archive index of files stored in the _dir.vpk itself, after the directory tree
+DIR_ARCHIVE_INDEX = 0x7FFF
+ENTRY_TERMINATOR = 0xFFFF
+# Folder of the VPK the material tree is read from, as in a game's search path
+MATERIALS_PREFIX = 'materials/'
+
+_HEADER = struct.Struct('<3I')
+_HEADER_V2_EXTRA = struct.Struct('<4I')
+_ENTRY = struct.Struct('<IHHIIH')
+
+# Mounted material roots: folder -> (archive, prefix of the files under it, names overridden by files on disk)
+_mounts = {}
+_mounts_lock = threading.Lock()
+
+
+class VpkError(Exception):
+    pass
+
+
+def is_vpk(path):
+    return path.lower().endswith(DIR_SUFFIX) and os.path.isfile(path)
+
+
+def _read_string(data, position):
+    """The null-terminated string at position and the position after it."""
+    end = data.index(b'\0', position)
+    return data[position:end].decode('utf-8', 'replace'), end + 1
+
+
+class VpkArchive:
+    """The directory tree of a VPK, read once from its _dir.vpk.
+
+    Files are served from the numbered archive chunks, each memory-mapped the first time one of
+    its files is read, so nothing is extracted and only the pages of the files read are loaded.
+    An archive travels to worker processes without its maps; they map the chunks again on use.
+    """
+
+    def __init__(self, dir_path):
+        self.dir_path = dir_path
+        # lower case path inside the VPK -> (crc, archive index, offset, length, preload bytes)
+        self.entries = {}
+        # Start of the file data stored in the _dir.vpk itself
+        self.dir_data_offset = 0
+        self.maps = {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def open(cls, dir_path):
+        archive = cls(dir_path)
+        with open(dir_path, 'rb') as file:
+            header = file.read(_HEADER.size + _HEADER_V2_EXTRA.size)
+            signature, version, tree_size = _HEADER.unpack_from(header)
+            if signature != VPK_SIGNATURE or version not in (1, 2):
+                raise VpkError(f"{dir_path} is not a version 1 or 2 VPK directory.")
+            header_size = _HEADER.size + (_HEADER_V2_EXTRA.size if version == 2 else 0)
+            file.seek(header_size)
+            tree = file.read(tree_size)
+        archive.dir_data_offset = header_size + tree_size
+        archive.read_tree(tree)
+        return archive
+
+    def read_tree(self, tree):
+        # Extension, then folder, then file name levels, each ended by an empty string;
+        # ' ' stands for no folder or no extension
+        position = 0
+        while True:
+            extension, position = _read_string(tree, position)
+            if not extension:
+                break
+            suffix = '' if extension == ' ' else '.' + extension
+            while True:
+                folder, position = _read_string(tree, position)
+                if not folder:
+                    break
+                prefix = '' if folder == ' ' else folder.strip('/') + '/'
+                while True:
+                    name, position = _read_string(tree, position)
+                    if not name:
+                        break
+                    crc, preload_size, archive_index, offset, length, terminator = _ENTRY.unpack_from(tree, position)
+                    if terminator != ENTRY_TERMINATOR:
+                        raise VpkError(f"Corrupt directory entry for {prefix}{name}{suffix} in {self.dir_path}.")
+                    position += _ENTRY.size
+                    preload = tree[position:position + preload_size]
+                    position += preload_size
+                    self.entries[(prefix + name + suffix).lower()] = (crc, archive_index, offset, length, preload)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['maps'] = {}
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def chunk_path(self, archive_index):
+        if archive_index == DIR_ARCHIVE_INDEX:
+            return self.dir_path
+        return f"{self.dir_path[:-len(DIR_SUFFIX)]}_{archive_index:03d}.vpk"
+
+    def chunk(self, archive_index):
+        """Memory map of an archive chunk, mapped on first use."""
+        with self.lock:
+            chunk = self.maps.get(archive_index)
+            if chunk is None:
+                with open(self.chunk_path(archive_index), 'rb') as file:
+                    chunk = self.maps[archive_index] = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        return chunk
+
+    def size(self, name):
+        _, _, _, length, preload = self.entries[name.lower()]
+        return len(preload) + length
+
+    def open_file(self, name):
+        """A read-only file object over one file of the VPK; its data is read from the map only when read."""
+        _, archive_index, offset, length, preload = self.entries[name.lower()]
+        if not length:
+            return io.BytesIO(preload)
+        if archive_index == DIR_ARCHIVE_INDEX:
+            offset += self.dir_data_offset
+        data = memoryview(self.chunk(archive_index))[offset:offset + length]
+        if preload:
+            return io.BytesIO(preload + data)
+        return io.BufferedReader(EntryFile(data))
+
+    def read(self, name):
+        with self.open_file(name) as file:
+            return file.read()
+
+    def close(self):
+        with self.lock:
+            maps, self.maps = self.maps, {}
+        for chunk in maps.values():
+            try:
+                chunk.close()
+            except BufferError:
+                # A file object opened on the chunk is still alive; the map closes with it
+                pass
+
+
+class EntryFile(io.RawIOBase):
+    """Seekable raw file over a memoryview of a VPK chunk."""
+
+    def __init__(self, data):
+        self.data = data
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        count = max(0, min(len(buffer), len(self.data) - self.position))
+        buffer[:count] = self.data[self.position:self.position + count]
+        self.position += count
+        return count
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        base = {os.SEEK_SET: 0, os.SEEK_CUR: self.position, os.SEEK_END: len(self.data)}[whence]
+        self.position = max(0, base + offset)
+        return self.position
+
+    def tell(self):
+        return self.position
+
+    def close(self):
+        if not self.closed:
+            self.data.release()
+        super().close()
+
+
+def output_folder(vpk_path):
+    """Folder the VMATs and generated maps of a VPK's materials are written to: one named after the
+    VPK next to it, mirroring the VPK's materials folder."""
+    return os.path.join(vpk_path[:-len(DIR_SUFFIX)], *MATERIALS_PREFIX.strip('/').split('/'))
+
+
+def mount_material_root(material_root):
+    """Returns the folder to convert material_root in. A _dir.vpk is opened and mounted at its
+    output_folder, so its materials read as files under that folder without being extracted."""
+    if not is_vpk(material_root):
+        return material_root
+    folder = output_folder(material_root)
+    mount(VpkArchive.open(material_root), folder, MATERIALS_PREFIX)
+    return os.path.normpath(folder)
+
+
+def mount(archive, folder, prefix=''):
+    """Serves the files of archive under prefix as files under folder, replacing any earlier mount of folder."""
+    folder = os.path.normpath(folder)
+    with _mounts_lock:
+        previous = _mounts.get(folder)
+        _mounts[folder] = (archive, prefix, frozenset())
+    if previous is not None and previous[0] is not archive:
+        previous[0].close()
+
+
+def unmount(folder):
+    with _mounts_lock:
+        mounted = _mounts.pop(os.path.normpath(folder), None)
+    if mounted is not None:
+        mounted[0].close()
+
+
+def mounts():
+    """The mounts of this process, to restore in worker processes with restore_mounts."""
+    with _mounts_lock:
+        return dict(_mounts)
+
+
+def restore_mounts(mounted):
+    with _mounts_lock:
+        _mounts.update(mounted or {})
+
+
+def mounted_files(folder):
+    """(path, [size, crc]) of every archive file mounted under folder, for MaterialIndex.scan."""
+    folder = os.path.normpath(folder)
+    mounted = _mounts.get(folder)
+    if mounted is None:
+        return []
+    archive, prefix, _ = mounted
+    files = []
+    for name, (crc, _, _, length, preload) in archive.entries.items():
+        if name.startswith(prefix):
+            files.append((os.path.join(folder, *name[len(prefix):].split('/')), [len(preload) + length, crc]))
+    return files
+
+
+def override_files(folder, paths):
+    """Serves the mounted files at paths from the disk from now on. MaterialIndex.scan lists them as
+    overridden: a file on disk overrides the VPK's, like a loose file in the game's search path."""
+    folder = os.path.normpath(folder)
+    root = os.path.join(folder, '')
+    with _mounts_lock:
+        mounted = _mounts.get(folder)
+        if mounted is None:
+            return
+        archive, prefix, overridden = mounted
+        names = {prefix + os.path.normpath(path)[len(root):].replace('\\', '/').lower() for path in paths}
+        _mounts[folder] = (archive, prefix, overridden | names)
+
+
+def archive_entry(path):
+    """(archive, name inside it) when path is served from a mounted VPK rather than the disk, else None."""
+    if not _mounts:
+        return None
+    path = os.path.normpath(path)
+    for folder, (archive, prefix, overridden) in _mounts.items():
+        root = os.path.join(folder, '')
+        if path.startswith(root):
+            name = prefix + path[len(root):].replace('\\', '/').lower()
+            if name in archive.entries and name not in overridden:
+                return archive, name
+    return None
+
+
+def open_input(path):
+    """Opens an input file for binary reading, from the disk or, when it is only in a mounted VPK, from the VPK."""
+    entry = archive_entry(path)
+    if entry is None:
+        return open(path, 'rb')
+    archive, name = entry
+    return archive.open_file(name)
+
+
+def input_size(path):
+    entry = archive_entry(path)
+    if entry is None:
+        return os.path.getsize(path)
+    archive, name = entry
+    return archive.size(name)
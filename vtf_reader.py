@@ -0,0 +1,193 @@
+import struct
+import numpy as np
+from dds_encoder import BLOCKS_PER_CHUNK, unpack_565
+
+VTF_SIGNATURE = b'VTF\0'
+
+# IMAGE_FORMAT values of the VTF header
+DXT1, DXT3, DXT5, DXT1_ONEBITALPHA = 13, 14, 15, 20
+# Uncompressed format -> (bytes per pixel, source byte of each output channel, output mode)
+PIXEL_FORMATS = {
+    0: (4, [0, 1, 2, 3], 'RGBA'),  # RGBA8888
+    1: (4, [3, 2, 1, 0], 'RGBA'),  # ABGR8888
+    2: (3, [0, 1, 2], 'RGB'),  # RGB888
+    3: (3, [2, 1, 0], 'RGB'),  # BGR888
+    5: (1, [0], 'L'),  # I8
+    6: (2, [0, 1], 'LA'),  # IA88
+    12: (4, [2, 1, 0, 3], 'RGBA'),  # BGRA8888
+    16: (4, [2, 1, 0], 'RGB'),  # BGRX8888
+}
+# Block-compressed format -> bytes per 4x4 block
+BLOCK_FORMATS = {DXT1: 8, DXT1_ONEBITALPHA: 8, DXT3: 16, DXT5: 16}
+
+TEXTUREFLAGS_ENVMAP = 0x4000
+# 7.3+ resource holding the offset of the high resolution mips
+HIGH_RES_IMAGE_RESOURCE = b'\x30\x00\x00'
+_HEADER = struct.Struct('<4s2II2HI2H4x12x4xfiBiBB')
+
+_BC1_SHIFTS = np.arange(16, dtype=np.uint32) * 2
+_DXT3_SHIFTS = np.arange(16, dtype=np.uint64) * 4
+_DXT5_SHIFTS = np.arange(16, dtype=np.uint64) * 3
+
+
+class VtfError(Exception):
+    pass
+
+
+def level_bytes(image_format, width, height, depth=1):
+    """Size of one face of one frame of a mip level."""
+    if image_format in BLOCK_FORMATS:
+        return max(1, -(-width // 4)) * max(1, -(-height // 4)) * BLOCK_FORMATS[image_format] * depth
+    return width * height * PIXEL_FORMATS[image_format][0] * depth
+
+
+def read_header(file):
+    """The header fields of an open VTF file that locate and describe its top mip level."""
+    data = file.read(80)
+    if len(data) < _HEADER.size or not data.startswith(VTF_SIGNATURE):
+        raise VtfError("Not a VTF file.")
+    (_, major, minor, header_size, width, height, flags, frames, first_frame,
+     _, image_format, mip_count, low_res_format, low_res_width, low_res_height) = _HEADER.unpack_from(data)
+    if major != 7:
+        raise VtfError(f"Unsupported VTF version {major}.{minor}.")
+    if image_format not in BLOCK_FORMATS and image_format not in PIXEL_FORMATS:
+        raise VtfError(f"Unsupported VTF image format {image_format}.")
+    depth = struct.unpack_from('<H', data, 63)[0] if minor >= 2 else 1
+    faces = 1
+    if flags & TEXTUREFLAGS_ENVMAP:
+        # Cubemaps before 7.5 carry a seventh, spherical face unless first_frame is -1
+        faces = 7 if minor < 5 and first_frame != 0xFFFF else 6
+
+    if minor >= 3:
+        resource_count = struct.unpack_from('<I', data, 68)[0]
+        file.seek(80)
+        resources = file.read(resource_count * 8)
+        data_offset = None
+        for entry in range(resource_count):
+            tag, _, offset = struct.unpack_from('<3sBI', resources, entry * 8)
+            if tag == HIGH_RES_IMAGE_RESOURCE:
+                data_offset = offset
+        if data_offset is None:
+            raise VtfError("VTF file has no image data.")
+    else:
+        # The high resolution mips follow the header and the DXT1 thumbnail
+        data_offset = header_size
+        if low_res_format != -1 and low_res_width and low_res_height:
+            data_offset += level_bytes(DXT1, low_res_width, low_res_height)
+
+    return {
+        'width': width, 'height': height, 'depth': max(1, depth), 'format': image_format,
+        'mip_count': max(1, mip_count), 'frames': max(1, frames), 'faces': faces, 'data_offset': data_offset,
+    }
+
+
+def top_level_offset(header):
+    """File offset of the first face of the first frame of the top mip. Mips are stored smallest first,
+    each with every frame and face, so the top one follows all the others."""
+    offset = header['data_offset']
+    for level in range(header['mip_count'] - 1, 0, -1):
+        level_size = level_bytes(header['format'], max(1, header['width'] >> level), max(1, header['height'] >> level), max(1, header['depth'] >> level))
+        offset += level_size * header['frames'] * header['faces']
+    return offset
+
+
+def palette_lookup(palettes, indices):
+    """palettes[block, indices[block, pixel]] as one flat gather, which is much faster than fancy indexing."""
+    flat_indices = indices.astype(np.intp) + np.arange(0, palettes.size, palettes.shape[1])[:, None]
+    return np.take(palettes.ravel(), flat_indices)
+
+
+def bc1_colors(blocks, always_four_colors=False):
+    """(blocks, 8) uint8 DXT1 colour blocks -> (blocks, 16, 4) uint8 RGBA pixels, decoded like Pillow does.
+
+    A block whose first endpoint is not above the second has three colours and transparent black;
+    the colour blocks of DXT3 and DXT5 always have four colours.
+    """
+    color0 = blocks[:, 0].astype(np.uint16) | blocks[:, 1].astype(np.uint16) << 8
+    color1 = blocks[:, 2].astype(np.uint16) | blocks[:, 3].astype(np.uint16) << 8
+    endpoint0, endpoint1 = unpack_565(color0).astype(np.uint16), unpack_565(color1).astype(np.uint16)
+
+    palette = np.empty((len(blocks), 4, 4), dtype=np.uint8)
+    palette[:, :, 3] = 255
+    palette[:, 0, :3] = endpoint0
+    palette[:, 1, :3] = endpoint1
+    four_colors = (always_four_colors | (color0 > color1))[:, None]
+    palette[:, 2, :3] = np.where(four_colors, (2 * endpoint0 + endpoint1) // 3, (endpoint0 + endpoint1) // 2)
+    palette[:, 3, :3] = np.where(four_colors, (endpoint0 + 2 * endpoint1) // 3, 0)
+    palette[:, 3, 3] = np.where(four_colors[:, 0], 255, 0)
+
+    bits = blocks[:, 4:8].copy().view('<u4')
+    indices = (bits >> _BC1_SHIFTS) & 3
+    return palette_lookup(palette.view(np.uint32)[:, :, 0], indices).view(np.uint8).reshape(-1, 16, 4)
+
+
+def dxt5_alpha(blocks):
+    """(blocks, 8) uint8 DXT5 alpha blocks -> (blocks, 16) uint8 alpha."""
+    alpha0, alpha1 = blocks[:, 0].astype(np.uint16)[:, None], blocks[:, 1].astype(np.uint16)[:, None]
+    # Six interpolated values when alpha0 > alpha1, otherwise four followed by 0 and 255
+    steps = np.arange(1, 7, dtype=np.uint16)
+    eight_values = ((7 - steps) * alpha0 + steps * alpha1) // 7
+    steps = steps[:4]
+    six_values = np.concatenate([((5 - steps) * alpha0 + steps * alpha1) // 5, np.tile([0, 255], (len(blocks), 1))], axis=1)
+    palette = np.empty((len(blocks), 8), dtype=np.uint16)
+    palette[:, 0:1], palette[:, 1:2] = alpha0, alpha1
+    palette[:, 2:] = np.where(alpha0 > alpha1, eight_values, six_values)
+
+    bits = np.zeros((len(blocks), 8), dtype=np.uint8)
+    bits[:, :6] = blocks[:, 2:8]
+    indices = (bits.view('<u8') >> _DXT5_SHIFTS) & 7
+    return palette_lookup(palette.astype(np.uint8), indices)
+
+
+def decode_blocks(blocks, image_format):
+    """(blocks, block bytes) uint8 -> (blocks, 16, 4) uint8 RGBA pixels."""
+    if image_format in (DXT1, DXT1_ONEBITALPHA):
+        return bc1_colors(blocks)
+    pixels = bc1_colors(blocks[:, 8:], always_four_colors=True)
+    if image_format == DXT3:
+        alpha = (blocks[:, :8].copy().view('<u8') >> _DXT3_SHIFTS) & 15
+        pixels[:, :, 3] = alpha * 17
+    else:
+        pixels[:, :, 3] = dxt5_alpha(blocks[:, :8])
+    return pixels
+
+
+def decode_level(data, image_format, width, height):
+    """Decodes one mip level's bytes into a (height, width, channels) uint8 array and its PIL mode."""
+    if image_format in PIXEL_FORMATS:
+        pixel_bytes, channels, mode = PIXEL_FORMATS[image_format]
+        pixels = np.frombuffer(data, dtype=np.uint8, count=width * height * pixel_bytes).reshape(height, width, pixel_bytes)
+        return pixels[:, :, channels], mode
+
+    block_rows, block_columns = max(1, -(-height // 4)), max(1, -(-width // 4))
+    blocks = np.frombuffer(data, dtype=np.uint8, count=level_bytes(image_format, width, height)).reshape(block_rows, block_columns, -1)
+    pixels = np.empty((block_rows * 4, block_columns * 4, 4), dtype=np.uint8)
+    # Whole block rows per pass, so the palette and index intermediates stay small
+    rows_per_chunk = max(1, BLOCKS_PER_CHUNK // block_columns)
+    for row in range(0, block_rows, rows_per_chunk):
+        chunk = blocks[row:row + rows_per_chunk]
+        decoded = decode_blocks(chunk.reshape(-1, chunk.shape[2]), image_format)
+        decoded = decoded.reshape(len(chunk), block_columns, 4, 4, 4).transpose(0, 2, 1, 3, 4)
+        pixels[row * 4:(row + len(chunk)) * 4] = decoded.reshape(len(chunk) * 4, block_columns * 4, 4)
+    pixels = pixels[:height, :width]
+    if image_format == DXT1:
+        return pixels[:, :, :3], 'RGB'
+    return pixels, 'RGBA'
+
+
+def read_vtf(file):
+    """Decodes the top mip level of the first frame and face of a VTF file, given as a path or a binary
+    file object, into a PIL image. Only that level is read from the file."""
+    from PIL import Image
+    if isinstance(file, str):
+        with open(file, 'rb') as opened_file:
+            return read_vtf(opened_file)
+    header = read_header(file)
+    width, height = header['width'], header['height']
+    size = level_bytes(header['format'], width, height)
+    file.seek(top_level_offset(header))
+    data = file.read(size)
+    if len(data) < size:
+        raise VtfError("VTF file is truncated.")
+    pixels, mode = decode_level(data, header['format'], width, height)
+    return Image.fromarray(np.ascontiguousarray(pixels.squeeze(axis=2) if mode == 'L' else pixels))